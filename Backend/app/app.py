@@ -1,14 +1,48 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database.db_setup import Base, engine
-from app.database import models
-from app.routers import auth, eft, nudges, events
+from fastapi.responses import PlainTextResponse
+from app.config import METRICS_ENABLED, NUDGE_WORKERS
+from app.database.db_setup import CheckpointScheduler, async_engine, engine
+from app.database.migrations import ensure_schema
+from app.logging_config import AccessLogMiddleware, DroppingQueueHandler, configure_logging, shutdown_logging
+from app.routers import auth, eft, nudges, events, research
 from app.routers import events
+from app.services import event_buffer, llm_guard, llm_limits, metrics, passwords
+from app.services.cache import cache
+from app.services.llm_cache import llm_cache
+from app.services.nudge_jobs import NudgeWorkerPool
 
-# Ensure tables exist in dev
-Base.metadata.create_all(bind=engine)
+# Every app.* record goes through the log queue (no blocking stdout writes)
+configure_logging()
 
-app = FastAPI(title="NeuroNudge Research Backend")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()  # no-op unless a previous shutdown stopped it
+    # One SELECT when the schema is current; migrates or refuses otherwise
+    ensure_schema(engine)
+    # Background nudge generation workers
+    workers = NudgeWorkerPool(size=NUDGE_WORKERS)
+    workers.start()
+    # Write-behind event buffer (no-op unless EVENT_BUFFER_ENABLED)
+    event_buffer.start()
+    # Periodic WAL checkpoints (SQLite production profile only)
+    checkpointer = CheckpointScheduler()
+    checkpointer.start()
+    # bcrypt worker processes for /auth
+    passwords.start()
+    yield
+    event_buffer.stop()  # drains every queued event before exit
+    workers.stop()
+    checkpointer.stop()
+    passwords.shutdown()
+    if async_engine is not None:
+        await async_engine.dispose()
+    shutdown_logging()  # flush queued log records
+
+
+app = FastAPI(title="NeuroNudge Research Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,12 +51,42 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(AccessLogMiddleware)
 
 app.include_router(auth.router)    # /auth
 app.include_router(eft.router)     # /eft
 app.include_router(nudges.router)  # /nudges
 app.include_router(events.router)  # /events
+app.include_router(research.router)  # /research
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "Backend running ✅"}
+
+
+# ─────────────────────────────
+# METRICS (Prometheus text format)
+# ─────────────────────────────
+metrics.gauge("llm_cache_events", "LLM response cache counters.", ("event",),
+              lambda: {k: v for k, v in llm_cache.stats().items() if k != "hit_ratio"})
+metrics.gauge("cache_events", "Shared cache counters (this worker).", ("event",),
+              lambda: {k: v for k, v in cache.stats().items() if k != "hit_ratio"})
+metrics.gauge("event_buffer_events", "Write-behind event buffer counters.", ("event",),
+              lambda: event_buffer.get_buffer().stats() if event_buffer.get_buffer() else {})
+metrics.gauge("event_buffer_depth", "Records waiting in the write-behind buffer.", (),
+              lambda: {(): event_buffer.get_buffer().depth()} if event_buffer.get_buffer() else {})
+metrics.gauge("llm_breaker_state", "LLM circuit breaker: 0 closed, 1 half-open, 2 open.", (),
+              lambda: {(): ("closed", "half_open", "open").index(llm_guard.breaker.state)})
+metrics.gauge("llm_in_flight", "LLM requests holding a concurrency slot.", (),
+              lambda: {(): llm_limits.limiter.in_flight()})
+metrics.gauge("password_jobs_pending", "bcrypt jobs queued or running in the password pool.", (),
+              lambda: {(): passwords.pending()})
+metrics.gauge("log_records_dropped", "Log records dropped because the log queue was full.", (),
+              lambda: {(): DroppingQueueHandler.dropped})
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
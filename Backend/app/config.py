@@ -10,10 +10,6 @@ from datetime import timedelta
 
 # Locate the Backend folder (parent of /app)
 BASE_DIR = Path(__file__).resolve().parent
-ENV_PATH = BASE_DIR / ".env"
-DB_PATH = BASE_DIR / "database" / "app.db"
-DATABASE_URL = f"sqlite:///{DB_PATH}"
-
 ENV_PATH = BASE_DIR / ".env"
 
 # Load environment variables from .env in /Backend
@@ -26,8 +22,45 @@ load_dotenv(ENV_PATH)
 # Database URL (SQLite by default)
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app/database/app.db")
 
+# Boot checks the schema_version row instead of running create_all. When it is
+# behind, True migrates in place (dev); False refuses to start until
+# `python -m app.database.migrations` has been run (deploy step).
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "True").lower() == "true"
+
+# ─────────────────────────────
+# SQLITE STORAGE PROFILE
+# ─────────────────────────────
+
+# "production" applies the pragmas below on every new connection;
+# "legacy" leaves SQLite defaults (rollback journal, synchronous=FULL)
+SQLITE_STORAGE_PROFILE = os.getenv("SQLITE_STORAGE_PROFILE", "production")
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # safe with WAL; FULL for strict durability
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 64 * 1024))
+
+# Background PRAGMA wal_checkpoint every N seconds (0 = rely on auto-checkpoint)
+SQLITE_CHECKPOINT_SECONDS = float(os.getenv("SQLITE_CHECKPOINT_SECONDS", 60))
+SQLITE_CHECKPOINT_MODE = os.getenv("SQLITE_CHECKPOINT_MODE", "PASSIVE")
+
+# Connection pool (file-backed SQLite and server databases)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", 30))
+
+# Separate read-only engine for read-only GET routes (get_read_db)
+DB_READ_ENGINE_ENABLED = os.getenv("DB_READ_ENGINE_ENABLED", "False").lower() == "true"
+
+# Routers use an AsyncSession (aiosqlite / asyncpg) when True; False keeps the
+# sync engine, with each DB call run in the threadpool
+DB_ASYNC_ENABLED = os.getenv("DB_ASYNC_ENABLED", "True").lower() == "true"
+# Defaults to DATABASE_URL with its async driver (sqlite+aiosqlite, postgresql+asyncpg)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+
 # OpenAI API key
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
 # JWT / Auth settings
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
@@ -38,6 +71,169 @@ JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 120))
 ACCESS_TOKEN_EXPIRE_DELTA = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
+# Verified token → user identity cache (skips JWT decode + user lookup)
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", 300))
+
+# Password hashing: bcrypt cost (log2 rounds). Stored hashes with another cost
+# are rehashed on the user's next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Hashing/verification runs in a dedicated process pool so a login storm
+# cannot starve the event loop or the request threads
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", 2))
+# Hash jobs queued or running before /auth answers 503 instead of queueing more
+PASSWORD_POOL_MAX_PENDING = int(os.getenv("PASSWORD_POOL_MAX_PENDING", 64))
+
+# ─────────────────────────────
+# LLM CLIENT
+# ─────────────────────────────
+
+# "openai" for the real API, "fake" for the offline stand-in in services/fake_llm.py
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+LLM_FAKE_LATENCY_SECONDS = float(os.getenv("LLM_FAKE_LATENCY_SECONDS", 0))
+
+# Per-call timeouts (seconds) and the shared httpx connection pool
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 20))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", 5))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 50))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 20))
+
+# Resilience (services/llm_guard.py): overall deadline per generation including
+# retries, retries with exponential backoff, an optional hedged duplicate request
+# after LLM_HEDGE_AFTER_SECONDS (0 = off), and a circuit breaker that opens after
+# LLM_BREAKER_FAILURES consecutive failures for LLM_BREAKER_RESET_SECONDS
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", 25))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", 0.5))
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", 0))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", 30))
+
+# Outstanding LLM requests allowed per process, and per user within that;
+# callers over the limit wait (bounded by the generation deadline)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+LLM_MAX_CONCURRENCY_PER_USER = int(os.getenv("LLM_MAX_CONCURRENCY_PER_USER", 2))
+
+# "queue" hands generation to the background job workers (never waits on the LLM);
+# "deck" asks for the full 8–10 nudge JSON deck inline in one completion;
+# "single" runs NUDGES_PER_SUBMIT one-nudge completions concurrently inline
+NUDGE_GENERATION_MODE = os.getenv("NUDGE_GENERATION_MODE", "queue")
+NUDGE_DECK_MAX_TOKENS = int(os.getenv("NUDGE_DECK_MAX_TOKENS", 1500))
+NUDGES_PER_SUBMIT = int(os.getenv("NUDGES_PER_SUBMIT", 2))
+
+# Prompt token budgets (services/prompt_compiler.py): each EFT answer is cut to
+# PROMPT_FIELD_TOKEN_BUDGET, and the whole per-user block to PROMPT_USER_TOKEN_BUDGET
+PROMPT_FIELD_TOKEN_BUDGET = int(os.getenv("PROMPT_FIELD_TOKEN_BUDGET", 160))
+PROMPT_USER_TOKEN_BUDGET = int(os.getenv("PROMPT_USER_TOKEN_BUDGET", 700))
+
+# ─────────────────────────────
+# SHARED CACHE
+# ─────────────────────────────
+
+# "memory" (per process), "sqlite" (one file shared by every worker on the
+# host) or "redis" (shared across hosts)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+CACHE_PATH = os.getenv("CACHE_PATH", str(BASE_DIR / "database" / "cache.db"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "nn:")
+# Entry cap for the memory and sqlite backends (Redis uses its maxmemory policy)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 50000))
+# Redis connect/read timeout; a slow cache counts as a miss
+CACHE_TIMEOUT_SECONDS = float(os.getenv("CACHE_TIMEOUT_SECONDS", 0.5))
+# Stampede protection: how long one loader may hold a key before others give up waiting
+CACHE_LOCK_SECONDS = float(os.getenv("CACHE_LOCK_SECONDS", 10))
+# How long a worker reuses a namespace version before re-reading it (0 = every
+# lookup): other workers see an invalidation within this delay
+CACHE_VERSION_TTL_SECONDS = float(os.getenv("CACHE_VERSION_TTL_SECONDS", 1.0))
+
+# ─────────────────────────────
+# LLM RESPONSE CACHE
+# ─────────────────────────────
+
+# Per-process LRU in front of the shared cache (namespace "llm")
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "True").lower() == "true"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", 512))
+
+# ─────────────────────────────
+# NUDGE JOB QUEUE
+# ─────────────────────────────
+
+# In-process worker threads started with the app (0 = run workers separately
+# with `python -m app.services.nudge_jobs`)
+NUDGE_WORKERS = int(os.getenv("NUDGE_WORKERS", 2))
+NUDGE_WORKER_POLL_SECONDS = float(os.getenv("NUDGE_WORKER_POLL_SECONDS", 1.0))
+NUDGE_JOB_LEASE_SECONDS = int(os.getenv("NUDGE_JOB_LEASE_SECONDS", 120))
+NUDGE_JOB_MAX_ATTEMPTS = int(os.getenv("NUDGE_JOB_MAX_ATTEMPTS", 3))
+NUDGE_JOB_RETRY_BASE_SECONDS = float(os.getenv("NUDGE_JOB_RETRY_BASE_SECONDS", 5))
+
+# Refill a user's deck when fewer than this many nudges are still unshown
+NUDGE_LOW_WATERMARK = int(os.getenv("NUDGE_LOW_WATERMARK", 3))
+
+# How /nudges/next picks: "rotation" walks the deck in id order; "thompson"
+# samples each nudge's refocus rate from its counters and serves the best draw
+NUDGE_SELECTION_MODE = os.getenv("NUDGE_SELECTION_MODE", "rotation")
+
+# ─────────────────────────────
+# EVENT INGESTION
+# ─────────────────────────────
+
+# Max events accepted by one /events/batch call
+EVENT_BATCH_MAX_SIZE = int(os.getenv("EVENT_BATCH_MAX_SIZE", 500))
+# Oldest client timestamp /events/batch accepts (older events are dropped);
+# timestamps ahead of server time are clamped to it
+EVENT_MAX_AGE_SECONDS = int(os.getenv("EVENT_MAX_AGE_SECONDS", 7 * 24 * 3600))
+
+# Keep per-user attention state (last focus / last nudge) in memory on top of
+# the attention_state table. Off by default: the copy is per process, so with
+# several workers it goes stale. Only enable for a single-worker deployment.
+ATTENTION_STATE_MEMORY = os.getenv("ATTENTION_STATE_MEMORY", "False").lower() == "true"
+
+# Write-behind buffer for event endpoints (see services/event_buffer.py for
+# the durability trade-off before enabling)
+EVENT_BUFFER_ENABLED = os.getenv("EVENT_BUFFER_ENABLED", "False").lower() == "true"
+EVENT_BUFFER_MAX_SIZE = int(os.getenv("EVENT_BUFFER_MAX_SIZE", 10000))
+EVENT_BUFFER_FLUSH_SIZE = int(os.getenv("EVENT_BUFFER_FLUSH_SIZE", 200))
+EVENT_BUFFER_FLUSH_INTERVAL_SECONDS = float(os.getenv("EVENT_BUFFER_FLUSH_INTERVAL_SECONDS", 0.5))
+EVENT_BUFFER_PUT_TIMEOUT_SECONDS = float(os.getenv("EVENT_BUFFER_PUT_TIMEOUT_SECONDS", 0.05))
+# Failed flushes a record survives before it is dropped and logged
+EVENT_BUFFER_MAX_ATTEMPTS = int(os.getenv("EVENT_BUFFER_MAX_ATTEMPTS", 5))
+
+# ─────────────────────────────
+# LOGGING
+# ─────────────────────────────
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" | "text"
+# Records wait here for the writer thread; when full, new records are dropped
+# (and counted) instead of blocking the request
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Keep only this fraction of INFO/DEBUG records per event type, e.g.
+# "idle_detected=0.1,focus_resumed=0.5" (warnings and errors are never sampled)
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "idle_detected=0.1")
+# One record per HTTP request (route, status, latency)
+LOG_ACCESS = os.getenv("LOG_ACCESS", "True").lower() == "true"
+
+# ─────────────────────────────
+# METRICS
+# ─────────────────────────────
+
+# Per-route latency / DB / LLM metrics, exposed on GET /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+# Add a Server-Timing header (db / llm / bcrypt / total) to every response
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "False").lower() == "true"
+
+# ─────────────────────────────
+# RETENTION (hot / archive tiering of event tables)
+# ─────────────────────────────
+
+# event_log / user_activity rows older than this move to monthly archives
+RETENTION_HOT_DAYS = int(os.getenv("RETENTION_HOT_DAYS", 90))
+# "file" = one SQLite file per month under RETENTION_ARCHIVE_DIR,
+# "table" = monthly tables (<table>_YYYY_MM) in the main database
+RETENTION_ARCHIVE_MODE = os.getenv("RETENTION_ARCHIVE_MODE", "file")
+RETENTION_ARCHIVE_DIR = Path(os.getenv("RETENTION_ARCHIVE_DIR", BASE_DIR / "database" / "archive"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 5000))
+
 # ─────────────────────────────
 # OTHER OPTIONAL SETTINGS
 # ─────────────────────────────
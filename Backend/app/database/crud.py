@@ -0,0 +1,154 @@
+from __future__ import annotations
+import hashlib
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from app.config import OPENAI_MODEL
+from app.database import models
+from app.services import nudge_rotation, prompt_store
+from app.services.prompt_compiler import RenderedPrompt
+
+
+# ─────────────────────────────
+# NUDGES
+# ─────────────────────────────
+def save_nudge_deck(
+    db: Session,
+    user_id: int,
+    rendered: RenderedPrompt,
+    raw_response: str,
+    nudges: list[dict],
+    model_name: str = OPENAI_MODEL,
+) -> list[dict]:
+    """
+    Store the prompt once and bulk-insert one Nudge row per parsed message,
+    all linked to that prompt. Messages the user already has (e.g. a cached
+    deck for a resubmitted EFT) are skipped. Commits and returns the nudges
+    that were saved.
+    """
+    if nudges:
+        existing = {
+            text for (text,) in db.query(models.Nudge.text).filter(
+                models.Nudge.user_id == user_id,
+                models.Nudge.text.in_([n["message"] for n in nudges]),
+            )
+        }
+        nudges = [n for n in nudges if n["message"] not in existing]
+
+    prompt = prompt_store.record_prompt(
+        db,
+        user_id=user_id,
+        variable_text=rendered.user,
+        response_text=raw_response,
+        template_text=rendered.template.system,
+        version=rendered.template.version,
+        model_name=model_name,
+        metadata={"mode": "deck", "count": len(nudges), **rendered.metadata()},
+    )
+
+    if nudges:
+        db.execute(
+            insert(models.Nudge),
+            [
+                {
+                    "user_id": user_id,
+                    "type": n["type"],
+                    "source": "ai",
+                    "text": n["message"],
+                    "related_prompt_id": prompt.id,
+                }
+                for n in nudges
+            ],
+        )
+        nudge_rotation.bump_deck_version(db, user_id)
+    db.commit()
+    return nudges
+
+
+def recent_nudge_texts(db: Session, user_id: int, limit: int = 8) -> list[str]:
+    """The user's newest stored nudges (served when generation is unavailable)."""
+    rows = (
+        db.query(models.Nudge.text)
+        .filter(models.Nudge.user_id == user_id)
+        .order_by(models.Nudge.id.desc())
+        .limit(limit)
+    )
+    return [text for (text,) in rows]
+
+
+def start_streamed_deck(db: Session, user_id: int, rendered: RenderedPrompt, model_name: str = OPENAI_MODEL) -> int:
+    """Store the prompt before the reply arrives so streamed nudges can link to it. Commits."""
+    prompt = prompt_store.record_prompt(
+        db,
+        user_id=user_id,
+        variable_text=rendered.user,
+        response_text=None,
+        template_text=rendered.template.system,
+        version=rendered.template.version,
+        model_name=model_name,
+        metadata={"mode": "deck_stream", **rendered.metadata()},
+    )
+    db.commit()
+    return prompt.id
+
+
+def save_streamed_nudge(db: Session, user_id: int, prompt_id: int, nudge: dict) -> int | None:
+    """Store one nudge as soon as it is complete. Commits; None if the user already has it."""
+    exists = db.query(models.Nudge.id).filter(
+        models.Nudge.user_id == user_id, models.Nudge.text == nudge["message"]
+    ).first()
+    if exists:
+        return None
+    row = models.Nudge(
+        user_id=user_id,
+        type=nudge["type"],
+        source="ai",
+        text=nudge["message"],
+        related_prompt_id=prompt_id,
+    )
+    db.add(row)
+    db.flush()
+    nudge_rotation.bump_deck_version(db, user_id)
+    db.commit()
+    return row.id
+
+
+def finish_streamed_deck(db: Session, prompt_id: int, raw_response: str, count: int):
+    """Attach the full reply to the prompt row. Commits."""
+    prompt = db.get(models.AIPrompt, prompt_id)
+    if prompt is None:
+        return
+    prompt.response_preview = raw_response
+    prompt.metadata_json = {**(prompt.metadata_json or {}), "count": count}
+    db.commit()
+
+
+# ─────────────────────────────
+# EFT
+# ─────────────────────────────
+EFT_FIELDS = (
+    "q1_why_goal_matters",
+    "q2_when_reach_goal",
+    "q3_possible_obstacles",
+    "q4_future_visualization",
+    "q5_if_give_up",
+    "q6_notes",
+)
+
+
+def latest_eft(db: Session, user_id: int) -> models.EFTResponse | None:
+    return (
+        db.query(models.EFTResponse)
+        .filter(models.EFTResponse.user_id == user_id)
+        .order_by(models.EFTResponse.created_at.desc())
+        .first()
+    )
+
+
+def eft_to_dict(eft: models.EFTResponse) -> dict:
+    return {name: getattr(eft, name) for name in EFT_FIELDS}
+
+
+def eft_digest(data: dict) -> str:
+    """Content key of an EFT submission: identical answers give the same digest."""
+    answers = "\x1f".join(" ".join(str(data.get(name) or "").split()) for name in EFT_FIELDS)
+    return hashlib.sha256(answers.encode("utf-8")).hexdigest()
@@ -1,23 +1,105 @@
 from __future__ import annotations
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import logging
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, Callable
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.engine import Engine
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 from app.database.base_class import Base
 
-from app.config import DATABASE_URL
+from app.config import (
+    ASYNC_DATABASE_URL,
+    DATABASE_URL,
+    DB_ASYNC_ENABLED,
+    DB_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT_SECONDS,
+    DB_READ_ENGINE_ENABLED,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_CACHE_SIZE_KB,
+    SQLITE_CHECKPOINT_MODE,
+    SQLITE_CHECKPOINT_SECONDS,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_MMAP_SIZE,
+    SQLITE_STORAGE_PROFILE,
+    SQLITE_SYNCHRONOUS,
+)
 
-if DATABASE_URL.startswith("sqlite"):
+logger = logging.getLogger(__name__)
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+IS_MEMORY = IS_SQLITE and (DATABASE_URL.endswith(":memory:") or DATABASE_URL in ("sqlite://", "sqlite:///"))
+
+
+# ─────────────────────────────
+# SQLITE STORAGE PROFILE
+# ─────────────────────────────
+def apply_sqlite_profile(dbapi_conn, read_only: bool = False):
+    """
+    Pragmas for every new connection. WAL lets readers run alongside the
+    single writer; busy_timeout makes writers queue instead of failing with
+    "database is locked"; mmap/cache keep hot pages in memory.
+    """
+    cursor = dbapi_conn.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        if not read_only and not IS_MEMORY:
+            cursor.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+    finally:
+        cursor.close()
+
+
+def _sqlite_engine(url: str, read_only: bool = False) -> Engine:
+    kwargs = {"connect_args": {"check_same_thread": False}}
+    if IS_MEMORY:
+        kwargs["poolclass"] = StaticPool
+    else:
+        kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT_SECONDS)
+        if read_only:
+            kwargs["connect_args"]["uri"] = True
+    eng = create_engine(url, **kwargs)
+
+    if SQLITE_STORAGE_PROFILE == "production":
+        event.listen(eng, "connect", lambda conn, _: apply_sqlite_profile(conn, read_only))
+    return eng
+
+
+def _read_only_url(url: str) -> str:
+    # sqlite:///path/to/app.db → sqlite:///file:path/to/app.db?mode=ro&uri=true
+    path = url.split("sqlite:///", 1)[1]
+    return f"sqlite:///file:{path}?mode=ro&uri=true"
+
+
+if IS_SQLITE:
+    engine: Engine = _sqlite_engine(DATABASE_URL)
+else:
     engine: Engine = create_engine(
         DATABASE_URL,
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool if DATABASE_URL.endswith(":memory:") else None,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+        pool_pre_ping=True,
     )
-else:
-    engine: Engine = create_engine(DATABASE_URL)
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
+# Read-only engine for GET routes that never write; falls back to the main one
+if DB_READ_ENGINE_ENABLED and IS_SQLITE and not IS_MEMORY:
+    read_engine: Engine = _sqlite_engine(_read_only_url(DATABASE_URL), read_only=True)
+else:
+    read_engine = engine
+
+ReadSessionLocal = sessionmaker(bind=read_engine, autoflush=False, autocommit=False, future=True)
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -25,8 +107,184 @@ def get_db():
     finally:
         db.close()
 
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# ─────────────────────────────
+# ASYNC SESSIONS (routers)
+# ─────────────────────────────
+# Routers take `db: AsyncSession = Depends(get_async_db)` and await every
+# database call, so a request waiting on the database holds no threadpool
+# slot. Shared sync service code (log_events, save_nudge_deck, ...) runs
+# through `await db.run_sync(fn, ...)`. Background threads (nudge workers,
+# event buffer, checkpointer) keep using SessionLocal.
+#
+# DB_ASYNC_ENABLED=False — or an in-memory SQLite URL, which a second engine
+# could not share — swaps in ThreadedSession: the same awaitable surface over
+# a sync Session, one threadpool hop per call (the previous behaviour).
+def _async_url(url: str) -> str:
+    if ASYNC_DATABASE_URL:
+        return ASYNC_DATABASE_URL
+    for sync_prefix, async_prefix in (
+        ("sqlite://", "sqlite+aiosqlite://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+        ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+    ):
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+
+def _create_async_engine() -> AsyncEngine:
+    url = _async_url(DATABASE_URL)
+    if url.startswith("sqlite"):
+        # aiosqlite defaults to NullPool (a new connection + PRAGMAs per checkout)
+        eng = create_async_engine(
+            url,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+        )
+        if SQLITE_STORAGE_PROFILE == "production":
+            event.listen(eng.sync_engine, "connect", lambda conn, _: apply_sqlite_profile(conn))
+        return eng
+    return create_async_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+        pool_pre_ping=True,
+    )
+
+
+USE_ASYNC_DB = DB_ASYNC_ENABLED and not IS_MEMORY
+
+if USE_ASYNC_DB:
+    async_engine: AsyncEngine | None = _create_async_engine()
+    # expire_on_commit=False: attributes stay readable after commit without
+    # an implicit (un-awaitable) reload
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+else:
+    async_engine = None
+    AsyncSessionLocal = None
+
+
+class ThreadedSession:
+    """
+    The subset of the AsyncSession API the routers use, backed by a sync
+    Session whose calls run in the threadpool.
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    @property
+    def info(self) -> dict:
+        return self.sync_session.info
+
+    def add(self, obj):
+        self.sync_session.add(obj)
+
+    async def run_sync(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def execute(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.execute, statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, *args, **kwargs)
+
+    async def scalars(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalars, statement, *args, **kwargs)
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def refresh(self, obj):
+        await run_in_threadpool(self.sync_session.refresh, obj)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+
+async def get_async_db():
+    if USE_ASYNC_DB:
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+    db = ThreadedSession(SessionLocal(expire_on_commit=False))
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+# For work that outlives the request's dependencies (streaming response bodies)
+async_session = asynccontextmanager(get_async_db)
+
+
+# ─────────────────────────────
+# WAL CHECKPOINT SCHEDULER
+# ─────────────────────────────
+class CheckpointScheduler:
+    """
+    Runs PRAGMA wal_checkpoint periodically so the -wal file is folded back
+    into the database between bursts instead of growing under steady load.
+    """
+
+    def __init__(self, interval: float = SQLITE_CHECKPOINT_SECONDS, mode: str = SQLITE_CHECKPOINT_MODE):
+        self.interval = interval
+        self.mode = mode
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def enabled(self) -> bool:
+        return (
+            IS_SQLITE and not IS_MEMORY and self.interval > 0
+            and SQLITE_STORAGE_PROFILE == "production" and SQLITE_JOURNAL_MODE.upper() == "WAL"
+        )
+
+    def start(self):
+        if not self.enabled():
+            return
+        self._thread = threading.Thread(target=self._run, name="sqlite-checkpoint", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def checkpoint(self) -> tuple:
+        """Returns (busy, wal_pages, checkpointed_pages)."""
+        with engine.connect() as conn:
+            return tuple(conn.execute(text(f"PRAGMA wal_checkpoint({self.mode})")).one())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.checkpoint()
+            except Exception as e:
+                logger.warning("⚠️ WAL checkpoint failed: %s", e)
+
+
 if __name__ == "__main__":
-    from app.database import models
-    print("Creating database tables...")
-    Base.metadata.create_all(bind=engine)
-    print("✅ All tables created successfully!")
+    from app.database.migrations import migrate
+    from app.logging_config import configure_logging
+    configure_logging(fmt="text")
+    logger.info("Creating database tables...")
+    migrate(engine)
+    logger.info("✅ All tables created successfully!")
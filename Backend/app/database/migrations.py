@@ -0,0 +1,154 @@
+from __future__ import annotations
+import logging
+from sqlalchemy import LargeBinary, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+
+from app.config import DB_AUTO_MIGRATE
+
+# ─────────────────────────────
+# LIGHTWEIGHT IN-PLACE MIGRATIONS
+# ─────────────────────────────
+# create_all() only creates missing tables. Columns and indexes added to
+# existing tables are listed here and applied idempotently.
+#
+# migrate() does all of it and records SCHEMA_VERSION in the one-row
+# schema_version table. Booting only reads that row (ensure_schema), so a
+# worker with an up-to-date database starts without reflecting or creating
+# anything. Run explicitly with:
+#
+#     python -m app.database.migrations
+
+logger = logging.getLogger(__name__)
+
+# Bump with every change to the models or to the lists below
+SCHEMA_VERSION = 4
+
+# (table, column, DDL type)
+ADDED_COLUMNS = [
+    ("nudges", "shown_at", "DATETIME"),
+    ("ai_prompts", "template_hash", "VARCHAR(64) REFERENCES prompt_templates(hash)"),
+    ("ai_prompts", "template_version", "VARCHAR(64)"),
+    ("nudges", "shown_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("nudges", "refocus_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("nudges", "refocus_latency_sum", "FLOAT NOT NULL DEFAULT 0"),
+]
+
+# (table, column) now CompressedText, created as TEXT by older builds. SQLite
+# stores bytes in a TEXT column as is; other dialects convert the column to
+# BYTEA, keeping each old value as its utf-8 bytes (read back as legacy text
+# until migrate_legacy_prompts rewrites it compressed)
+COMPRESSED_COLUMNS = [
+    ("ai_prompts", "prompt_text"),
+    ("ai_prompts", "response_preview"),
+]
+
+# (index name, table, columns)
+ADDED_INDEXES = [
+    ("ix_nudge_user_shown", "nudges", "user_id, shown_at"),
+    ("ix_activity_user_type_created", "user_activity", "user_id, activity_type, created_at"),
+    ("ix_nudge_user_id", "nudges", "user_id, id"),
+    ("ix_event_user_type_time", "event_log", "user_id, event_type, timestamp"),
+]
+
+
+def run_migrations(engine: Engine) -> None:
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    added = set()
+
+    with engine.begin() as conn:
+        for table, column, ddl_type in ADDED_COLUMNS:
+            if table not in tables:
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            if column not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+                added.add((table, column))
+                logger.info("🛠️  Added column %s.%s", table, column)
+
+        for name, table, columns in ADDED_INDEXES:
+            if table in tables:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+        if engine.dialect.name != "sqlite":
+            for table, column in COMPRESSED_COLUMNS:
+                if table not in tables:
+                    continue
+                current = {c["name"]: c["type"] for c in inspector.get_columns(table)}
+                if column in current and not isinstance(current[column], LargeBinary):
+                    conn.execute(text(
+                        f"ALTER TABLE {table} ALTER COLUMN {column} TYPE BYTEA "
+                        f"USING convert_to({column}, 'UTF8')"
+                    ))
+                    logger.info("🛠️  Converted column %s.%s to BYTEA", table, column)
+
+    # Data migrations (idempotent, cheap once done)
+    from sqlalchemy.orm import Session
+    from app.services.prompt_store import migrate_legacy_prompts
+
+    with Session(engine) as db:
+        migrated = migrate_legacy_prompts(db)
+    if migrated:
+        logger.info("🛠️  Migrated %d legacy ai_prompts rows to template storage", migrated)
+
+    if ("nudges", "shown_count") in added:
+        # Counters of nudges served before the effectiveness index existed
+        from app.services.nudge_effects import rebuild
+
+        with Session(engine) as db:
+            users = [uid for (uid,) in db.execute(text("SELECT DISTINCT user_id FROM nudges"))]
+            replayed = sum(rebuild(db, uid) for uid in users)
+        logger.info("🛠️  Rebuilt nudge effectiveness for %d users (%d events)", len(users), replayed)
+
+
+# ─────────────────────────────
+# SCHEMA VERSION
+# ─────────────────────────────
+def schema_version(engine: Engine) -> int:
+    """Version recorded by the last migrate(); 0 for a database that predates it."""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    except DBAPIError:  # no schema_version table yet
+        return 0
+
+
+def migrate(engine: Engine) -> int:
+    """Create missing tables, apply the in-place migrations, record SCHEMA_VERSION."""
+    from app.database import models  # noqa: F401  (registers every table on Base)
+    from app.database.base_class import Base
+
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+        conn.execute(text("DELETE FROM schema_version"))
+        conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": SCHEMA_VERSION})
+    return SCHEMA_VERSION
+
+
+def ensure_schema(engine: Engine, auto_migrate: bool = DB_AUTO_MIGRATE) -> None:
+    """Boot check: one SELECT when the schema is current."""
+    current = schema_version(engine)
+    if current == SCHEMA_VERSION:
+        return
+    if current > SCHEMA_VERSION:
+        # Migrations are additive, so older code still runs; a rollout in progress
+        logger.warning("⚠️ Database schema v%d is newer than this build (v%d)", current, SCHEMA_VERSION)
+        return
+    if not auto_migrate:
+        raise RuntimeError(
+            f"Database schema is v{current}, this build needs v{SCHEMA_VERSION}: "
+            "run `python -m app.database.migrations`"
+        )
+    logger.info("🛠️  Migrating database schema v%d → v%d", current, SCHEMA_VERSION)
+    migrate(engine)
+
+
+if __name__ == "__main__":
+    from app.database.db_setup import engine
+    from app.logging_config import configure_logging
+    configure_logging(fmt="text")
+    before = schema_version(engine)
+    logger.info("✅ Database schema v%d → v%d", before, migrate(engine))
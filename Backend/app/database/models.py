@@ -2,10 +2,11 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Optional, Literal
 from sqlalchemy import (
-    String, Integer, Float, DateTime, func, ForeignKey, Text, JSON, Enum, Index, Column
+    String, Integer, Float, DateTime, func, ForeignKey, Text, JSON, Enum, Index, Column, text
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .base_class import Base
+from .types import CompressedText
 # ─────────────────────────────
 # USER
 # ─────────────────────────────
@@ -65,13 +66,36 @@ class EFTResponse(Base):
         return f"<EFTResponse user_id={self.user_id}>"
 
 
+# ─────────────────────────────
+# PROMPT TEMPLATES (content-addressed, stored once)
+# ─────────────────────────────
+class PromptTemplate(Base):
+    """
+    The static part of a prompt (e.g. the EFT system prompt), keyed by the
+    sha256 of its text so each distinct template is stored exactly once.
+    """
+    __tablename__ = "prompt_templates"
+
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    version: Mapped[str] = mapped_column(String(64), nullable=False, index=True)
+    role: Mapped[str] = mapped_column(String(16), default="system")
+    text: Mapped[str] = mapped_column(CompressedText(), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<PromptTemplate {self.version} {self.hash[:12]}>"
+
+
 # ─────────────────────────────
 # AI PROMPTS (Prompt storage for reproducibility)
 # ─────────────────────────────
 class AIPrompt(Base):
     """
-    Stores the actual text prompts used to generate nudges for a user.
+    Stores the prompts used to generate nudges for a user.
     Keeping them allows analysis and reproducibility of AI behavior.
+    Only the per-call (user) part lives in prompt_text; the shared template
+    is referenced by template_hash. Use services.prompt_store.rebuild_prompt
+    to get the exact messages back.
     """
     __tablename__ = "ai_prompts"
     __table_args__ = (Index("ix_prompt_user_created", "user_id", "created_at"),)
@@ -79,13 +103,16 @@ class AIPrompt(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     model_name: Mapped[str] = mapped_column(String(100), default="gpt-4o-mini")
-    prompt_text: Mapped[str] = mapped_column(Text, nullable=False)
+    template_hash: Mapped[Optional[str]] = mapped_column(ForeignKey("prompt_templates.hash"), nullable=True)
+    template_version: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    prompt_text: Mapped[str] = mapped_column(CompressedText(), nullable=False)
     purpose: Mapped[str] = mapped_column(String(64), default="nudge_generation")  # or 'goal_summary', etc.
-    response_preview: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    response_preview: Mapped[Optional[str]] = mapped_column(CompressedText(), nullable=True)
     metadata_json: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     user: Mapped["User"] = relationship(back_populates="ai_prompts")
+    template: Mapped[Optional["PromptTemplate"]] = relationship()
 
     def __repr__(self):
         return f"<AIPrompt id={self.id} user_id={self.user_id} purpose={self.purpose}>"
@@ -99,7 +126,11 @@ NudgeSource = Literal["ai", "manual"]
 
 class Nudge(Base):
     __tablename__ = "nudges"
-    __table_args__ = (Index("ix_nudge_user_created", "user_id", "created_at"),)
+    __table_args__ = (
+        Index("ix_nudge_user_created", "user_id", "created_at"),
+        Index("ix_nudge_user_shown", "user_id", "shown_at"),
+        Index("ix_nudge_user_id", "user_id", "id"),  # rotation keyset
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -111,6 +142,13 @@ class Nudge(Base):
     )
     context: Mapped[Optional[dict]] = mapped_column(JSON)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    shown_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # first time served; NULL = unshown stock
+
+    # Effectiveness index (services.nudge_effects): times served, first refocuses
+    # within the window after it was shown, and the summed latency of those
+    shown_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    refocus_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    refocus_latency_sum: Mapped[float] = mapped_column(Float, default=0.0, nullable=False)
 
     user: Mapped["User"] = relationship(back_populates="nudges")
     prompt: Mapped[Optional["AIPrompt"]] = relationship()
@@ -119,6 +157,46 @@ class Nudge(Base):
         return f"<Nudge {self.type} user_id={self.user_id}>"
 
 
+# ─────────────────────────────
+# NUDGE GENERATION JOBS (durable work queue)
+# ─────────────────────────────
+NudgeJobStatus = Literal["pending", "running", "done", "failed"]
+
+class NudgeJob(Base):
+    """
+    One unit of background nudge generation. Workers claim jobs with a lease;
+    an expired lease makes the job claimable again. At most one pending/running
+    job exists per dedup_key.
+    """
+    __tablename__ = "nudge_jobs"
+    __table_args__ = (
+        Index("ix_nudge_job_claim", "status", "run_after"),
+        Index(
+            "uq_nudge_job_active_key", "dedup_key", unique=True,
+            sqlite_where=text("status IN ('pending', 'running')"),
+            postgresql_where=text("status IN ('pending', 'running')"),
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)  # 'refill' | 'eft_submit'
+    dedup_key: Mapped[str] = mapped_column(String(128), nullable=False)
+    status: Mapped[str] = mapped_column(String(16), default="pending", nullable=False)
+    payload: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, default=3)
+    run_after: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    lease_owner: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    lease_until: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<NudgeJob id={self.id} {self.kind} user_id={self.user_id} status={self.status}>"
+
+
 # ─────────────────────────────
 # USER ACTIVITY (UK - activity/performance tracking)
 # ─────────────────────────────
@@ -128,7 +206,10 @@ class UserActivity(Base):
     Useful for fine-grained behavioral timelines.
     """
     __tablename__ = "user_activity"
-    __table_args__ = (Index("ix_activity_user_created", "user_id", "created_at"),)
+    __table_args__ = (
+        Index("ix_activity_user_created", "user_id", "created_at"),
+        Index("ix_activity_user_type_created", "user_id", "activity_type", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -164,6 +245,10 @@ class EventLog(Base):
 
     user: Mapped["User"] = relationship(back_populates="event_logs")
 
+    __table_args__ = (
+        Index("ix_event_user_type_time", "user_id", "event_type", "timestamp"),  # last serve before a refocus
+    )
+
     def __repr__(self):
         return f"<EventLog user_id={self.user_id} type={self.event_type}>"
 
@@ -171,6 +256,47 @@ class EventLog(Base):
 User.event_logs = relationship("EventLog", back_populates="user", cascade="all, delete-orphan")
 
 
+# ─────────────────────────────
+# ATTENTION STATE (per-user, for O(1) metric updates)
+# ─────────────────────────────
+class AttentionState(Base):
+    """
+    Latest focus_resumed / nudge_shown times per user, so idle and refocus
+    metrics never have to search user_activity. Rebuildable from history
+    (services.attention.rebuild_state).
+    """
+    __tablename__ = "attention_state"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    last_focus_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    last_nudge_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<AttentionState user_id={self.user_id} focus={self.last_focus_at} nudge={self.last_nudge_at}>"
+
+
+# ─────────────────────────────
+# NUDGE ROTATION CURSOR (per-user, for O(1) serving)
+# ─────────────────────────────
+class NudgeRotation(Base):
+    """
+    Where each user is in their nudge rotation: the id of the last nudge
+    served. The next one is the first nudge with a larger id (wrapping to the
+    smallest). deck_version counts deck changes since the cursor was created.
+    """
+    __tablename__ = "nudge_rotation"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    cursor_nudge_id: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    deck_version: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    served_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<NudgeRotation user_id={self.user_id} cursor={self.cursor_nudge_id} v{self.deck_version}>"
+
+
 # ─────────────────────────────
 # USER STATS (AGGREGATED METRICS)
 # ─────────────────────────────
@@ -202,4 +328,47 @@ class UserStats(Base):
         return f"<UserStats user_id={self.user_id} idle={self.idle_count} nudges={self.total_nudges_shown}>"
     
 
-__all__ = ["User", "UserActivity", "EventLog", "UserStats"]
+
+# ─────────────────────────────
+# ACTIVITY ROLLUPS (hourly / daily time series)
+# ─────────────────────────────
+class ActivityRollup(Base):
+    """
+    Per-user counters for one hour or one day (UTC), maintained as events are
+    logged (services.rollups) and rebuildable with its backfill command.
+    Refocus latency (nudge → next focus_resumed) is kept as a fixed-bucket
+    histogram: latency_le_N counts latencies in (previous bound, N] seconds.
+    """
+    __tablename__ = "activity_rollups"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    granularity: Mapped[str] = mapped_column(String(8), primary_key=True)  # "hour" | "day"
+    bucket_start: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+
+    events: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    idle_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    focus_resumed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    nudges_shown: Mapped[int] = mapped_column(Integer, default=0, nullable=False)     # user_activity
+    nudges_served: Mapped[int] = mapped_column(Integer, default=0, nullable=False)    # event_log
+    sessions: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    rating_sum: Mapped[float] = mapped_column(Float, default=0.0, nullable=False)
+    sustained_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    sustained_seconds: Mapped[float] = mapped_column(Float, default=0.0, nullable=False)
+    refocus_within_60s: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    refocus_latency_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    refocus_latency_sum: Mapped[float] = mapped_column(Float, default=0.0, nullable=False)
+    latency_le_5: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    latency_le_15: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    latency_le_30: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    latency_le_60: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    latency_le_120: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    latency_le_300: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    latency_gt_300: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ActivityRollup user_id={self.user_id} {self.granularity} {self.bucket_start}>"
+
+
+__all__ = ["User", "UserActivity", "EventLog", "UserStats", "NudgeJob", "PromptTemplate", "AttentionState", "NudgeRotation", "ActivityRollup"]
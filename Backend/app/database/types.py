@@ -0,0 +1,47 @@
+from __future__ import annotations
+import zlib
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+# ─────────────────────────────
+# TRANSPARENTLY COMPRESSED TEXT
+# ─────────────────────────────
+# Stored as bytes with a one-byte header: b"\x00" + utf-8 for short values,
+# b"\x01" + zlib for anything over the threshold. Rows written before the
+# column was compressed come back from SQLite as plain str and pass through.
+
+_RAW = b"\x00"
+_ZLIB = b"\x01"
+
+
+class CompressedText(TypeDecorator):
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, threshold: int = 256, level: int = 6, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = threshold
+        self.level = level
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        data = value.encode("utf-8")
+        if len(data) >= self.threshold:
+            packed = zlib.compress(data, self.level)
+            if len(packed) < len(data):
+                return _ZLIB + packed
+        return _RAW + data
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            return value  # legacy uncompressed row
+        value = bytes(value)
+        header, body = value[:1], value[1:]
+        if header == _ZLIB:
+            return zlib.decompress(body).decode("utf-8")
+        if header == _RAW:
+            return body.decode("utf-8")
+        return value.decode("utf-8")
@@ -0,0 +1,187 @@
+from __future__ import annotations
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from app.config import LOG_ACCESS, LOG_FORMAT, LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SAMPLE_RATES
+
+# ─────────────────────────────
+# NON-BLOCKING STRUCTURED LOGGING
+# ─────────────────────────────
+# Every "app.*" logger hands records to a bounded queue; one listener thread
+# formats them (JSON lines by default) and writes to stdout. A slow or piped
+# stdout only ever stalls that thread: when the queue is full, new records
+# are dropped and counted instead of blocking the request.
+#
+# Structured fields go in `extra=` (user_id, event_type, nudge_id, ...). The
+# current route is added to every record logged while a request is running.
+# INFO/DEBUG records carrying an event_type listed in LOG_SAMPLE_RATES are
+# sampled at that rate.
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+_scope: ContextVar[dict | None] = ContextVar("log_scope", default=None)
+
+_listener: logging.handlers.QueueListener | None = None
+_handler: logging.Handler | None = None
+_LOGGERS = ("app", "__main__")  # "__main__" covers the module CLIs (python -m app.services.…)
+
+
+def parse_sample_rates(spec: str) -> dict[str, float]:
+    rates = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, rate = part.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def route_of(scope: dict) -> str | None:
+    """Route template once the router has matched (/nudges/next/{user_id}), else the raw path."""
+    return getattr(scope.get("route"), "path", None) or scope.get("path")
+
+
+class ContextFilter(logging.Filter):
+    """Stamp the current route (if any) onto each record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "route"):
+            scope = _scope.get()
+            if scope is not None:
+                record.route = route_of(scope)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, "event_type", None))
+        return rate is None or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never waits: a full queue drops the record."""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        payload.update({k: v for k, v in vars(record).items() if k not in _STANDARD_ATTRS})
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = {k: v for k, v in vars(record).items() if k not in _STANDARD_ATTRS}
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Install the queue handler on the "app" logger (idempotent)."""
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(TextFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(parse_sample_rates(LOG_SAMPLE_RATES)))
+    handler.addFilter(ContextFilter())
+
+    for name in _LOGGERS:
+        logger = logging.getLogger(name)
+        if _handler is not None:
+            logger.removeHandler(_handler)
+        logger.setLevel(level)
+        logger.addHandler(handler)
+        logger.propagate = False
+    _handler = handler
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# ─────────────────────────────
+# ACCESS LOG (ASGI middleware)
+# ─────────────────────────────
+access_logger = logging.getLogger("app.access")
+
+
+class AccessLogMiddleware:
+    """One record per HTTP request; also exposes the route to other records."""
+
+    def __init__(self, app, enabled: bool = LOG_ACCESS):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        token = _scope.set(scope)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _scope.reset(token)
+            if self.enabled:
+                access_logger.info(
+                    "request",
+                    extra={
+                        "method": scope.get("method"),
+                        "route": route_of(scope),
+                        "status": status,
+                        "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+                    },
+                )
@@ -1,40 +1,55 @@
 from __future__ import annotations
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.schemas import UserCreate
-from app.database.db_setup import get_db
+from app.database.db_setup import get_async_db
 from app.database import models
+from app.services.passwords import PasswordPoolBusy
 from app.services.security import (
-    hash_password,
-    verify_password,
+    ahash_password,
+    averify_password,
     create_access_token,
     get_current_user,
+    UserIdentity,
 )
 
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
+
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many logins at once, retry shortly.",
+        headers={"Retry-After": "1"},
+    )
+
 # ─────────────────────────────
 # SIGNUP
 # ─────────────────────────────
 
 
 @router.post("/signup", status_code=status.HTTP_201_CREATED)
-def signup(user: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(models.User).filter(models.User.username == user.username).first()
+async def signup(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing_user = await db.scalar(select(models.User).where(models.User.username == user.username))
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already registered")
 
+    try:
+        password_hash = await ahash_password(user.password)
+    except PasswordPoolBusy:
+        raise _busy()
+
     db_user = models.User(
         username=user.username,
-        password_hash=hash_password(user.password),
+        password_hash=password_hash,
         full_name_fa=user.full_name_fa,
         english_goal=user.english_goal,
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
 
     return {"message": "User created successfully", "user_id": db_user.id}
 
@@ -43,13 +58,21 @@ def signup(user: UserCreate, db: Session = Depends(get_db)):
 # LOGIN
 # ─────────────────────────────
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.password_hash):
-
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(models.User).where(models.User.username == form_data.username))
+    try:
+        # Unknown users go through the same bcrypt work (no username enumeration by timing)
+        valid, new_hash = await averify_password(form_data.password, user.password_hash if user else None)
+    except PasswordPoolBusy:
+        raise _busy()
+    if not user or not valid:
         raise HTTPException(status_code=401, detail="Invalid username or password")
+    if new_hash:
+        # BCRYPT_ROUNDS changed since this hash was stored
+        user.password_hash = new_hash
+        await db.commit()
 
-    access_token = create_access_token({"sub": user.username})
+    access_token = create_access_token({"sub": user.username, "uid": user.id})
     return {
         "access_token": access_token,
         "token_type": "bearer",
@@ -66,7 +89,7 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
 # CURRENT USER
 # ─────────────────────────────
 @router.get("/me")
-def get_me(current_user: models.User = Depends(get_current_user)):
+async def get_me(current_user: UserIdentity = Depends(get_current_user)):
     """
     Return the currently authenticated user.
     """
@@ -1,29 +1,141 @@
+import json
+import logging
+from contextlib import aclosing
+import anyio
 from fastapi import APIRouter, Depends, status, HTTPException
-from sqlalchemy.orm import Session
-from app.database.db_setup import get_db
-from app.database import models
-from app.services.ai_service import generate_nudge
-from app.services.security import get_current_user
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import NUDGE_GENERATION_MODE, NUDGES_PER_SUBMIT
+from app.database.db_setup import async_session, get_async_db
+from app.database import crud, models
+from app.routers.nudges import FALLBACK_NUDGE
+from app.services import llm_limits
+from app.services.ai_service import NudgeDeckStream, agenerate_nudge_deck, agenerate_nudges
+from app.services.nudge_jobs import enqueue_eft_submit
+from app.services.nudge_rotation import bump_deck_version
+from app.services.security import UserIdentity, get_current_user
 
 router = APIRouter(prefix="/eft", tags=["EFT"])
+logger = logging.getLogger(__name__)
 
 
 @router.post("/submit", status_code=status.HTTP_200_OK)
-def submit_eft(
+async def submit_eft(
     data: dict,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    fresh: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserIdentity = Depends(get_current_user)
 ):
     """
-    Save user's EFT reflection, generate two Persian motivational nudges,
-    and store both in the database.
+    Save user's EFT reflection, generate Persian motivational nudges
+    concurrently, and store them in the database.
+    ?fresh=true bypasses the LLM response cache (research protocol samples).
     """
     if not current_user:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     # ✅ Save EFT response
+    eft = await _save_eft(db, current_user.id, data)
+
+    user_name = current_user.full_name_fa or current_user.username
+
+    if NUDGE_GENERATION_MODE == "queue":
+        # Background workers generate the deck; respond without waiting on the LLM
+        await db.run_sync(enqueue_eft_submit, current_user.id, eft.id, fresh)
+        return {
+            "message": "EFT responses saved; Persian nudges are being generated.",
+            "nudges": [],
+            "queued": True,
+        }
+
+    generate = _generate_deck if NUDGE_GENERATION_MODE == "deck" else _generate_single
+    # A double-tap or client retry with the same answers joins the generation
+    # already running instead of paying for a second one
+    key = (current_user.id, NUDGE_GENERATION_MODE, crud.eft_digest(data), fresh)
+    nudges_text = await llm_limits.generations.do(
+        key, lambda: generate(current_user.id, data, user_name, current_user.english_goal, fresh)
+    )
+
+    if not nudges_text:
+        # Provider failing or circuit open: answer from what the user already has
+        return {
+            "message": "EFT responses saved; nudges could not be generated right now.",
+            "nudges": await _fallback_nudges(db, current_user.id),
+            "fallback": True,
+        }
+
+    return {
+        "message": "EFT responses and Persian nudges saved successfully.",
+        "nudges": nudges_text
+    }
+
+
+@router.post("/submit/stream", status_code=status.HTTP_200_OK)
+async def submit_eft_stream(
+    data: dict,
+    fresh: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserIdentity = Depends(get_current_user)
+):
+    """
+    Like /eft/submit in deck mode, but answers with Server-Sent Events: one
+    `nudge` event per nudge as soon as the model has finished writing it
+    (already saved), then `done` — or `error` if generation failed, carrying
+    the user's existing nudges (or the fallback) when none were streamed.
+    A double-tap with the same answers shares one generation. POST, so read
+    it with fetch() rather than EventSource.
+    """
+    await _save_eft(db, current_user.id, data)
+    user_name = current_user.full_name_fa or current_user.username
+    stream = NudgeDeckStream(
+        data, user_name=user_name, english_goal=current_user.english_goal, fresh=fresh, user_id=current_user.id
+    )
+    return StreamingResponse(
+        _stream_deck(current_user.id, stream),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _stream_deck(user_id: int, stream: NudgeDeckStream):
+    # The request's session is closed once the response starts, so the
+    # stream uses its own
+    async with async_session() as db:
+        prompt_id = await db.run_sync(crud.start_streamed_deck, user_id, stream.prompt)
+        saved = 0
+        try:
+            # aclosing: a client that goes away stops the wait right away
+            async with aclosing(stream.__aiter__()) as nudges:
+                async for nudge in nudges:
+                    nudge_id = await db.run_sync(crud.save_streamed_nudge, user_id, prompt_id, nudge)
+                    saved += nudge_id is not None
+                    yield _sse("nudge", {"id": nudge_id, **nudge})
+        except Exception as e:
+            logger.warning("⚠️ Error streaming nudge deck: %s", e, extra={"user_id": user_id})
+            fallback = [] if stream.nudges else await _fallback_nudges(db, user_id)
+            yield _sse("error", {"detail": "Nudge generation failed.", "fallback": fallback})
+        else:
+            yield _sse("done", {"count": len(stream.nudges), "saved": saved})
+            logger.info(
+                "✅ Streamed deck of %d nudges (%d new) for user %s", len(stream.nudges), saved, user_id,
+                extra={"user_id": user_id},
+            )
+        finally:
+            with anyio.CancelScope(shield=True):  # also when the client went away
+                await db.run_sync(crud.finish_streamed_deck, prompt_id, stream.raw, len(stream.nudges))
+
+
+async def _fallback_nudges(db, user_id: int) -> list[str]:
+    return await db.run_sync(crud.recent_nudge_texts, user_id) or [FALLBACK_NUDGE]
+
+
+async def _save_eft(db: AsyncSession, user_id: int, data: dict) -> models.EFTResponse:
     eft = models.EFTResponse(
-        user_id=current_user.id,
+        user_id=user_id,
         q1_why_goal_matters=data.get("q1_why_goal_matters"),
         q2_when_reach_goal=data.get("q2_when_reach_goal"),
         q3_possible_obstacles=data.get("q3_possible_obstacles"),
@@ -32,36 +144,59 @@ def submit_eft(
         q6_notes=data.get("q6_notes"),
     )
     db.add(eft)
-    db.commit()
-    db.refresh(eft)
+    await db.commit()
+    return eft
+
+
+# Generations run under single-flight and may outlive the request that
+# started them, so they save through their own session.
+async def _generate_deck(user_id: int, data: dict, user_name: str, english_goal: str, fresh: bool):
+    """One completion → full typed deck → one Nudge row per message."""
+    try:
+        prompt, raw, deck = await agenerate_nudge_deck(
+            data, user_name=user_name, english_goal=english_goal, fresh=fresh, user_id=user_id
+        )
+    except Exception as e:
+        logger.warning("⚠️ Error generating nudge deck: %s", e, extra={"user_id": user_id})
+        return []
+
+    if not deck:
+        logger.warning("⚠️ Nudge deck could not be parsed: %s...", raw[:80], extra={"user_id": user_id})
+    async with async_session() as db:
+        saved = await db.run_sync(crud.save_nudge_deck, user_id, prompt, raw, deck)
+    logger.info(
+        "✅ Generated deck of %d nudges (%d new) for user %s", len(deck), len(saved), user_id,
+        extra={"user_id": user_id},
+    )
+    return [n["message"] for n in deck]
+
+
+async def _generate_single(user_id: int, data: dict, user_name: str, english_goal: str, fresh: bool):
+    """NUDGES_PER_SUBMIT one-nudge completions, all in flight at once."""
+    results = await agenerate_nudges(
+        data, user_name=user_name, english_goal=english_goal, n=NUDGES_PER_SUBMIT, fresh=fresh, user_id=user_id
+    )
 
-    # ✅ Generate two new Persian nudges
     nudges_text = []
-    for i in range(2):
-        try:
-            prompt_text, nudge_text = generate_nudge(
-                data,
-                user_name=current_user.full_name_fa or current_user.username,
-                english_goal=current_user.english_goal,
-            )
+    async with async_session() as db:
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.warning("⚠️ Error generating nudge %d: %s", i + 1, result, extra={"user_id": user_id})
+                continue
+
+            _, nudge_text = result
             nudges_text.append(nudge_text)
 
             # Save each nudge to DB
-            nudge = models.Nudge(
-                user_id=current_user.id,
+            db.add(models.Nudge(
+                user_id=user_id,
                 type="positive",
                 source="ai",
                 text=nudge_text,
-            )
-            db.add(nudge)
-            print(f"✅ Generated nudge {i+1}: {nudge_text}")
-
-        except Exception as e:
-            print(f"⚠️ Error generating nudge {i+1}: {e}")
+            ))
+            logger.info("✅ Generated nudge %d: %s", i + 1, nudge_text, extra={"user_id": user_id})
 
-    db.commit()
-
-    return {
-        "message": "EFT responses and Persian nudges saved successfully.",
-        "nudges": nudges_text
-    }
+        if nudges_text:
+            await db.run_sync(bump_deck_version, user_id)
+        await db.commit()
+    return nudges_text
@@ -1,56 +1,95 @@
-from fastapi import APIRouter, Depends, status
-from sqlalchemy.orm import Session
+import logging
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from app.database.db_setup import get_db
-from app.database import models
-from app.services.security import get_current_user
+from app.database.db_setup import get_async_db
+from app.schemas import EventBatch
+from app.services import event_buffer, nudge_rotation
+from app.services.event_buffer import EventBufferFull, UserEvents
+from app.services.event_service import (
+    IncomingEvent,
+    SystemEvent,
+    client_event_time,
+    log_events,
+    log_system_events,
+)
+from app.services.security import UserIdentity, get_current_user
 
 router = APIRouter(prefix="/events", tags=["Events"])
+logger = logging.getLogger(__name__)
+
+
+async def _record(db: AsyncSession, record: SystemEvent | UserEvents):
+    """Write now, or hand off to the write-behind buffer when it is enabled."""
+    buffer = event_buffer.get_buffer()
+    if buffer is not None:
+        try:
+            await buffer.asubmit(record)
+        except EventBufferFull:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Event buffer full, retry shortly.",
+                headers={"Retry-After": "1"},
+            )
+    elif isinstance(record, SystemEvent):
+        await db.run_sync(log_system_events, [record])
+    else:
+        await db.run_sync(log_events, record.user_id, record.events)
 
 
 @router.post("/nudge_shown", status_code=status.HTTP_201_CREATED)
-def log_nudge_shown_event(
+async def log_nudge_shown_event(
     event: dict,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserIdentity = Depends(get_current_user),
 ):
     """Triggered when a nudge is shown due to inactivity"""
     nudge_id = event.get("nudge_id")
     if not nudge_id:
         return {"error": "Missing nudge_id"}
+    if not isinstance(nudge_id, int):
+        return {"error": "Unknown nudge_id"}
+
+    new_serve = await db.run_sync(nudge_rotation.report_shown, current_user.id, nudge_id)
+    if new_serve is None:
+        return {"error": "Unknown nudge_id"}
+    if not new_serve:
+        # the serve that handed out this nudge already counted it
+        return {"message": "Nudge event already logged."}
 
-    log = models.EventLog(
-        user_id=current_user.id,
-        event_type="nudge_shown",
-        details={"nudge_id": nudge_id, "timestamp": datetime.utcnow().isoformat()},
+    now = datetime.utcnow()
+    await _record(db, SystemEvent(
+        current_user.id,
+        "nudge_shown",
+        {"nudge_id": nudge_id, "timestamp": now.isoformat()},
+        now,
+    ))
+    logger.info(
+        "📋 Logged event: Nudge shown (nudge_id=%s) for user %s", nudge_id, current_user.username,
+        extra={"user_id": current_user.id, "event_type": "nudge_shown", "nudge_id": nudge_id},
     )
-    db.add(log)
-    db.commit()
-    print(f"📋 Logged event: Nudge shown (nudge_id={nudge_id}) for user {current_user.username}")
     return {"message": "Nudge event logged successfully."}
 
 
 @router.post("/focus_resumed", status_code=status.HTTP_201_CREATED)
-def log_focus_resumed_event(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+async def log_focus_resumed_event(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserIdentity = Depends(get_current_user),
 ):
     """Triggered when user returns focus after being idle"""
-    log = models.EventLog(
-        user_id=current_user.id,
-        event_type="focus_resumed",
-        details={"timestamp": datetime.utcnow().isoformat()},
+    now = datetime.utcnow()
+    await _record(db, SystemEvent(current_user.id, "focus_resumed", {"timestamp": now.isoformat()}, now))
+    logger.info(
+        "📋 Logged event: Focus resumed for user %s", current_user.username,
+        extra={"user_id": current_user.id, "event_type": "focus_resumed"},
     )
-    db.add(log)
-    db.commit()
-    print(f"📋 Logged event: Focus resumed for user {current_user.username}")
     return {"message": "Focus resumed event logged successfully."}
 
 @router.post("/log", status_code=status.HTTP_201_CREATED)
-def log_generic_event(
+async def log_generic_event(
     data: dict,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserIdentity = Depends(get_current_user),
 ):
     """
     Logs events like idle_detected, focus_resumed, nudge_shown, etc.
@@ -60,68 +99,38 @@ def log_generic_event(
     if not event_type:
         return {"error": "Missing event_type"}
 
-    # 1️⃣ Create base event
-    event = models.UserActivity(
-        user_id=current_user.id,
-        activity_type=event_type,
-        extra_data=data.get("details", {}),
+    await _record(db, UserEvents(current_user.id, [IncomingEvent(event_type, data.get("details") or {})]))
+    logger.info(
+        "✅ Logged %s for user %s", event_type, current_user.username,
+        extra={"user_id": current_user.id, "event_type": event_type},
     )
-    db.add(event)
-
-    # 2️⃣ Ensure stats record
-    stats = db.query(models.UserStats).filter_by(user_id=current_user.id).first()
-    if not stats:
-        stats = models.UserStats(user_id=current_user.id)
-        db.add(stats)
-
-    # 3️⃣ Handle metrics updates
-    if event_type == "idle_detected":
-        stats.idle_count += 1
-        # sustained attention
-        last_refocus = (
-            db.query(models.UserActivity)
-            .filter_by(user_id=current_user.id, activity_type="focus_resumed")
-            .order_by(models.UserActivity.created_at.desc())
-            .first()
-        )
-        if last_refocus:
-            sustained = (datetime.utcnow() - last_refocus.created_at).total_seconds()
-            stats.total_sustained_attention += sustained
-            db.add(models.UserActivity(
-                user_id=current_user.id,
-                activity_type="sustained_attention",
-                duration_seconds=int(sustained),
-                extra_data={"duration": sustained},
-            ))
-
-    elif event_type == "nudge_shown":
-        stats.total_nudges_shown += 1
+    return {"message": f"{event_type} logged successfully"}
 
-    elif event_type == "focus_resumed":
-        # immediate refocus detection (within 60s)
-        last_nudge = (
-            db.query(models.UserActivity)
-            .filter_by(user_id=current_user.id, activity_type="nudge_shown")
-            .order_by(models.UserActivity.created_at.desc())
-            .first()
-        )
-        if last_nudge:
-            delta = (datetime.utcnow() - last_nudge.created_at).total_seconds()
-            if delta <= 60:
-                stats.total_refocus_within_60s += 1
-                db.add(models.UserActivity(
-                    user_id=current_user.id,
-                    activity_type="immediate_refocus",
-                    duration_seconds=int(delta),
-                    extra_data={"latency": delta},
-                ))
 
-    elif event_type == "session_feedback":
-        rating = data.get("details", {}).get("rating", 0)
-        total = stats.total_sessions * stats.avg_feedback_score + rating
-        stats.total_sessions += 1
-        stats.avg_feedback_score = total / stats.total_sessions if stats.total_sessions > 0 else 0
-
-    db.commit()
-    print(f"✅ Logged {event_type} for user {current_user.username}")
-    return {"message": f"{event_type} logged successfully"}
\ No newline at end of file
+@router.post("/batch", status_code=status.HTTP_201_CREATED)
+async def log_event_batch(
+    batch: EventBatch,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserIdentity = Depends(get_current_user),
+):
+    """
+    Logs an ordered array of timestamped events (e.g. buffered by a client
+    while offline) in one transaction with a single stats update.
+    Derived metrics match logging the events one by one via /events/log.
+    Future timestamps are clamped to server time; events older than
+    EVENT_MAX_AGE_SECONDS are dropped (and counted in the response).
+    """
+    now = datetime.utcnow()
+    events = []
+    for e in batch.events:
+        at = client_event_time(e.timestamp, now)
+        if at is not None:
+            events.append(IncomingEvent(e.event_type, e.details or {}, at))
+    dropped = len(batch.events) - len(events)
+    if events:
+        await _record(db, UserEvents(current_user.id, events))
+    logger.info(
+        "✅ Logged batch of %d events for user %s (%d stale dropped)", len(events), current_user.username, dropped,
+        extra={"user_id": current_user.id, "event_type": "batch", "count": len(events), "dropped": dropped},
+    )
+    return {"message": f"{len(events)} events logged successfully", "count": len(events), "dropped": dropped}
@@ -0,0 +1,109 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.db_setup import get_async_db
+from app.services import export, nudge_effects, rollups
+from app.services.event_service import to_naive_utc
+from app.services.security import UserIdentity, get_current_user
+
+router = APIRouter(prefix="/research", tags=["Research"])
+
+
+# ─────────────────────────────
+# TIME SERIES (from activity rollups)
+# ─────────────────────────────
+@router.get("/timeseries/{user_id}")
+async def get_time_series(
+    user_id: int,
+    granularity: Literal["hour", "day"] = "day",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserIdentity = Depends(get_current_user),
+):
+    """
+    Per-hour or per-day idle counts, sustained attention, refocus latency
+    histogram and feedback for start <= bucket < end (UTC), read from the
+    activity_rollups table — never from raw events.
+    """
+    if current_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized for this user.")
+
+    rows = await db.run_sync(
+        rollups.time_series,
+        user_id,
+        granularity,
+        to_naive_utc(start) if start else None,
+        to_naive_utc(end) if end else None,
+    )
+    return {
+        "user_id": user_id,
+        "granularity": granularity,
+        "latency_buckets_seconds": list(rollups.LATENCY_BUCKETS_SECONDS),
+        "buckets": [rollups.to_dict(r) for r in rows],
+    }
+
+
+# ─────────────────────────────
+# NUDGE EFFECTIVENESS (from per-nudge counters)
+# ─────────────────────────────
+@router.get("/nudges/{user_id}")
+async def get_nudge_effects(
+    user_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserIdentity = Depends(get_current_user),
+):
+    """Times each nudge was served, refocuses it earned and their mean latency."""
+    if current_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized for this user.")
+
+    return {
+        "user_id": user_id,
+        "nudges": await db.run_sync(nudge_effects.effects, user_id),
+    }
+
+
+# ─────────────────────────────
+# STREAMING EXPORT
+# ─────────────────────────────
+@router.get("/export/{table}")
+async def export_table(
+    table: Literal["event_log", "user_activity", "nudges", "ai_prompts", "user_stats"],
+    format: Literal["ndjson", "csv", "parquet"] = "ndjson",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    event_type: str | None = None,
+    include_archive: bool = True,
+    current_user: UserIdentity = Depends(get_current_user),
+):
+    """
+    Stream the caller's rows of a research table (start <= time < end, UTC),
+    with JSON details flattened into columns. Chunks are read and sent one at
+    a time, so the response size is not bounded by server memory.
+
+    event_log / user_activity include archived partitions unless
+    include_archive=false; the X-Archive-Skipped header then lists the
+    archived months in range that were left out.
+    """
+    if format not in export.available_formats():
+        raise HTTPException(status_code=400, detail="Parquet export is not available (pyarrow not installed).")
+
+    flt = export.ExportFilter(
+        user_id=current_user.id,
+        since=to_naive_utc(start) if start else None,
+        until=to_naive_utc(end) if end else None,
+        event_type=event_type,
+        include_archive=include_archive,
+    )
+    headers = {"Content-Disposition": f'attachment; filename="{table}.{format}"'}
+    skipped = export.skipped_archive(table, flt)
+    if skipped:
+        headers["X-Archive-Skipped"] = ",".join(skipped)
+    return StreamingResponse(
+        export.stream(table, format, flt),
+        media_type=export.MEDIA_TYPES[format],
+        headers=headers,
+    )
@@ -1,7 +1,10 @@
 # app/schemas.py
-from pydantic import BaseModel
+from datetime import datetime
+from pydantic import BaseModel, Field
 from typing import Optional
 
+from app.config import EVENT_BATCH_MAX_SIZE
+
 
 class UserCreate(BaseModel):
     username: str
@@ -23,3 +26,13 @@ class UserResponse(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class EventIn(BaseModel):
+    event_type: str = Field(min_length=1, max_length=64)
+    details: dict | None = None
+    timestamp: datetime | None = None  # defaults to server receive time
+
+
+class EventBatch(BaseModel):
+    events: list[EventIn] = Field(min_length=1, max_length=EVENT_BATCH_MAX_SIZE)
@@ -1,153 +1,358 @@
+from __future__ import annotations
+import asyncio
+import threading
+import time
+from typing import Callable
+from app.config import (
+    LLM_BACKEND,
+    LLM_FAKE_LATENCY_SECONDS,
+    OPENAI_API_KEY,
+    OPENAI_MODEL,
+    LLM_TIMEOUT_SECONDS,
+    LLM_DEADLINE_SECONDS,
+    LLM_CONNECT_TIMEOUT_SECONDS,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE_CONNECTIONS,
+    NUDGE_DECK_MAX_TOKENS,
+)
+from app.services import llm_guard, llm_limits, metrics
+from app.services.llm_cache import cache_key, llm_cache
+from app.services.nudge_parser import parse_nudge_deck, scan_complete_nudges, strip_fences, validate_nudges
+from app.services.prompt_compiler import EFT_NUDGE, RenderedPrompt, render_eft_prompt
 
-from openai import OpenAI
-from app.config import OPENAI_API_KEY
-
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-def generate_nudge(eft_data: dict, user_name: str, english_goal: str):
-    system_prompt = """
-You are an expert in motivational psychology and applied Episodic Future Thinking (EFT).
-Your task is to generate short, emotionally intelligent motivational "nudges" in Persian (Farsi)
-that are deeply personalized for the user based on their responses about goals, obstacles, and feelings.
-
----
-
-### 🎯 PURPOSE
-The nudges will be used inside an educational app helping Persian-speaking university students
-stay focused while preparing for the IELTS exam or other learning goals.
-They should evoke emotion, not give advice; sound human, not robotic; and always feel natural.
-
----
-
-### 🧠 CONCEPTUAL FRAMEWORK (for you, the model)
-Base your tone and content on the principles of *Episodic Future Thinking (EFT)*, which means:
-- Make the user mentally “feel” and “see” a **future moment** of success or regret.
-- Use **sensory and emotional imagery** (e.g., hearing, seeing, or feeling something).
-- Focus on **authentic inner emotion** (pride, calm, relief, regret) rather than commands or clichés.
-- Use **approach motivation** (moving toward a rewarding feeling) or **avoidance motivation**
-  (avoiding a painful future emotion) — both are valid EFT techniques.
-- Always sound **friendly and supportive**, not like a coach or instructor.
-
-Avoid:
-- Generic or cliché lines like "تو می‌تونی!" or "هرگز تسلیم نشو."
-- Imperatives or teacher-like tones (“باید تمرین کنی”).
-- Overly poetic or exaggerated imagery.
-
----
-
-### 📋 INPUT FORMAT (user data provided as JSON)
-The user data will look like this:
-{
-  "name": "سارا",
-  "q1_why_goal_matters": "رسیدن به نمره ۷ در آیلتس برایم مهم است چون می‌خواهم برای ادامه تحصیل در خارج از کشور پذیرش بگیرم و احساس استقلال و پیشرفت داشته باشم.",
-  "q2_when_reach_goal": "شش ماه دیگر.",
-  "q3_possible_obstacles": "ممکن است خستگی، فشار کاری یا ناامیدی از پیشرفت کند باعث شود انگیزه‌ام را از دست بدهم.",
-  "q4_future_visualization": "خودم را در دانشگاهی در خارج از کشور می‌بینم که با اعتماد به نفس با استاد و هم‌کلاسی‌ها صحبت می‌کنم و از هر لحظه یادگیری لذت می‌برم. خانواده‌ام را می‌بینم که پس از دریافت پذیرش به من افتخار می‌کنند.",
-  "q5_if_give_up": "اگر رها کنم، حس شکست و پشیمانی خواهم داشت و فرصت رشد و پیشرفت را از خودم می‌گیرم.",
-  "q6_notes": "دوست دارم روزانه حتی کم ولی مستمر تمرین کنم تا مسیر یادگیری برایم طبیعی و لذت‌بخش باشد."
-}
-
----
-
-### 🧩 OUTPUT FORMAT
-Respond in **valid JSON** as follows:
-{
-  "user": "<name>",
-  "nudges": [
-    {"type": "positive", "message": "<short, vivid, future-oriented Persian nudge>"},
-    {"type": "negative", "message": "<short, gentle, regret-avoidant Persian nudge>"},
-    ...
-  ]
-}
-
-Generate 8–10 nudges total:
-- 4–5 positive (imagining the rewarding outcome)
-- 4–5 negative (reflecting softly on what might be lost)
-
----
-
-### 🗣 TONE AND STYLE GUIDELINES
-1. **Language:** Persian (Farsi), fluent, modern, natural — avoid literary or archaic forms.
-2. **Length:** One or two short sentences; can fit in a phone notification.
-3. **Voice:** Always address the user by name.
-4. **Emotion:** Subtle and authentic — make the user “feel” their goal, not “think” about it.
-5. **Imagery:** Refer to their specific details (e.g., IELTS, family pride, studying abroad, confidence).
-6. **Polarity:** 
-   - Positive nudges → highlight calm pride, growth, or independence.
-   - Negative nudges → highlight mild regret or missed emotional fulfillment (not guilt).
-
----
-
-### 💡 EXAMPLES OF GOOD OUTPUT
-Example (for Sara):
-{
-  "user": "سارا",
-  "nudges": [
-    {
-      "type": "positive",
-      "message": "سارا، فکر کن روزی که با اعتماد به نفس توی کلاس دانشگاه صحبت می‌کنی و خانواده‌ت با لبخند بهت نگاه می‌کنن — همون روز داره با هر تمرین کوچیک نزدیک‌تر می‌شه."
-    },
-    {
-      "type": "negative",
-      "message": "سارا، اگه امروز رها کنی، اون لحظه‌ی غروری که خانواده‌ت دنبالش بودن یه کم دورتر می‌ره — حیفه، فقط چند قدم مونده."
-    },
-    {
-      "type": "positive",
-      "message": "سارا، هر بار که تمرین می‌کنی، داری اون حس آزادی و استقلالی که دنبالش بودی رو می‌سازی، آروم و واقعی."
-    },
-    {
-      "type": "negative",
-      "message": "سارا، خستگی چند دقیقه‌ست، ولی حس پشیمونی می‌مونه — همون چند خط خوندن می‌تونه ورق رو برگردونه."
-    }
-  ]
-}
-
----
-
-### 🧬 LOGIC INSIDE THE MODEL (implicit reasoning)
-When writing each nudge:
-1. Extract emotional keywords from user input (e.g., «استقلال», «افتخار خانواده», «اعتماد به نفس»).
-2. Choose one concept per nudge.
-3. Form an **emotional micro-scene** around that concept (seeing, feeling, hearing, or imagining).
-4. Use second person + name for emotional engagement.
-5. Keep tone warm, conversational, and realistic.
-
----
-
-### 🧪 OUTPUT QUALITY CHECK
-Before finishing, ensure:
-- Each message sounds like something a caring inner voice could say.
-- No message gives an instruction.
-- Each one connects directly to the user’s own imagery or motivations.
-
----
-
-Now, given the user JSON, generate 8–10 personalized EFT-based Persian nudges following these principles.
+# ─────────────────────────────
+# CLIENTS (shared, pooled, built on first use)
+# ─────────────────────────────
+# Importing the OpenAI SDK (and httpx) and building its TLS-backed clients is
+# a large share of a cold boot, so it happens on the first completion instead.
+# `ai_service.client` / `ai_service.async_client` still work (module __getattr__).
+_clients: dict[str, object] = {}
+_clients_lock = threading.Lock()
 
+
+def _build_clients():
+    if LLM_BACKEND == "fake":
+        from app.services.fake_llm import FakeAsyncOpenAI, FakeOpenAI
+
+        return FakeOpenAI(latency=LLM_FAKE_LATENCY_SECONDS), FakeAsyncOpenAI(latency=LLM_FAKE_LATENCY_SECONDS)
+
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+
+    timeout = httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS)
+    limits = httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+    )
+    # Retries are llm_guard's job; SDK retries would multiply them
+    sync_client = OpenAI(
+        api_key=OPENAI_API_KEY,
+        max_retries=0,
+        http_client=httpx.Client(timeout=timeout, limits=limits),
+    )
+    async_client = AsyncOpenAI(
+        api_key=OPENAI_API_KEY,
+        max_retries=0,
+        http_client=httpx.AsyncClient(timeout=timeout, limits=limits),
+    )
+    return sync_client, async_client
+
+
+def _client(name: str):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            if not _clients:
+                _clients["client"], _clients["async_client"] = _build_clients()
+        client = _clients[name]
+    return client
+
+
+def __getattr__(name: str):
+    if name in ("client", "async_client"):
+        return _client(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# ─────────────────────────────
+# PROMPTS (compiled once in services/prompt_compiler.py)
+# ─────────────────────────────
+# Part of the LLM cache key, so old cached completions stop matching when the
+# template changes.
+PROMPT_TEMPLATE_VERSION = EFT_NUDGE.version
+
+
+def _record_prompt_size(prompt: RenderedPrompt):
+    """Sizes of prompts actually sent (cache hits send nothing)."""
+    metrics.PROMPT_TOKENS.observe(prompt.template.system_tokens, template=prompt.template.version, part="static")
+    metrics.PROMPT_TOKENS.observe(prompt.user_tokens, template=prompt.template.version, part="variable")
+    for field in prompt.truncated:
+        metrics.PROMPT_TRUNCATIONS.inc(field=field)
+
+
+# ─────────────────────────────
+# GENERATION
+# ─────────────────────────────
+def _cache_key(mode: str, eft_data: dict, user_name: str, english_goal: str, sample: int = 0) -> str:
+    return cache_key(OPENAI_MODEL, PROMPT_TEMPLATE_VERSION, mode, eft_data, user_name, english_goal, sample)
+
+
+def _remaining(end: float, kind: str) -> float:
+    """Time left for the API call after waiting for a slot; never a non-positive timeout."""
+    remaining = end - time.monotonic()
+    if remaining <= 0:
+        metrics.LLM_GIVE_UPS.inc(kind=kind, reason="deadline")
+        raise llm_guard.DeadlineExceeded(f"LLM deadline exceeded waiting for a slot ({kind})")
+    return remaining
+
+
+def _complete(kind: str, build: Callable[[RenderedPrompt, float], dict], prompt: RenderedPrompt,
+              user_id: int | None, timeout: float):
+    """One attempt: wait for a request slot, then spend what is left of timeout on the call."""
+    end = time.monotonic() + timeout
+    with llm_limits.limiter.slot(user_id, timeout, kind):
+        request = build(prompt, _remaining(end, kind))
+        with metrics.llm_call(kind) as call:
+            response = _client("client").chat.completions.create(**request)
+            call.usage(response)
+    return response
+
+
+async def _acomplete(kind: str, build: Callable[[RenderedPrompt, float], dict], prompt: RenderedPrompt,
+                     user_id: int | None, timeout: float):
+    end = time.monotonic() + timeout
+    async with llm_limits.limiter.aslot(user_id, timeout, kind):
+        request = build(prompt, _remaining(end, kind))
+        with metrics.llm_call(kind) as call:
+            response = await _client("async_client").chat.completions.create(**request)
+            call.usage(response)
+    return response
+
+
+def _single_request(prompt: RenderedPrompt, timeout: float) -> dict:
+    return dict(
+        model=OPENAI_MODEL,
+        messages=prompt.messages(),
+        max_tokens=150,
+        temperature=1.1,
+        timeout=min(timeout, LLM_TIMEOUT_SECONDS),
+    )
+
+
+def generate_nudge(eft_data: dict, user_name: str, english_goal: str,
+                   timeout: float | None = None, fresh: bool = False, sample: int = 0,
+                   user_id: int | None = None):
     """
+    One nudge per completion. Identical inputs are served from llm_cache
+    unless fresh=True; `sample` distinguishes parallel draws for the same input.
+    `timeout` overrides LLM_DEADLINE_SECONDS (all attempts included); raises
+    llm_guard.LLMUnavailable when no completion could be had.
+    """
+    prompt = render_eft_prompt(eft_data, user_name, english_goal)
+    key = _cache_key("single", eft_data, user_name, english_goal, sample)
+
+    nudge_text = llm_cache.get(key, bypass=fresh)
+    if nudge_text is None:
+        _record_prompt_size(prompt)
+        response = llm_guard.call(
+            lambda t: _complete("single", _single_request, prompt, user_id, t), "single", timeout or LLM_DEADLINE_SECONDS
+        )
+        nudge_text = response.choices[0].message.content.strip()
+        llm_cache.put(key, nudge_text)
+    return prompt, nudge_text
 
-    user_content = f"""
-    نام کاربر: {user_name}
-    هدف زبانی: {english_goal or 'کسب نمره بالا در IELTS'}
-
-    پاسخ‌ها:
-    - چرا هدف مهم است؟ {eft_data.get('q1_why_goal_matters')}
-    - چه زمانی احساس موفقیت می‌کند؟ {eft_data.get('q2_when_reach_goal')}
-    - موانع احتمالی: {eft_data.get('q3_possible_obstacles')}
-    - تصویر آینده در ذهن: {eft_data.get('q4_future_visualization')}
-    - اگر ناامید شود چه می شود؟ {eft_data.get('q5_if_give_up')}
-    - یادداشت اضافه: {eft_data.get('q6_notes')}
+
+async def agenerate_nudge(eft_data: dict, user_name: str, english_goal: str,
+                          timeout: float | None = None, fresh: bool = False, sample: int = 0,
+                          user_id: int | None = None):
+    """
+    Async variant of generate_nudge. Runs on the shared AsyncOpenAI pool, so
+    waiting on the provider does not hold a threadpool worker.
     """
+    prompt = render_eft_prompt(eft_data, user_name, english_goal)
+    key = _cache_key("single", eft_data, user_name, english_goal, sample)
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt.strip()},
-            {"role": "user", "content": user_content.strip()},
-        ],
-        max_tokens=150,
+    nudge_text = await llm_cache.aget(key, bypass=fresh)
+    if nudge_text is None:
+        _record_prompt_size(prompt)
+        response = await llm_guard.acall(
+            lambda t: _acomplete("single", _single_request, prompt, user_id, t), "single", timeout or LLM_DEADLINE_SECONDS
+        )
+        nudge_text = response.choices[0].message.content.strip()
+        await llm_cache.aput(key, nudge_text)
+    return prompt, nudge_text
+
+
+async def agenerate_nudges(eft_data: dict, user_name: str, english_goal: str, n: int, fresh: bool = False,
+                           user_id: int | None = None):
+    """
+    Run n generations concurrently. Returns one entry per generation, either a
+    (prompt, nudge_text) tuple or the exception that generation raised.
+    """
+    return await asyncio.gather(
+        *(agenerate_nudge(eft_data, user_name, english_goal, fresh=fresh, sample=i, user_id=user_id)
+          for i in range(n)),
+        return_exceptions=True,
+    )
+
+
+def _deck_request(prompt: RenderedPrompt, timeout: float) -> dict:
+    return dict(
+        model=OPENAI_MODEL,
+        messages=prompt.messages(),
+        max_tokens=NUDGE_DECK_MAX_TOKENS,
         temperature=1.1,
+        response_format={"type": "json_object"},
+        timeout=min(timeout, LLM_TIMEOUT_SECONDS),
     )
 
-    nudge_text = response.choices[0].message.content.strip()
-    return user_content, nudge_text
+
+def generate_nudge_deck(eft_data: dict, user_name: str, english_goal: str,
+                        timeout: float | None = None, fresh: bool = False, user_id: int | None = None):
+    """
+    Request the whole 8–10 nudge deck in a single JSON-mode completion.
+    Returns (prompt, raw_reply, nudges) where nudges is the validated
+    list of {"type", "message"} dicts (repaired if the reply was truncated).
+    Only decks that parse are cached.
+    """
+    prompt = render_eft_prompt(eft_data, user_name, english_goal)
+    key = _cache_key("deck", eft_data, user_name, english_goal)
+
+    raw = llm_cache.get(key, bypass=fresh)
+    if raw is not None:
+        return prompt, raw, parse_nudge_deck(raw)
+
+    _record_prompt_size(prompt)
+    response = llm_guard.call(
+        lambda t: _complete("deck", _deck_request, prompt, user_id, t), "deck", timeout or LLM_DEADLINE_SECONDS
+    )
+    raw = response.choices[0].message.content or ""
+    nudges = parse_nudge_deck(raw)
+    if nudges:
+        llm_cache.put(key, raw)
+    return prompt, raw, nudges
+
+
+async def agenerate_nudge_deck(eft_data: dict, user_name: str, english_goal: str,
+                               timeout: float | None = None, fresh: bool = False, user_id: int | None = None):
+    """Async variant of generate_nudge_deck."""
+    prompt = render_eft_prompt(eft_data, user_name, english_goal)
+    key = _cache_key("deck", eft_data, user_name, english_goal)
+
+    raw = await llm_cache.aget(key, bypass=fresh)
+    if raw is not None:
+        return prompt, raw, parse_nudge_deck(raw)
+
+    _record_prompt_size(prompt)
+    response = await llm_guard.acall(
+        lambda t: _acomplete("deck", _deck_request, prompt, user_id, t), "deck", timeout or LLM_DEADLINE_SECONDS
+    )
+    raw = response.choices[0].message.content or ""
+    nudges = parse_nudge_deck(raw)
+    if nudges:
+        await llm_cache.aput(key, raw)
+    return prompt, raw, nudges
+
+
+_STREAM_DONE = object()
+
+
+class NudgeDeckStream:
+    """
+    Streamed variant of agenerate_nudge_deck: `async for nudge in stream`
+    yields each validated {"type", "message"} as soon as its JSON object is
+    complete in the partial reply. Afterwards `raw` holds the full reply and
+    `nudges` everything yielded. A cached deck is replayed at once.
+
+    The request runs in its own task, which holds the slot and the breaker
+    probe and hands nudges over through a queue, so neither is held while
+    the consumer is suspended (writing to the database, waiting on the
+    client). The whole reply gets one deadline (timeout). Identical concurrent
+    streams share one request (llm_limits.generations): the others replay
+    the finished deck. A consumer that stops early leaves the request to
+    finish, within its deadline, and fill the cache.
+    """
+
+    def __init__(self, eft_data: dict, user_name: str, english_goal: str,
+                 timeout: float | None = None, fresh: bool = False, user_id: int | None = None):
+        self.prompt = render_eft_prompt(eft_data, user_name, english_goal)
+        self.key = _cache_key("deck", eft_data, user_name, english_goal)
+        self.timeout = timeout or LLM_DEADLINE_SECONDS
+        self.user_id = user_id
+        self.fresh = fresh
+        self.raw = ""
+        self.nudges: list[dict] = []
+
+    def _new_nudges(self, candidates: list[dict]) -> list[dict]:
+        # validate_nudges is prefix-stable, so what was yielded stays a prefix
+        fresh = candidates[len(self.nudges):]
+        self.nudges.extend(fresh)
+        return fresh
+
+    async def _generate(self, queue: asyncio.Queue) -> str:
+        """The streamed request: puts each longer validated prefix on the queue, returns the reply."""
+        _record_prompt_size(self.prompt)
+        parts: list[str] = []
+        scanned = 0
+        # A reply already half-delivered cannot be retried: breaker only
+        end = time.monotonic() + self.timeout
+        async with llm_limits.limiter.aslot(self.user_id, self.timeout, "deck_stream"):
+            remaining = _remaining(end, "deck_stream")
+            request = _deck_request(self.prompt, remaining)
+            with llm_guard.guarded(), metrics.llm_call("deck_stream") as call:
+                async with asyncio.timeout(remaining):
+                    started = time.perf_counter()
+                    response = await _client("async_client").chat.completions.create(
+                        **request,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                    )
+                    async for chunk in response:
+                        if chunk.usage is not None:
+                            call.usage(chunk)
+                        if not chunk.choices or not chunk.choices[0].delta.content:
+                            continue
+                        if not parts:
+                            metrics.LLM_FIRST_TOKEN.observe(time.perf_counter() - started, kind="deck_stream")
+                        delta = chunk.choices[0].delta.content
+                        parts.append(delta)
+                        if "}" not in delta:
+                            continue  # no object can have completed
+                        self.raw = "".join(parts)  # partial reply, kept if the stream fails
+                        candidates = validate_nudges(scan_complete_nudges(strip_fences(self.raw)))
+                        if len(candidates) > scanned:
+                            scanned = len(candidates)
+                            queue.put_nowait(candidates)
+
+        raw = "".join(parts)
+        if scanned or parse_nudge_deck(raw):
+            await llm_cache.aput(self.key, raw)
+        return raw
+
+    async def __aiter__(self):
+        cached = await llm_cache.aget(self.key, bypass=self.fresh)
+        if cached is not None:
+            self.raw = cached
+            for nudge in self._new_nudges(parse_nudge_deck(cached)):
+                yield nudge
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        flight = asyncio.ensure_future(llm_limits.generations.do(
+            ("deck_stream", self.user_id, self.key, self.fresh), lambda: self._generate(queue)
+        ))
+        flight.add_done_callback(lambda _: queue.put_nowait(_STREAM_DONE))
+        try:
+            while (candidates := await queue.get()) is not _STREAM_DONE:
+                for nudge in self._new_nudges(candidates):
+                    yield nudge
+            self.raw = flight.result()
+        finally:
+            flight.cancel()  # our wait only: the shared request goes on
+
+        # Whole-reply parse catches what scanning cannot (plain-text replies);
+        # a stream that joined another one's request gets its whole deck here
+        final = parse_nudge_deck(self.raw)
+        if final[:len(self.nudges)] == self.nudges:
+            for nudge in self._new_nudges(final):
+                yield nudge
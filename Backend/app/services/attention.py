@@ -0,0 +1,157 @@
+from __future__ import annotations
+import logging
+import threading
+from dataclasses import dataclass, replace
+from datetime import datetime
+from sqlalchemy import event, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import ATTENTION_STATE_MEMORY
+from app.database import models
+
+# ─────────────────────────────
+# INCREMENTAL ATTENTION-METRICS STATE
+# ─────────────────────────────
+# log_events needs "when did this user last refocus / last see a nudge" on
+# every idle_detected / focus_resumed. Instead of an ORDER BY over the user's
+# whole user_activity history, that answer lives in one attention_state row
+# per user (primary-key read), optionally mirrored in memory.
+#
+# The in-memory copy only changes after the transaction that wrote the row
+# commits (see the Session listeners below), so a rolled-back batch can never
+# leave memory ahead of the database. It is per process, hence off by default
+# (ATTENTION_STATE_MEMORY): with several workers every call reads the (still
+# O(1)) row, so all workers agree on the last focus / nudge.
+
+
+@dataclass(frozen=True)
+class UserAttention:
+    last_focus_at: datetime | None = None
+    last_nudge_at: datetime | None = None
+
+    def observe(self, event_type: str, at: datetime) -> "UserAttention":
+        if event_type == "focus_resumed" and (self.last_focus_at is None or at > self.last_focus_at):
+            return replace(self, last_focus_at=at)
+        if event_type == "nudge_shown" and (self.last_nudge_at is None or at > self.last_nudge_at):
+            return replace(self, last_nudge_at=at)
+        return self
+
+    def merge(self, other: "UserAttention") -> "UserAttention":
+        """Latest of both, field by field (concurrent writers never move time backwards)."""
+        return UserAttention(
+            last_focus_at=_latest(self.last_focus_at, other.last_focus_at),
+            last_nudge_at=_latest(self.last_nudge_at, other.last_nudge_at),
+        )
+
+
+def _latest(a: datetime | None, b: datetime | None) -> datetime | None:
+    if a is None or b is None:
+        return a or b
+    return max(a, b)
+
+
+_memory: dict[int, UserAttention] = {}
+_lock = threading.Lock()
+_PENDING_KEY = "attention_pending"
+
+
+def _last_at(db: Session, user_id: int, activity_type: str) -> datetime | None:
+    # Served by ix_activity_user_type_created
+    return (
+        db.query(func.max(models.UserActivity.created_at))
+        .filter(models.UserActivity.user_id == user_id, models.UserActivity.activity_type == activity_type)
+        .scalar()
+    )
+
+
+def rebuild_state(db: Session, user_id: int) -> UserAttention:
+    """Recompute a user's state from user_activity history and store it (no commit)."""
+    state = UserAttention(
+        last_focus_at=_last_at(db, user_id, "focus_resumed"),
+        last_nudge_at=_last_at(db, user_id, "nudge_shown"),
+    )
+    save_state(db, user_id, state)
+    return state
+
+
+def load_state(db: Session, user_id: int) -> UserAttention:
+    """Memory → attention_state row → rebuild from history, in that order."""
+    if ATTENTION_STATE_MEMORY:
+        with _lock:
+            state = _memory.get(user_id)
+        if state is not None:
+            return state
+
+    row = db.get(models.AttentionState, user_id)
+    if row is not None:
+        state = UserAttention(row.last_focus_at, row.last_nudge_at)
+        if ATTENTION_STATE_MEMORY:
+            with _lock:
+                _memory.setdefault(user_id, state)
+        return state
+    return rebuild_state(db, user_id)
+
+
+def save_state(db: Session, user_id: int, state: UserAttention):
+    """Write the row in the caller's transaction; memory follows on commit."""
+    row = db.get(models.AttentionState, user_id)
+    if row is None:
+        # The savepoint flushes the new row, so later db.get calls in this
+        # (autoflush=False) transaction see it
+        try:
+            with db.begin_nested():
+                row = models.AttentionState(
+                    user_id=user_id, last_focus_at=state.last_focus_at, last_nudge_at=state.last_nudge_at
+                )
+                db.add(row)
+        except IntegrityError:
+            # Created concurrently by another request — merge into theirs
+            row = db.get(models.AttentionState, user_id, populate_existing=True)
+    state = state.merge(UserAttention(row.last_focus_at, row.last_nudge_at))
+    row.last_focus_at = state.last_focus_at
+    row.last_nudge_at = state.last_nudge_at
+    db.info.setdefault(_PENDING_KEY, {})[user_id] = state
+
+
+def forget(user_id: int | None = None):
+    """Drop cached state (all users when user_id is None)."""
+    with _lock:
+        if user_id is None:
+            _memory.clear()
+        else:
+            _memory.pop(user_id, None)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session: Session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending and ATTENTION_STATE_MEMORY:
+        with _lock:
+            for user_id, state in pending.items():
+                current = _memory.get(user_id)
+                _memory[user_id] = current.merge(state) if current else state
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        with _lock:
+            for user_id in pending:
+                _memory.pop(user_id, None)
+
+
+if __name__ == "__main__":
+    # python -m app.services.attention [user_id ...]  → rebuild from history
+    import sys
+    from app.database.db_setup import SessionLocal
+    from app.logging_config import configure_logging
+    configure_logging(fmt="text")
+
+    with SessionLocal() as db:
+        user_ids = [int(a) for a in sys.argv[1:]] or [uid for (uid,) in db.query(models.User.id)]
+        for uid in user_ids:
+            rebuild_state(db, uid)
+        db.commit()
+    logging.getLogger(__name__).info("✅ Rebuilt attention state for %d users", len(user_ids))
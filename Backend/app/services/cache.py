@@ -0,0 +1,529 @@
+from __future__ import annotations
+import asyncio
+import logging
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Any, Awaitable, Callable, TypeVar
+from urllib.parse import urlparse
+
+from app.config import (
+    CACHE_BACKEND,
+    CACHE_KEY_PREFIX,
+    CACHE_LOCK_SECONDS,
+    CACHE_MAX_ENTRIES,
+    CACHE_PATH,
+    CACHE_REDIS_URL,
+    CACHE_TIMEOUT_SECONDS,
+    CACHE_VERSION_TTL_SECONDS,
+)
+from app.services.ttl_cache import TTLCache
+
+# ─────────────────────────────
+# SHARED CACHE (memory · sqlite · redis)
+# ─────────────────────────────
+# With several uvicorn workers, anything cached per process goes stale as soon
+# as another worker changes the underlying row. `cache` puts cached values in
+# one store every worker sees, chosen by CACHE_BACKEND:
+#
+#   memory  per-process LRU (single worker, tests)
+#   sqlite  one WAL-mode file at CACHE_PATH, shared by the workers of a host
+#   redis   any Redis-protocol server at CACHE_REDIS_URL (services/fake_redis.py
+#           is a local stand-in)
+#
+# Keys live in namespaces. Each namespace has a version counter that is part
+# of every key, so invalidate(namespace) is a single INCR, whatever the number
+# of entries; the old ones simply stop matching and age out. Counters never
+# expire and are never evicted (with Redis, use a volatile-* maxmemory policy),
+# otherwise a reset version would resurrect invalidated entries.
+#
+# get_or_set()/aget_or_set() protect against stampedes: one loader per key per
+# process, and across processes whoever wins a short add() lock loads while
+# the others wait for its value (up to CACHE_LOCK_SECONDS).
+#
+# Values are pickled. A backend that cannot be reached degrades to a miss
+# (counted in `errors`), never to a failed request.
+#
+# The async methods run backend calls in a worker thread (sqlite and redis
+# block on I/O), so a slow or unreachable backend never stalls the event
+# loop. Namespace versions are remembered for CACHE_VERSION_TTL_SECONDS per
+# process: a hit is then one backend read. Invalidations apply at once in
+# the worker that made them and within that TTL in the others.
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CacheUnavailable(Exception):
+    """The backend could not answer; the cache treats it as a miss."""
+
+
+BACKEND_ERRORS = (CacheUnavailable, sqlite3.Error, OSError)
+
+
+# ─────────────────────────────
+# BACKENDS
+# ─────────────────────────────
+# bytes under string keys with an optional TTL in seconds (None = no expiry),
+# plus integer counters. add() stores only if the key is absent (or expired).
+class MemoryBackend(TTLCache):
+    """Per-process LRU; consistent only within one worker."""
+
+    blocking = False  # no I/O: async callers need no thread hop
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        super().__init__(max_entries, float("inf"))
+        self._counters: dict[str, int] = {}
+
+    def add(self, key: str, value: bytes, ttl: float | None) -> bool:
+        with self._lock:  # reentrant: set() takes it again
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return False
+            self.set(key, value, ttl)
+            return True
+
+    def delete(self, key: str):
+        self.pop(key)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+
+class SQLiteBackend:
+    """
+    One WAL-mode file shared by every process on the host; one connection per
+    thread, autocommit. Expired and surplus entries (soonest to expire first)
+    are trimmed every TRIM_EVERY writes of a process.
+    """
+
+    blocking = True
+
+    TRIM_EVERY = 256
+
+    def __init__(self, path: str | Path = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._ready = False
+        self._writes = 0
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA mmap_size=67108864")
+            if not self._ready:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache_entries ("
+                    " key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_expires ON cache_entries (expires_at)")
+                conn.execute("CREATE TABLE IF NOT EXISTS cache_counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+                self._ready = True
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> bytes | None:
+        row = self._db().execute(
+            "SELECT value FROM cache_entries WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: float | None):
+        self._db().execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, None if ttl is None else time.time() + ttl),
+        )
+        self._wrote()
+
+    def add(self, key: str, value: bytes, ttl: float | None) -> bool:
+        now = time.time()
+        added = self._db().execute(
+            "INSERT INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+            " WHERE cache_entries.expires_at <= ?",
+            (key, value, None if ttl is None else now + ttl, now),
+        ).rowcount
+        self._wrote()
+        return added == 1
+
+    def delete(self, key: str):
+        self._db().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def incr(self, key: str) -> int:
+        return self._db().execute(
+            "INSERT INTO cache_counters (key, value) VALUES (?, 1)"
+            " ON CONFLICT(key) DO UPDATE SET value = value + 1 RETURNING value",
+            (key,),
+        ).fetchone()[0]
+
+    def counter(self, key: str) -> int:
+        row = self._db().execute("SELECT value FROM cache_counters WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _wrote(self):
+        self._writes += 1
+        if self._writes % self.TRIM_EVERY == 0:
+            self.trim()
+
+    def trim(self) -> int:
+        db = self._db()
+        removed = db.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),)).rowcount
+        surplus = db.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0] - self.max_entries
+        if surplus > 0:
+            removed += db.execute(
+                "DELETE FROM cache_entries WHERE key IN ("
+                " SELECT key FROM cache_entries ORDER BY expires_at IS NULL, expires_at LIMIT ?)",
+                (surplus,),
+            ).rowcount
+        return removed
+
+
+class RedisReplyError(CacheUnavailable):
+    """The server answered with an error reply."""
+
+
+def _encode_command(args: tuple) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+class _RespConnection:
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    def call(self, *args):
+        self.sock.sendall(_encode_command(args))
+        return self._read()
+
+    def _read(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise CacheUnavailable("connection closed mid-reply")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RedisReplyError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            return None if size < 0 else self.reader.read(size + 2)[:-2]
+        if kind == b"*":
+            size = int(rest)
+            return None if size < 0 else [self._read() for _ in range(size)]
+        raise CacheUnavailable(f"unexpected reply {line[:32]!r}")
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisBackend:
+    """
+    Minimal RESP2 client (GET/SET/DEL/INCR) over pooled sockets; no dependency.
+    After a failed connect the server is treated as down for DOWN_SECONDS, so
+    an outage costs one timeout, not one per cache call.
+    """
+
+    blocking = True
+
+    DOWN_SECONDS = 1.0
+
+    def __init__(self, url: str = CACHE_REDIS_URL, timeout: float = CACHE_TIMEOUT_SECONDS, pool_size: int = 16):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._idle: list[_RespConnection] = []
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+
+    def _connect(self) -> _RespConnection:
+        if time.monotonic() < self._down_until:
+            raise CacheUnavailable(f"redis {self.host}:{self.port} unreachable, retrying shortly")
+        try:
+            conn = _RespConnection(self.host, self.port, self.timeout)
+        except OSError:
+            self._down_until = time.monotonic() + self.DOWN_SECONDS
+            raise
+        try:
+            if self.password:
+                conn.call("AUTH", self.password)
+            if self.db:
+                conn.call("SELECT", self.db)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def _command(self, *args):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        conn = conn or self._connect()
+        try:
+            reply = conn.call(*args)
+        except RedisReplyError:
+            self._release(conn)  # the reply was read in full; the connection is fine
+            raise
+        except BaseException:
+            conn.close()
+            raise
+        self._release(conn)
+        return reply
+
+    def _release(self, conn: _RespConnection):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @staticmethod
+    def _px(ttl: float) -> int:
+        return max(int(ttl * 1000), 1)
+
+    def get(self, key: str) -> bytes | None:
+        return self._command("GET", key)
+
+    def set(self, key: str, value: bytes, ttl: float | None):
+        if ttl is None:
+            self._command("SET", key, value)
+        else:
+            self._command("SET", key, value, "PX", self._px(ttl))
+
+    def add(self, key: str, value: bytes, ttl: float | None) -> bool:
+        args = ("SET", key, value, "NX") if ttl is None else ("SET", key, value, "PX", self._px(ttl), "NX")
+        return self._command(*args) == "OK"
+
+    def delete(self, key: str):
+        self._command("DEL", key)
+
+    def incr(self, key: str) -> int:
+        return self._command("INCR", key)
+
+    def counter(self, key: str) -> int:
+        value = self._command("GET", key)
+        return int(value) if value is not None else 0
+
+
+def create_backend(name: str = CACHE_BACKEND):
+    """No I/O here: connections and the SQLite file are opened on first use."""
+    if name == "memory":
+        return MemoryBackend()
+    if name == "sqlite":
+        return SQLiteBackend()
+    if name == "redis":
+        return RedisBackend()
+    raise ValueError(f"Unknown CACHE_BACKEND {name!r} (memory, sqlite or redis)")
+
+
+# ─────────────────────────────
+# CACHE (what the rest of the app uses)
+# ─────────────────────────────
+class Cache:
+    """Namespaced, pickled values over a backend. None is not cacheable."""
+
+    def __init__(self, backend, prefix: str = CACHE_KEY_PREFIX, lock_seconds: float = CACHE_LOCK_SECONDS,
+                 version_ttl: float = CACHE_VERSION_TTL_SECONDS):
+        self.backend = backend
+        self.prefix = prefix
+        self.lock_seconds = lock_seconds
+        self.counters = {"hits": 0, "misses": 0, "sets": 0, "invalidations": 0, "lock_waits": 0, "errors": 0}
+        self._versions = TTLCache(4096, version_ttl)
+        self._guard = threading.Lock()
+        self._thread_locks: weakref.WeakValueDictionary[str, threading.Lock] = weakref.WeakValueDictionary()
+        self._async_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+
+    # ── Namespaces ──
+    def version(self, namespace: str) -> int:
+        version = self._versions.get(namespace)
+        if version is None:
+            version = self._call(self.backend.counter, f"{self.prefix}v:{namespace}")
+            if version is None:
+                return 0  # backend down: not remembered
+            self._versions.set(namespace, version)
+        return version
+
+    def invalidate(self, namespace: str):
+        """Drop every entry of namespace, in every process sharing the backend."""
+        self._count("invalidations")
+        version = self._call(self.backend.incr, f"{self.prefix}v:{namespace}")
+        if version is None:
+            self._versions.pop(namespace)
+        else:
+            self._versions.set(namespace, version)
+
+    async def ainvalidate(self, namespace: str):
+        await self._offload(self.invalidate, namespace)
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}{namespace}:{self.version(namespace)}:{key}"
+
+    # ── Plain access ──
+    def get(self, namespace: str, key: str) -> Any | None:
+        return self._load(self._key(namespace, key))
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float | None = None):
+        self._store(self._key(namespace, key), value, ttl)
+
+    def delete(self, namespace: str, key: str):
+        self._call(self.backend.delete, self._key(namespace, key))
+
+    async def aget(self, namespace: str, key: str) -> Any | None:
+        return await self._offload(self.get, namespace, key)
+
+    async def aset(self, namespace: str, key: str, value: Any, ttl: float | None = None):
+        await self._offload(self.set, namespace, key, value, ttl)
+
+    # ── Stampede-protected loading ──
+    def get_or_set(self, namespace: str, key: str, load: Callable[[], T], ttl: float | None = None) -> T:
+        full = self._key(namespace, key)
+        value = self._load(full)
+        if value is not None:
+            return value
+        with self._local_lock(self._thread_locks, full, threading.Lock):
+            value = self._load(full, count=False)  # filled while we waited for the lock?
+            if value is not None:
+                return value
+            locked = self._call(self.backend.add, full + ":lock", b"1", self.lock_seconds, default=True)
+            if not locked:
+                self._count("lock_waits")
+                for delay in self._waits():
+                    time.sleep(delay)
+                    value = self._load(full, count=False)
+                    if value is not None:
+                        return value
+            try:
+                value = load()
+            except BaseException:
+                self._unlock(full, locked)
+                raise
+            return self._fill(full, value, ttl, locked)
+
+    async def aget_or_set(self, namespace: str, key: str, load: Callable[[], Awaitable[T]],
+                          ttl: float | None = None) -> T:
+        full, value = await self._offload(self._lookup, namespace, key)
+        if value is not None:
+            return value
+        async with self._local_lock(self._async_locks, full, asyncio.Lock):
+            value = await self._offload(self._load, full, False)  # filled while we waited for the lock?
+            if value is not None:
+                return value
+            locked = await self._offload(
+                self._call, self.backend.add, full + ":lock", b"1", self.lock_seconds, default=True
+            )
+            if not locked:
+                self._count("lock_waits")
+                for delay in self._waits():
+                    await asyncio.sleep(delay)
+                    value = await self._offload(self._load, full, False)
+                    if value is not None:
+                        return value
+            try:
+                value = await load()
+            except BaseException:
+                await self._offload(self._unlock, full, locked)
+                raise
+            return await self._offload(self._fill, full, value, ttl, locked)
+
+    def stats(self) -> dict:
+        with self._guard:
+            counters = dict(self.counters)
+        lookups = counters["hits"] + counters["misses"]
+        return {**counters, "hit_ratio": counters["hits"] / lookups if lookups else 0.0}
+
+    # ── Internals ──
+    async def _offload(self, fn, *args, **kwargs):
+        """fn(*args) off the event loop when the backend does I/O."""
+        if not getattr(self.backend, "blocking", True):
+            return fn(*args, **kwargs)
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    def _count(self, name: str) -> int:
+        # Called from request threads and from _offload's worker threads
+        with self._guard:
+            self.counters[name] += 1
+            return self.counters[name]
+
+    def _lookup(self, namespace: str, key: str) -> tuple[str, Any | None]:
+        full = self._key(namespace, key)
+        return full, self._load(full)
+
+    def _waits(self):
+        """Growing sleeps adding up to about lock_seconds (the lock's lifetime)."""
+        waited, delay = 0.0, 0.01
+        while waited < self.lock_seconds:
+            yield delay
+            waited += delay
+            delay = min(delay * 2, 0.2)
+
+    def _fill(self, full: str, value, ttl: float | None, locked: bool):
+        try:
+            if value is not None:
+                self._store(full, value, ttl)
+            return value
+        finally:
+            self._unlock(full, locked)
+
+    def _unlock(self, full: str, locked: bool):
+        if locked:
+            self._call(self.backend.delete, full + ":lock")
+
+    def _local_lock(self, locks: weakref.WeakValueDictionary, key: str, factory):
+        with self._guard:
+            lock = locks.get(key)
+            if lock is None:
+                lock = locks[key] = factory()
+            return lock
+
+    def _load(self, full: str, count: bool = True) -> Any | None:
+        data = self._call(self.backend.get, full)
+        if count:
+            self._count("hits" if data is not None else "misses")
+        return None if data is None else pickle.loads(data)
+
+    def _store(self, full: str, value: Any, ttl: float | None):
+        if ttl is not None and ttl <= 0:
+            return
+        self._count("sets")
+        self._call(self.backend.set, full, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), ttl)
+
+    def _call(self, fn, *args, default=None):
+        try:
+            return fn(*args)
+        except BACKEND_ERRORS as e:
+            errors = self._count("errors")
+            if errors & (errors - 1) == 0:  # 1st, 2nd, 4th, 8th, … failure
+                logger.warning("⚠️ Cache backend error (%d so far): %s", errors, e)
+            return default
+
+
+cache = Cache(create_backend())
@@ -0,0 +1,249 @@
+from __future__ import annotations
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+from app.config import (
+    EVENT_BUFFER_ENABLED,
+    EVENT_BUFFER_FLUSH_INTERVAL_SECONDS,
+    EVENT_BUFFER_FLUSH_SIZE,
+    EVENT_BUFFER_MAX_ATTEMPTS,
+    EVENT_BUFFER_MAX_SIZE,
+    EVENT_BUFFER_PUT_TIMEOUT_SECONDS,
+)
+from app.database.db_setup import SessionLocal
+from app.services.event_service import IncomingEvent, SystemEvent, log_events, log_system_events
+
+logger = logging.getLogger(__name__)
+
+# ─────────────────────────────
+# WRITE-BEHIND EVENT BUFFER (EVENT_BUFFER_ENABLED=True)
+# ─────────────────────────────
+# Event endpoints put a compact record on a bounded in-memory queue and
+# return; a single flusher thread writes whatever has accumulated in one
+# transaction once EVENT_BUFFER_FLUSH_SIZE records are waiting or
+# EVENT_BUFFER_FLUSH_INTERVAL_SECONDS have passed. One writer doing few large
+# commits replaces many request threads each committing a row, which is what
+# SQLite's single-writer lock rewards.
+#
+# Durability trade-off: a 201 from an event endpoint means "accepted", not
+# "on disk". Records still in the queue are lost if the process is killed
+# without a clean shutdown (SIGKILL, OOM, power loss) — at most
+# EVENT_BUFFER_MAX_SIZE events, typically one flush interval's worth.
+# A clean shutdown (app lifespan exit) always drains the queue. When the
+# queue is full, submit() waits EVENT_BUFFER_PUT_TIMEOUT_SECONDS and then
+# raises EventBufferFull, which the routes turn into 503 + Retry-After so
+# clients back off instead of memory growing without bound.
+# Leave the buffer off when every event must be durable before the response.
+#
+# A failed flush is retried unit by unit — each system event, and each
+# user's activity events, in its own transaction — so one bad record cannot
+# block the rest. Units that fail go back on the queue; after
+# EVENT_BUFFER_MAX_ATTEMPTS failures their records are dropped and logged
+# (dead-lettered) instead of failing every later flush.
+
+
+class EventBufferFull(Exception):
+    pass
+
+
+@dataclass(slots=True)
+class UserEvents:
+    """Activity events for one user (one /events/log or /events/batch call)."""
+    user_id: int
+    events: list[IncomingEvent]
+
+
+@dataclass(slots=True)
+class _Retry:
+    """A record from a failed flush, back on the queue."""
+    record: SystemEvent | UserEvents
+    attempts: int
+
+
+class EventBuffer:
+    def __init__(
+        self,
+        max_size: int = EVENT_BUFFER_MAX_SIZE,
+        flush_size: int = EVENT_BUFFER_FLUSH_SIZE,
+        flush_interval: float = EVENT_BUFFER_FLUSH_INTERVAL_SECONDS,
+        put_timeout: float = EVENT_BUFFER_PUT_TIMEOUT_SECONDS,
+        max_attempts: int = EVENT_BUFFER_MAX_ATTEMPTS,
+    ):
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.max_attempts = max_attempts
+        # Written by the flusher thread and by request threads / the event loop
+        self._counters_lock = threading.Lock()
+        self.counters = {
+            "accepted": 0, "rejected": 0, "flushed": 0, "flushes": 0,
+            "errors": 0, "retried": 0, "dead_lettered": 0,
+        }
+
+    def _count(self, name: str, n: int = 1):
+        with self._counters_lock:
+            self.counters[name] += n
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            return dict(self.counters)
+
+    # ── producer side ──
+    def submit(self, record: SystemEvent | UserEvents):
+        try:
+            self._queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            self._count("rejected")
+            raise EventBufferFull()
+        self._count("accepted")
+
+    async def asubmit(self, record: SystemEvent | UserEvents, poll: float = 0.01):
+        """submit() for async routes: waits on the event loop, not a thread."""
+        deadline = time.monotonic() + self.put_timeout
+        while True:
+            try:
+                self._queue.put_nowait(record)
+                break
+            except queue.Full:
+                if time.monotonic() >= deadline:
+                    self._count("rejected")
+                    raise EventBufferFull()
+                await asyncio.sleep(poll)
+        self._count("accepted")
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    # ── flusher ──
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="event-buffer-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and write out everything still queued."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        while self.flush() > 0:
+            pass
+
+    def _run(self):
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            while self.depth() < self.flush_size and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._stop.wait(min(remaining, 0.01))
+            try:
+                self.flush()
+            except Exception as e:
+                self._count("errors")
+                logger.exception("⚠️ Event buffer flush failed: %s", e)
+
+    def flush(self, limit: int | None = None) -> int:
+        """
+        Write up to `limit` queued records in one transaction, falling back to
+        one transaction per unit if that fails. Returns records taken off the
+        queue (written, requeued or dead-lettered).
+        """
+        limit = limit or max(self.flush_size, 1) * 4
+        items = []
+        while len(items) < limit:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not items:
+            return 0
+
+        attempts = {id(i.record): i.attempts for i in items if isinstance(i, _Retry)}
+        records = [i.record if isinstance(i, _Retry) else i for i in items]
+        units: list[list] = [[r] for r in records if isinstance(r, SystemEvent)]
+        per_user: dict[int, list[UserEvents]] = defaultdict(list)
+        for r in records:
+            if isinstance(r, UserEvents):
+                per_user[r.user_id].append(r)
+        units += per_user.values()
+
+        try:
+            self._write(units)
+        except Exception as e:
+            self._count("errors")
+            logger.warning("⚠️ Event buffer flush of %d records failed, retrying per unit: %s", len(records), e)
+            for unit in units:
+                try:
+                    self._write([unit])
+                except Exception as unit_error:
+                    self._retry_later(unit, attempts, unit_error)
+                else:
+                    self._count("flushed", len(unit))
+        else:
+            self._count("flushed", len(records))
+        self._count("flushes")
+        return len(records)
+
+    @staticmethod
+    def _write(units: list[list]):
+        db = SessionLocal()
+        try:
+            for unit in units:
+                if isinstance(unit[0], SystemEvent):
+                    log_system_events(db, unit, commit=False)
+                else:
+                    log_events(db, unit[0].user_id, [e for r in unit for e in r.events], commit=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _retry_later(self, unit: list, attempts: dict[int, int], error: Exception):
+        """Requeue a failed unit's records, or dead-letter them after max_attempts."""
+        for r in unit:
+            tries = attempts.get(id(r), 0) + 1
+            if tries >= self.max_attempts:
+                self._count("dead_lettered")
+                logger.error(
+                    "☠️ Dropping buffered %s after %d failed flushes: %s", type(r).__name__, tries, error,
+                    extra={"user_id": r.user_id, "event_type": getattr(r, "event_type", "batch")},
+                )
+                continue
+            try:
+                self._queue.put_nowait(_Retry(r, tries))
+                self._count("retried")
+            except queue.Full:
+                self._count("rejected")
+
+
+# Process-wide buffer; None unless started by the app lifespan
+_buffer: EventBuffer | None = None
+
+
+def get_buffer() -> EventBuffer | None:
+    return _buffer
+
+
+def start(enabled: bool = EVENT_BUFFER_ENABLED) -> EventBuffer | None:
+    global _buffer
+    if enabled and _buffer is None:
+        _buffer = EventBuffer()
+        _buffer.start()
+        logger.info("🧺 Write-behind event buffer enabled")
+    return _buffer
+
+
+def stop():
+    global _buffer
+    if _buffer is not None:
+        _buffer.stop()
+        _buffer = None
@@ -0,0 +1,269 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import EVENT_MAX_AGE_SECONDS
+from app.database import models
+from app.services import attention, nudge_effects
+from app.services.rollups import RollupBatch, apply_rollups, latency_column
+
+# ─────────────────────────────
+# EVENT INGESTION + RESEARCH STATS
+# ─────────────────────────────
+# One code path for /events/log (a single event) and /events/batch (many):
+# events are applied in timestamp order against in-memory state, activity
+# rows go in with one bulk INSERT and UserStats gets one UPDATE per call.
+
+REFOCUS_WINDOW_SECONDS = 60
+
+# user_activity rows derive_activity writes itself; every other type is a raw
+# client event (replayed by rollup backfill)
+DERIVED_ACTIVITY_TYPES = ("sustained_attention", "immediate_refocus")
+
+
+@dataclass
+class IncomingEvent:
+    event_type: str
+    details: dict = field(default_factory=dict)
+    at: datetime = field(default_factory=datetime.utcnow)
+
+
+def to_naive_utc(ts: datetime | None) -> datetime:
+    if ts is None:
+        return datetime.utcnow()
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def client_event_time(ts: datetime | None, now: datetime | None = None) -> datetime | None:
+    """
+    Server-safe time for a client-supplied timestamp: never later than now
+    (clock skew), None when older than EVENT_MAX_AGE_SECONDS (drop it).
+    """
+    now = now or datetime.utcnow()
+    at = min(to_naive_utc(ts), now)
+    if (now - at).total_seconds() > EVENT_MAX_AGE_SECONDS:
+        return None
+    return at
+
+
+@dataclass
+class StatsDelta:
+    """UserStats changes accumulated in memory and applied in one UPDATE."""
+    idle_count: int = 0
+    sustained_attention: float = 0.0
+    refocus_within_60s: int = 0
+    nudges_shown: int = 0
+    sessions: int = 0
+    rating_sum: float = 0.0
+
+    def __bool__(self):
+        return any((self.idle_count, self.sustained_attention, self.refocus_within_60s,
+                    self.nudges_shown, self.sessions))
+
+
+def ensure_stats_row(db: Session, user_id: int):
+    """Create the user's UserStats row if missing (safe under concurrent first events)."""
+    if db.query(models.UserStats.id).filter_by(user_id=user_id).first():
+        return
+    try:
+        with db.begin_nested():
+            db.add(models.UserStats(
+                user_id=user_id,
+                idle_count=0,
+                distraction_count=0,
+                total_sustained_attention=0.0,
+                total_refocus_within_60s=0,
+                total_nudges_shown=0,
+                total_sessions=0,
+                avg_feedback_score=0.0,
+            ))
+    except IntegrityError:
+        pass  # created by a concurrent request
+
+
+def apply_stats_delta(db: Session, user_id: int, delta: StatsDelta):
+    """
+    Add the delta with column arithmetic in SQL, so concurrent writers
+    never lose each other's increments.
+    """
+    if not delta:
+        return
+    ensure_stats_row(db, user_id)
+    S = models.UserStats
+    values = {
+        S.idle_count: S.idle_count + delta.idle_count,
+        S.total_sustained_attention: S.total_sustained_attention + delta.sustained_attention,
+        S.total_refocus_within_60s: S.total_refocus_within_60s + delta.refocus_within_60s,
+        S.total_nudges_shown: S.total_nudges_shown + delta.nudges_shown,
+        S.updated_at: datetime.utcnow(),
+    }
+    if delta.sessions:
+        # running mean over all session ratings, same as applying them one by one
+        values[S.avg_feedback_score] = (
+            (S.total_sessions * S.avg_feedback_score + delta.rating_sum)
+            / (S.total_sessions + delta.sessions)
+        )
+        values[S.total_sessions] = S.total_sessions + delta.sessions
+    db.execute(update(S).where(S.user_id == user_id).values(values))
+
+
+def derive_activity(
+    user_id: int,
+    events: list[IncomingEvent],
+    state: attention.UserAttention,
+    delta: StatsDelta | None = None,
+    rollup: RollupBatch | None = None,
+    refocused: list[tuple[datetime, float]] | None = None,
+) -> tuple[list[dict], attention.UserAttention]:
+    """
+    Apply time-ordered events to a user's attention state. Returns the
+    user_activity rows to insert (raw plus derived sustained_attention /
+    immediate_refocus) and the new state; fills delta and rollup when given,
+    and refocused with (time, latency) of each nudge's first refocus within the window.
+    """
+    delta = delta if delta is not None else StatsDelta()
+    rollup = rollup if rollup is not None else RollupBatch()
+    refocused = refocused if refocused is not None else []
+
+    rows = []
+    for e in events:
+        rows.append({
+            "user_id": user_id,
+            "activity_type": e.event_type,
+            "extra_data": e.details,
+            "created_at": e.at,
+        })
+        rollup.add(e.at, events=1)
+
+        if e.event_type == "idle_detected":
+            delta.idle_count += 1
+            rollup.add(e.at, idle_count=1)
+            # sustained attention since the last refocus
+            # (skipped for a buffered idle older than that refocus: never a negative duration)
+            last_refocus = state.last_focus_at
+            if last_refocus and last_refocus <= e.at:
+                sustained = (e.at - last_refocus).total_seconds()
+                delta.sustained_attention += sustained
+                rollup.add(e.at, sustained_count=1, sustained_seconds=sustained)
+                rows.append({
+                    "user_id": user_id,
+                    "activity_type": "sustained_attention",
+                    "duration_seconds": int(sustained),
+                    "extra_data": {"duration": sustained},
+                    "created_at": e.at,
+                })
+
+        elif e.event_type == "nudge_shown":
+            delta.nudges_shown += 1
+            rollup.add(e.at, nudges_shown=1)
+            state = state.observe("nudge_shown", e.at)
+
+        elif e.event_type == "focus_resumed":
+            rollup.add(e.at, focus_resumed=1)
+            # immediate refocus detection (within 60s)
+            last_nudge = state.last_nudge_at
+            if last_nudge and last_nudge <= e.at:
+                latency = (e.at - last_nudge).total_seconds()
+                if latency <= REFOCUS_WINDOW_SECONDS:
+                    delta.refocus_within_60s += 1
+                    rollup.add(e.at, refocus_within_60s=1)
+                    rows.append({
+                        "user_id": user_id,
+                        "activity_type": "immediate_refocus",
+                        "duration_seconds": int(latency),
+                        "extra_data": {"latency": latency},
+                        "created_at": e.at,
+                    })
+                # latency histogram: first refocus after each nudge only
+                if state.last_focus_at is None or state.last_focus_at < last_nudge:
+                    rollup.add(e.at, refocus_latency_count=1, refocus_latency_sum=latency,
+                               **{latency_column(latency): 1})
+                    if latency <= REFOCUS_WINDOW_SECONDS:
+                        refocused.append((e.at, latency))
+            state = state.observe("focus_resumed", e.at)
+
+        elif e.event_type == "session_feedback":
+            rating = e.details.get("rating", 0)
+            delta.sessions += 1
+            delta.rating_sum += rating
+            rollup.add(e.at, sessions=1, rating_sum=rating)
+
+    return rows, state
+
+
+def log_events(db: Session, user_id: int, events: list[IncomingEvent], commit: bool = True) -> StatsDelta:
+    """
+    Record events for one user and update their research stats and rollups.
+    Derived sustained_attention / immediate_refocus rows are identical to
+    logging the same events one call at a time. Commits once (unless
+    commit=False, for callers that batch several users in one transaction).
+    """
+    events = sorted(events, key=lambda e: e.at)  # stable: keeps order of equal timestamps
+    delta = StatsDelta()
+    rollup = RollupBatch()
+    refocused: list[tuple[datetime, float]] = []
+
+    # Last focus_resumed / nudge_shown times: one primary-key read, not a history scan
+    initial = attention.load_state(db, user_id)
+    rows, state = derive_activity(user_id, events, initial, delta, rollup, refocused)
+
+    if rows:
+        db.execute(insert(models.UserActivity), rows)
+    apply_stats_delta(db, user_id, delta)
+    apply_rollups(db, user_id, rollup)
+    nudge_effects.record_refocus(db, user_id, refocused)
+    if state != initial:
+        attention.save_state(db, user_id, state)
+    if commit:
+        db.commit()
+    return delta
+
+
+# ─────────────────────────────
+# SYSTEM EVENTS (event_log)
+# ─────────────────────────────
+@dataclass(slots=True)
+class SystemEvent:
+    user_id: int
+    event_type: str
+    details: dict
+    at: datetime
+
+
+def log_system_events(db: Session, events: list[SystemEvent], commit: bool = True):
+    """
+    Bulk-insert EventLog rows. nudge_shown events also take their nudge out
+    of the user's unshown stock and count towards its shown_count.
+    """
+    if not events:
+        return
+    db.execute(
+        insert(models.EventLog),
+        [
+            {"user_id": e.user_id, "event_type": e.event_type, "details": e.details, "timestamp": e.at}
+            for e in events
+        ],
+    )
+    served: dict[int, RollupBatch] = {}
+    for e in events:
+        if e.event_type == "nudge_shown":
+            served.setdefault(e.user_id, RollupBatch()).add(e.at, nudges_served=1)
+        if e.event_type == "nudge_shown" and e.details.get("nudge_id"):
+            db.query(models.Nudge).filter(
+                models.Nudge.id == e.details["nudge_id"],
+                models.Nudge.user_id == e.user_id,
+            ).update(
+                {
+                    "shown_at": func.coalesce(models.Nudge.shown_at, e.at),
+                    "shown_count": models.Nudge.shown_count + 1,
+                },
+                synchronize_session=False,
+            )
+    for user_id, batch in served.items():
+        apply_rollups(db, user_id, batch)
+    if commit:
+        db.commit()
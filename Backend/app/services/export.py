@@ -0,0 +1,327 @@
+from __future__ import annotations
+import csv
+import io
+import json
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Iterator
+
+from itertools import islice
+from sqlalchemy import Column, select
+
+from app.database import models
+from app.database.db_setup import ReadSessionLocal, read_engine
+from app.services import retention
+
+try:  # Parquet output is optional
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# ─────────────────────────────
+# STREAMING RESEARCH EXPORT
+# ─────────────────────────────
+# Rows are read with keyset pagination on the primary key, EXPORT_CHUNK_SIZE
+# at a time, each chunk in its own short read transaction (on the read-only
+# engine when enabled). Memory stays flat whatever the table size, and no
+# read snapshot is held open long enough to stall writers or WAL checkpoints.
+#
+# event_log and user_activity are read through retention.iter_rows instead,
+# in (time, id) order across the hot table and every archived monthly
+# partition in range, unless the filter asks for hot rows only (a warning
+# names the archived months that skips).
+#
+# JSON columns (details / extra_data / context / metadata_json) are flattened
+# into "<column>.<key>" columns. CSV and Parquet need a fixed header, so for
+# them one extra keyset pass over the JSON column collects the keys first.
+#
+#   python -m app.services.export event_log --format csv --user 3 --since 2025-01-01 -o events.csv
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 2000
+FORMATS = ("ndjson", "csv", "parquet")
+
+
+@dataclass(frozen=True)
+class ExportSpec:
+    model: type
+    time_column: str
+    type_column: str | None = None
+    json_column: str | None = None
+
+
+EXPORTS: dict[str, ExportSpec] = {
+    "event_log": ExportSpec(models.EventLog, "timestamp", "event_type", "details"),
+    "user_activity": ExportSpec(models.UserActivity, "created_at", "activity_type", "extra_data"),
+    "nudges": ExportSpec(models.Nudge, "created_at", "type", "context"),
+    "ai_prompts": ExportSpec(models.AIPrompt, "created_at", "purpose", "metadata_json"),
+    "user_stats": ExportSpec(models.UserStats, "updated_at"),
+}
+
+
+@dataclass(frozen=True)
+class ExportFilter:
+    user_id: int | None = None
+    since: datetime | None = None
+    until: datetime | None = None
+    event_type: str | None = None
+    include_archive: bool = True  # event_log / user_activity: archived partitions too
+
+
+def available_formats() -> tuple[str, ...]:
+    return FORMATS if pa is not None else tuple(f for f in FORMATS if f != "parquet")
+
+
+# ─────────────────────────────
+# ROW ITERATION
+# ─────────────────────────────
+def _where(spec: ExportSpec, query, flt: ExportFilter):
+    table = spec.model.__table__
+    if flt.user_id is not None:
+        query = query.where(table.c.user_id == flt.user_id)
+    if flt.since is not None:
+        query = query.where(table.c[spec.time_column] >= flt.since)
+    if flt.until is not None:
+        query = query.where(table.c[spec.time_column] < flt.until)
+    if flt.event_type is not None and spec.type_column:
+        query = query.where(table.c[spec.type_column] == flt.event_type)
+    return query
+
+
+def skipped_archive(table: str, flt: ExportFilter) -> list[str]:
+    """Archived months in the filter's range that a hot-only export leaves out."""
+    if flt.include_archive or table not in retention.RETAINED:
+        return []
+    return retention.archived_in(table, flt.since, flt.until)
+
+
+def _chunks(spec: ExportSpec, columns: list[Column], flt: ExportFilter, chunk_size: int) -> Iterator[list]:
+    """
+    Keyset pages over the primary key, one short transaction per page; for
+    retained tables, chunk_size rows at a time of retention.iter_rows.
+    """
+    table = spec.model.__tablename__
+    if table in retention.RETAINED:
+        rows = retention.iter_rows(
+            table,
+            user_id=flt.user_id,
+            since=flt.since,
+            until=flt.until,
+            types=[flt.event_type] if flt.event_type is not None else None,
+            include_archive=flt.include_archive,
+            chunk_size=chunk_size,
+            bind=read_engine,
+        )
+        while chunk := list(islice(rows, chunk_size)):
+            yield chunk
+        return
+
+    pk = spec.model.__table__.c.id
+    last_id = None
+    while True:
+        query = _where(spec, select(*columns), flt)
+        if last_id is not None:
+            query = query.where(pk > last_id)
+        with ReadSessionLocal() as db:
+            rows = db.execute(query.order_by(pk).limit(chunk_size)).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def _flatten(value, prefix: str, out: dict):
+    if isinstance(value, dict):
+        for key, nested in value.items():
+            _flatten(nested, f"{prefix}.{key}", out)
+    elif isinstance(value, list):
+        out[prefix] = json.dumps(value, ensure_ascii=False)
+    else:
+        out[prefix] = value
+
+
+def _scalar(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def iter_records(table: str, flt: ExportFilter = ExportFilter(), chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[list[dict]]:
+    """Flattened records, one list per chunk."""
+    spec = EXPORTS[table]
+    columns = list(spec.model.__table__.columns)
+    for rows in _chunks(spec, columns, flt, chunk_size):
+        records = []
+        for row in rows:
+            record = {}
+            for column in columns:
+                value = getattr(row, column.name)
+                if column.name == spec.json_column:
+                    if value:
+                        _flatten(value, column.name, record)
+                else:
+                    record[column.name] = _scalar(value)
+            records.append(record)
+        yield records
+
+
+def header(table: str, flt: ExportFilter = ExportFilter(), chunk_size: int = EXPORT_CHUNK_SIZE) -> list[str]:
+    """Base columns plus every flattened JSON key present in the filtered rows."""
+    spec = EXPORTS[table]
+    table_columns = spec.model.__table__.c
+    names = [c.name for c in table_columns if c.name != spec.json_column]
+    if spec.json_column is None:
+        return names
+
+    keys: dict[str, None] = {}  # insertion-ordered set
+    for rows in _chunks(spec, [table_columns.id, table_columns[spec.json_column]], flt, chunk_size):
+        for row in rows:
+            flat: dict = {}
+            _flatten(row._mapping[spec.json_column] or {}, spec.json_column, flat)
+            keys.update(dict.fromkeys(flat))
+    return names + sorted(keys)
+
+
+# ─────────────────────────────
+# WRITERS (yield encoded chunks; the endpoint streams them, the CLI writes them)
+# ─────────────────────────────
+def stream_ndjson(table: str, flt: ExportFilter = ExportFilter()) -> Iterator[bytes]:
+    for records in iter_records(table, flt):
+        yield "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in records).encode("utf-8")
+
+
+def stream_csv(table: str, flt: ExportFilter = ExportFilter()) -> Iterator[bytes]:
+    fields = header(table, flt)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    for records in iter_records(table, flt):
+        writer.writerows(records)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def stream_parquet(table: str, flt: ExportFilter = ExportFilter()) -> Iterator[bytes]:
+    """One row group per chunk. Flattened JSON values are stored as strings."""
+    if pa is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+
+    spec = EXPORTS[table]
+    fields = header(table, flt)
+    base = {c.name: c for c in spec.model.__table__.columns}
+    schema = pa.schema([(name, _arrow_type(base.get(name))) for name in fields])
+
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for records in iter_records(table, flt):
+            columns = {
+                name: [_arrow_value(r.get(name), base.get(name)) for r in records]
+                for name in fields
+            }
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            yield sink.drain()
+    yield sink.drain()  # footer
+
+
+def _arrow_type(column: Column | None):
+    if column is None:
+        return pa.string()
+    python_type = _python_type(column)
+    if python_type is int:
+        return pa.int64()
+    if python_type is float:
+        return pa.float64()
+    if python_type is bool:
+        return pa.bool_()
+    return pa.string()
+
+
+def _arrow_value(value, column: Column | None):
+    if value is None:
+        return None
+    if column is None or _python_type(column) not in (int, float, bool):
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+def _python_type(column: Column):
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return str
+
+
+def stream(table: str, fmt: str, flt: ExportFilter = ExportFilter()) -> Iterator[bytes]:
+    if table not in EXPORTS:
+        raise ValueError(f"unknown table {table!r}; choose from {', '.join(EXPORTS)}")
+    skipped = skipped_archive(table, flt)
+    if skipped:
+        logger.warning("⚠️ Export of %s skips archived months %s (hot rows only)", table, ", ".join(skipped))
+    if fmt == "ndjson":
+        return stream_ndjson(table, flt)
+    if fmt == "csv":
+        return stream_csv(table, flt)
+    if fmt == "parquet":
+        return stream_parquet(table, flt)
+    raise ValueError(f"unknown format {fmt!r}; choose from {', '.join(FORMATS)}")
+
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Stream a research table to NDJSON, CSV or Parquet.")
+    parser.add_argument("table", choices=list(EXPORTS))
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--user", type=int, help="only this user_id")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="inclusive, UTC (e.g. 2025-01-01)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="exclusive, UTC")
+    parser.add_argument("--event-type", help="event_type / activity_type / nudge type / purpose")
+    parser.add_argument("--hot-only", action="store_true", help="event_log / user_activity: skip archived partitions")
+    parser.add_argument("-o", "--output", help="file path (default: stdout)")
+    args = parser.parse_args()
+
+    flt = ExportFilter(args.user, args.since, args.until, args.event_type, include_archive=not args.hot_only)
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for part in stream(args.table, args.format, flt):
+            out.write(part)
+    finally:
+        if args.output:
+            out.close()
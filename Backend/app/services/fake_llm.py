@@ -0,0 +1,171 @@
+from __future__ import annotations
+import asyncio
+import itertools
+import json
+import re
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+# ─────────────────────────────
+# FAKE LLM BACKEND (LLM_BACKEND=fake)
+# ─────────────────────────────
+# Drop-in stand-in for the OpenAI / AsyncOpenAI clients so the generation
+# pipeline (deck parsing, job workers, storage) runs locally and offline.
+# Replies are deterministic apart from a running counter that keeps messages
+# distinct across calls. With stream=True the reply arrives in STREAM_CHUNK_CHARS
+# pieces, the latency spread evenly across them like a real token stream.
+
+_NAME_RE = re.compile(r"نام کاربر:\s*(.+)")
+_counter = itertools.count(1)
+
+STREAM_CHUNK_CHARS = 24
+
+
+@dataclass
+class _Message:
+    content: str
+    role: str = "assistant"
+
+
+@dataclass
+class _Choice:
+    message: _Message
+    index: int = 0
+    finish_reason: str = "stop"
+
+
+@dataclass
+class _Usage:
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+
+
+@dataclass
+class FakeCompletion:
+    choices: list[_Choice]
+    usage: _Usage
+    model: str = "fake"
+
+
+@dataclass
+class _Delta:
+    content: str | None = None
+    role: str | None = None
+
+
+@dataclass
+class _ChunkChoice:
+    delta: _Delta
+    index: int = 0
+    finish_reason: str | None = None
+
+
+@dataclass
+class FakeChunk:
+    choices: list[_ChunkChoice]
+    usage: _Usage | None = None
+    model: str = "fake"
+
+
+def _user_name(messages: list[dict]) -> str:
+    for m in messages:
+        if m.get("role") == "user":
+            match = _NAME_RE.search(m.get("content", ""))
+            if match:
+                return match.group(1).strip()
+    return "دوست من"
+
+
+def fake_reply(messages: list[dict], deck: bool, deck_size: int = 8) -> str:
+    name = _user_name(messages)
+    n = next(_counter)
+    if not deck:
+        return f"{name}، هر دقیقه تمرین امروز تو را یک قدم به هدفت نزدیک‌تر می‌کند. (#{n})"
+
+    nudges = []
+    for i in range(deck_size):
+        if i % 2 == 0:
+            nudges.append({"type": "positive", "message": f"{name}، لحظه‌ی رسیدن به هدفت را تصور کن — آرام و سربلند. (#{n}.{i + 1})"})
+        else:
+            nudges.append({"type": "negative", "message": f"{name}، اگر امروز رها کنی، آن حس غرور کمی دورتر می‌رود. (#{n}.{i + 1})"})
+    return json.dumps({"user": name, "nudges": nudges}, ensure_ascii=False)
+
+
+def _completion(kwargs: dict) -> FakeCompletion:
+    messages = kwargs.get("messages", [])
+    deck = (kwargs.get("response_format") or {}).get("type") == "json_object"
+    content = fake_reply(messages, deck=deck)
+    prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+    completion_tokens = len(content) // 4
+    return FakeCompletion(
+        choices=[_Choice(message=_Message(content=content))],
+        usage=_Usage(prompt_tokens, completion_tokens, prompt_tokens + completion_tokens),
+    )
+
+
+def _chunks(completion: FakeCompletion, include_usage: bool) -> list[FakeChunk]:
+    content = completion.choices[0].message.content
+    chunks = [
+        FakeChunk([_ChunkChoice(_Delta(content[i:i + STREAM_CHUNK_CHARS]))])
+        for i in range(0, len(content), STREAM_CHUNK_CHARS)
+    ]
+    chunks.append(FakeChunk([_ChunkChoice(_Delta(), finish_reason="stop")]))
+    if include_usage:
+        chunks.append(FakeChunk([], usage=completion.usage))
+    return chunks
+
+
+def _stream_parts(kwargs: dict, latency: float) -> tuple[list[FakeChunk], float]:
+    include_usage = bool((kwargs.get("stream_options") or {}).get("include_usage"))
+    chunks = _chunks(_completion(kwargs), include_usage)
+    return chunks, latency / len(chunks)
+
+
+class _Completions:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def create(self, **kwargs):
+        if kwargs.get("stream"):
+            return self._stream(kwargs)
+        if self.latency:
+            time.sleep(self.latency)
+        return _completion(kwargs)
+
+    def _stream(self, kwargs: dict):
+        chunks, delay = _stream_parts(kwargs, self.latency)
+        for chunk in chunks:
+            if delay:
+                time.sleep(delay)
+            yield chunk
+
+
+class _AsyncCompletions:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def create(self, **kwargs):
+        if kwargs.get("stream"):
+            return self._stream(kwargs)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return _completion(kwargs)
+
+    async def _stream(self, kwargs: dict):
+        chunks, delay = _stream_parts(kwargs, self.latency)
+        for chunk in chunks:
+            if delay:
+                await asyncio.sleep(delay)
+            yield chunk
+
+
+class FakeOpenAI:
+    def __init__(self, latency: float = 0.0):
+        self.chat = SimpleNamespace(completions=_Completions(latency))
+
+
+class FakeAsyncOpenAI:
+    def __init__(self, latency: float = 0.0):
+        self.chat = SimpleNamespace(completions=_AsyncCompletions(latency))
@@ -0,0 +1,139 @@
+from __future__ import annotations
+import argparse
+import logging
+import socketserver
+import threading
+import time
+
+# ─────────────────────────────
+# FAKE REDIS (offline stand-in)
+# ─────────────────────────────
+# Speaks enough RESP for the cache's RedisBackend — PING, AUTH, SELECT, GET,
+# SET [PX ms] [NX], DEL, INCR — from an in-memory dict, so CACHE_BACKEND=redis
+# can be exercised (tests, several local workers) without a Redis server:
+#
+#     python -m app.services.fake_redis --port 6390
+#     CACHE_BACKEND=redis CACHE_REDIS_URL=redis://127.0.0.1:6390/0 uvicorn app.app:app --workers 4
+
+logger = logging.getLogger(__name__)
+
+
+def _bulk(value: bytes | None) -> bytes:
+    return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _Handler)
+        self._data: dict[bytes, tuple[float | None, bytes]] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self) -> "FakeRedisServer":
+        """Serve from a daemon thread (in-process tests)."""
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-redis", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    # ── Commands (hold the lock) ──
+    def _live(self, key: bytes) -> bytes | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def execute(self, args: list[bytes]) -> bytes:
+        name = args[0].upper()
+        with self._lock:
+            if name == b"PING":
+                return b"+PONG\r\n"
+            if name in (b"AUTH", b"SELECT"):
+                return b"+OK\r\n"
+            if name == b"GET":
+                return _bulk(self._live(args[1]))
+            if name == b"SET":
+                return self._set(args[1], args[2], [a.upper() for a in args[3:]], args[3:])
+            if name == b"DEL":
+                removed = 0
+                for key in args[1:]:
+                    if self._live(key) is not None:
+                        del self._data[key]
+                        removed += 1
+                return b":%d\r\n" % removed
+            if name == b"INCR":
+                current = self._live(args[1])
+                try:
+                    value = int(current or 0) + 1
+                except ValueError:
+                    return b"-ERR value is not an integer or out of range\r\n"
+                expires_at = self._data[args[1]][0] if current is not None else None
+                self._data[args[1]] = (expires_at, str(value).encode())
+                return b":%d\r\n" % value
+        return b"-ERR unknown command '%s'\r\n" % args[0]
+
+    def _set(self, key: bytes, value: bytes, flags: list[bytes], raw: list[bytes]) -> bytes:
+        expires_at = None
+        if b"PX" in flags:
+            expires_at = time.monotonic() + int(raw[flags.index(b"PX") + 1]) / 1000
+        elif b"EX" in flags:
+            expires_at = time.monotonic() + int(raw[flags.index(b"EX") + 1])
+        if b"NX" in flags and self._live(key) is not None:
+            return b"$-1\r\n"
+        self._data[key] = (expires_at, value)
+        return b"+OK\r\n"
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                args = self._read_command()
+            except (OSError, ValueError):
+                return
+            if not args:
+                return
+            self.wfile.write(self.server.execute(args))
+
+    def _read_command(self) -> list[bytes] | None:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()  # inline command (redis-cli, telnet)
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+
+if __name__ == "__main__":
+    from app.logging_config import configure_logging
+
+    parser = argparse.ArgumentParser(description="Local Redis stand-in for CACHE_BACKEND=redis")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    configure_logging(fmt="text")
+    server = FakeRedisServer(args.host, args.port)
+    logger.info("🧪 Fake Redis listening on %s", server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
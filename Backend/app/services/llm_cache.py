@@ -0,0 +1,127 @@
+from __future__ import annotations
+import hashlib
+import json
+import unicodedata
+
+from app.config import (
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_MEMORY_ENTRIES,
+    LLM_CACHE_TTL_SECONDS,
+)
+from app.services.cache import Cache, cache
+from app.services.ttl_cache import TTLCache
+
+# ─────────────────────────────
+# CONTENT-ADDRESSED LLM RESPONSE CACHE
+# ─────────────────────────────
+# Key = sha256 over everything that determines the completion: model, prompt
+# template version, generation mode, normalized EFT answers, name and goal.
+# Two tiers: a per-process LRU in front of the shared cache (namespace "llm",
+# so every worker — or host, with Redis — reuses a completion once it has been
+# paid for). Values never change for a key, so the per-process tier can only
+# lag a clear() made in another worker. Entries expire after LLM_CACHE_TTL_SECONDS.
+
+
+def _normalize(value) -> str:
+    if value is None:
+        return ""
+    text = unicodedata.normalize("NFC", str(value))
+    return " ".join(text.split())
+
+
+def cache_key(model: str, template_version: str, mode: str, eft_data: dict,
+              user_name: str, english_goal: str | None, sample: int = 0) -> str:
+    material = {
+        "model": model,
+        "template": template_version,
+        "mode": mode,
+        "sample": sample,
+        "name": _normalize(user_name),
+        "goal": _normalize(english_goal),
+        "eft": {k: _normalize(v) for k, v in sorted(eft_data.items()) if k.startswith("q")},
+    }
+    blob = json.dumps(material, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    NAMESPACE = "llm"
+
+    def __init__(
+        self,
+        shared: Cache = cache,
+        ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+        memory_entries: int = LLM_CACHE_MEMORY_ENTRIES,
+        enabled: bool = LLM_CACHE_ENABLED,
+    ):
+        self.shared = shared
+        self.ttl = ttl_seconds
+        self.enabled = enabled
+        self._memory = TTLCache(memory_entries, ttl_seconds)
+        self.counters = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+
+    def get(self, key: str, bypass: bool = False) -> str | None:
+        if not self.enabled:
+            return None
+        if bypass:
+            self.counters["bypassed"] += 1
+            return None
+
+        value = self._memory.get(key)
+        if value is not None:
+            self.counters["memory_hits"] += 1
+            return value
+
+        value = self.shared.get(self.NAMESPACE, key)
+        if value is not None:
+            self._memory.set(key, value)
+            self.counters["shared_hits"] += 1
+            return value
+
+        self.counters["misses"] += 1
+        return None
+
+    async def aget(self, key: str, bypass: bool = False) -> str | None:
+        """get() for async callers: the shared tier is read off the event loop."""
+        if not self.enabled or bypass:
+            return self.get(key, bypass)
+        value = self._memory.get(key)
+        if value is not None:
+            self.counters["memory_hits"] += 1
+            return value
+
+        value = await self.shared.aget(self.NAMESPACE, key)
+        if value is not None:
+            self._memory.set(key, value)
+            self.counters["shared_hits"] += 1
+            return value
+
+        self.counters["misses"] += 1
+        return None
+
+    async def aput(self, key: str, value: str):
+        if not self.enabled:
+            return
+        self._memory.set(key, value)
+        await self.shared.aset(self.NAMESPACE, key, value, self.ttl)
+        self.counters["stores"] += 1
+
+    def put(self, key: str, value: str):
+        if not self.enabled:
+            return
+        self._memory.set(key, value)
+        self.shared.set(self.NAMESPACE, key, value, self.ttl)
+        self.counters["stores"] += 1
+
+    def stats(self) -> dict:
+        lookups = self.counters["memory_hits"] + self.counters["shared_hits"] + self.counters["misses"]
+        hits = self.counters["memory_hits"] + self.counters["shared_hits"]
+        return {**self.counters, "hit_ratio": hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        """Forget every cached completion, in every worker."""
+        self._memory.clear()
+        self.shared.invalidate(self.NAMESPACE)
+
+
+llm_cache = LLMCache()
@@ -0,0 +1,254 @@
+from __future__ import annotations
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import cache
+from typing import Awaitable, Callable, TypeVar
+
+from app.config import (
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_RESET_SECONDS,
+    LLM_DEADLINE_SECONDS,
+    LLM_HEDGE_AFTER_SECONDS,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_SECONDS,
+)
+from app.services import metrics
+
+# ─────────────────────────────
+# RESILIENT LLM CALLS (deadline · retries · hedging · circuit breaker)
+# ─────────────────────────────
+# Every completion goes through call() (worker threads) or acall() (request
+# path). A generation gets one overall deadline; each attempt's timeout is
+# what is left of it, so retries can never stretch a request past the
+# deadline. Transient failures (timeouts, connection errors, 429, 5xx) are
+# retried with jittered exponential backoff; anything else is raised at once.
+# The OpenAI clients are built with max_retries=0 so retries are not
+# multiplied by the SDK's own.
+#
+# With LLM_HEDGE_AFTER_SECONDS set, acall() sends a duplicate request when the
+# first has not answered by then and takes whichever finishes first, trimming
+# the latency tail at the cost of some extra tokens.
+#
+# The breaker is shared by the process: after LLM_BREAKER_FAILURES transient
+# failures in a row it opens and every call fails fast with CircuitOpen, so
+# callers answer from stored nudges instead of waiting on a degraded provider.
+# After LLM_BREAKER_RESET_SECONDS one probe call is let through; its outcome
+# closes or re-opens the breaker.
+
+T = TypeVar("T")
+
+
+@cache
+def transient_errors() -> tuple[type[BaseException], ...]:
+    """
+    Errors worth retrying. Resolved on first use: `except` clauses evaluate
+    it only once something was raised, so importing this module does not
+    import the OpenAI SDK.
+    """
+    import httpx
+    import openai
+
+    return (
+        openai.APIConnectionError,  # includes APITimeoutError
+        openai.RateLimitError,
+        openai.InternalServerError,
+        httpx.TimeoutException,
+        httpx.TransportError,
+        asyncio.TimeoutError,
+        TimeoutError,
+    )
+
+
+class LLMUnavailable(Exception):
+    """No completion: breaker open, deadline spent or retries exhausted."""
+
+
+class CircuitOpen(LLMUnavailable):
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM circuit open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(LLMUnavailable):
+    pass
+
+
+class LLMBusy(LLMUnavailable):
+    """No request slot freed up in time (local back-pressure, not a provider failure)."""
+
+
+# ─────────────────────────────
+# CIRCUIT BREAKER
+# ─────────────────────────────
+class CircuitBreaker:
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.failures_to_open = failures
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    def _state(self, now: float) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if now - self._opened_at >= self.reset_seconds else "open"
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go out now (one probe at a time when half-open)."""
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(now)
+            if state == "closed":
+                return
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return
+            raise CircuitOpen(max(self._opened_at + self.reset_seconds - now, 1.0))
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failures_to_open:
+                if self._opened_at is None or self._probing:
+                    metrics.LLM_BREAKER_OPENED.inc()
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def release(self):
+        """The call ended without telling us anything about the provider."""
+        with self._lock:
+            self._probing = False
+
+
+breaker = CircuitBreaker()
+
+
+# ─────────────────────────────
+# CALLING
+# ─────────────────────────────
+def _backoff(retry: int) -> float:
+    return LLM_RETRY_BASE_SECONDS * (2 ** retry) * random.uniform(0.5, 1.0)
+
+
+def call(attempt: Callable[[float], T], kind: str, deadline: float = LLM_DEADLINE_SECONDS,
+         retries: int = LLM_MAX_RETRIES) -> T:
+    """
+    Run attempt(timeout) until it succeeds, a non-transient error is raised,
+    retries run out or the deadline passes. attempt must honour timeout
+    (pass it to the client); a blocked thread cannot be interrupted.
+    """
+    end = time.monotonic() + deadline
+    error: BaseException | None = None
+    for retry in range(retries + 1):
+        breaker.before_call()
+        remaining = end - time.monotonic()
+        try:
+            result = attempt(remaining)
+        except transient_errors() as e:
+            breaker.failure()
+            error = e
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            breaker.success()
+            return result
+        delay = _backoff(retry)
+        if retry == retries or time.monotonic() + delay >= end:
+            break
+        metrics.LLM_RETRIES.inc(kind=kind)
+        time.sleep(delay)
+    raise _give_up(kind, end, error)
+
+
+async def acall(attempt: Callable[[float], Awaitable[T]], kind: str, deadline: float = LLM_DEADLINE_SECONDS,
+                retries: int = LLM_MAX_RETRIES, hedge_after: float = LLM_HEDGE_AFTER_SECONDS) -> T:
+    """Async call(): the deadline is enforced, and attempts may be hedged."""
+    end = time.monotonic() + deadline
+    error: BaseException | None = None
+    for retry in range(retries + 1):
+        breaker.before_call()
+        remaining = end - time.monotonic()
+        try:
+            result = await asyncio.wait_for(_hedged(attempt, remaining, hedge_after, kind), remaining)
+        except transient_errors() as e:
+            breaker.failure()
+            error = e
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            breaker.success()
+            return result
+        delay = _backoff(retry)
+        if retry == retries or time.monotonic() + delay >= end:
+            break
+        metrics.LLM_RETRIES.inc(kind=kind)
+        await asyncio.sleep(delay)
+    raise _give_up(kind, end, error)
+
+
+def _give_up(kind: str, end: float, error: BaseException | None) -> LLMUnavailable:
+    expired = time.monotonic() >= end
+    metrics.LLM_GIVE_UPS.inc(kind=kind, reason="deadline" if expired else "retries")
+    exc = DeadlineExceeded(f"LLM deadline exceeded ({kind})") if expired else LLMUnavailable(f"LLM failed ({kind}): {error}")
+    exc.__cause__ = error
+    return exc
+
+
+async def _hedged(attempt: Callable[[float], Awaitable[T]], timeout: float, hedge_after: float, kind: str) -> T:
+    if not hedge_after or hedge_after >= timeout:
+        return await attempt(timeout)
+
+    tasks = [asyncio.ensure_future(attempt(timeout))]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if done:
+            return tasks[0].result()
+
+        metrics.LLM_HEDGES.inc(kind=kind, outcome="sent")
+        tasks.append(asyncio.ensure_future(attempt(timeout - hedge_after)))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is tasks[1]:
+                        metrics.LLM_HEDGES.inc(kind=kind, outcome="won")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@contextmanager
+def guarded():
+    """Breaker bookkeeping for a call that cannot be retried (streamed replies)."""
+    breaker.before_call()
+    try:
+        yield
+    except transient_errors():
+        breaker.failure()
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    else:
+        breaker.success()
@@ -0,0 +1,181 @@
+from __future__ import annotations
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+from app.config import LLM_MAX_CONCURRENCY, LLM_MAX_CONCURRENCY_PER_USER
+from app.services import metrics
+from app.services.llm_guard import LLMBusy
+
+# ─────────────────────────────
+# SINGLE-FLIGHT + LLM CONCURRENCY LIMITS
+# ─────────────────────────────
+# Double-taps, client retries and several devices can ask for the same
+# generation at once. SingleFlight (request path) and ThreadSingleFlight
+# (job workers) run one generation per key — user + EFT content — and hand
+# its result (or exception) to every concurrent caller.
+#
+# Every LLM request also takes a slot from `limiter`: at most
+# LLM_MAX_CONCURRENCY in the process and LLM_MAX_CONCURRENCY_PER_USER per
+# user. A caller waits for a slot no longer than its attempt timeout and then
+# gets LLMBusy (local back-pressure: it does not count against the circuit
+# breaker). The wait is recorded in llm_queue_seconds.
+
+T = TypeVar("T")
+
+
+# ─────────────────────────────
+# SINGLE-FLIGHT
+# ─────────────────────────────
+class SingleFlight:
+    """Concurrent awaiters of the same key share one execution (one event loop)."""
+
+    def __init__(self):
+        self._flights: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(fn())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._forget(key, done))
+            metrics.LLM_SINGLEFLIGHT.inc(outcome="leader")
+        else:
+            metrics.LLM_SINGLEFLIGHT.inc(outcome="shared")
+        # shield: a caller that disconnects does not cancel the others' result
+        return await asyncio.shield(flight)
+
+    def _forget(self, key: Hashable, flight: asyncio.Future):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+@dataclass
+class _Call:
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Any = None
+    error: BaseException | None = None
+
+
+class ThreadSingleFlight:
+    """SingleFlight for worker threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.LLM_SINGLEFLIGHT.inc(outcome="shared")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.LLM_SINGLEFLIGHT.inc(outcome="leader")
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+# ─────────────────────────────
+# CONCURRENCY LIMITER (shared by threads and the event loop)
+# ─────────────────────────────
+class ConcurrencyLimiter:
+    """
+    Global + per-user slot counts under one lock. Threads block on a
+    condition; coroutines poll with a short, growing sleep so a wait never
+    holds a threadpool worker.
+    """
+
+    def __init__(self, total: int = LLM_MAX_CONCURRENCY, per_user: int = LLM_MAX_CONCURRENCY_PER_USER):
+        self.total = total
+        self.per_user = per_user
+        self._cond = threading.Condition()
+        self._active = 0
+        self._by_user: dict[Hashable, int] = defaultdict(int)
+
+    def _try_acquire(self, user_id: Hashable | None) -> bool:
+        if self._active >= self.total:
+            return False
+        if user_id is not None and self._by_user[user_id] >= self.per_user:
+            return False
+        self._active += 1
+        if user_id is not None:
+            self._by_user[user_id] += 1
+        return True
+
+    def acquire(self, user_id: Hashable | None, timeout: float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self._try_acquire(user_id), timeout)
+
+    async def aacquire(self, user_id: Hashable | None, timeout: float) -> bool:
+        end = time.monotonic() + timeout
+        delay = 0.002
+        while True:
+            with self._cond:
+                if self._try_acquire(user_id):
+                    return True
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.05)
+
+    def release(self, user_id: Hashable | None):
+        with self._cond:
+            self._active -= 1
+            if user_id is not None:
+                self._by_user[user_id] -= 1
+                if not self._by_user[user_id]:
+                    del self._by_user[user_id]
+            self._cond.notify_all()
+
+    def in_flight(self) -> int:
+        return self._active
+
+    @contextmanager
+    def slot(self, user_id: Hashable | None, timeout: float, kind: str):
+        started = time.perf_counter()
+        acquired = self.acquire(user_id, timeout)
+        metrics.LLM_QUEUE_TIME.observe(time.perf_counter() - started, kind=kind)
+        if not acquired:
+            raise LLMBusy(f"no LLM slot within {timeout:.1f}s ({kind})")
+        try:
+            yield
+        finally:
+            self.release(user_id)
+
+    @asynccontextmanager
+    async def aslot(self, user_id: Hashable | None, timeout: float, kind: str):
+        started = time.perf_counter()
+        acquired = await self.aacquire(user_id, timeout)
+        metrics.LLM_QUEUE_TIME.observe(time.perf_counter() - started, kind=kind)
+        if not acquired:
+            raise LLMBusy(f"no LLM slot within {timeout:.1f}s ({kind})")
+        try:
+            yield
+        finally:
+            self.release(user_id)
+
+
+limiter = ConcurrencyLimiter()
+generations = SingleFlight()
+thread_generations = ThreadSingleFlight()
@@ -0,0 +1,305 @@
+from __future__ import annotations
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterable
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import SERVER_TIMING_ENABLED
+
+# ─────────────────────────────
+# IN-PROCESS METRICS (Prometheus text format)
+# ─────────────────────────────
+# Counters and histograms live in this process and are rendered by GET
+# /metrics. Each request also gets a RequestTiming (context variable) that
+# SQLAlchemy hooks, LLM calls and bcrypt add their time to; it feeds the
+# per-phase histograms and, with SERVER_TIMING_ENABLED, a Server-Timing
+# response header (db / llm / bcrypt / total), which browser devtools show
+# next to each request. With several worker processes every process keeps
+# its own numbers — scrape each one.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(label, "") for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_label_text(dict(zip(self.labels, key)))} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self._series: dict[tuple, list] = {}  # key → [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(label, "") for label in self.labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket{_label_text({**labels, 'le': bound})} {cumulative}"
+            yield f"{self.name}_bucket{_label_text({**labels, 'le': '+Inf'})} {series[-1]}"
+            yield f"{self.name}_sum{_label_text(labels)} {series[-2]}"
+            yield f"{self.name}_count{_label_text(labels)} {series[-1]}"
+
+
+_metrics: list[Counter | Histogram] = []
+# name → callable returning {label-tuple-or-(): value}; rendered as gauges
+_gauges: dict[str, tuple[str, tuple[str, ...], Callable[[], dict]]] = {}
+
+
+def counter(name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+    metric = Counter(name, help, labels)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+    metric = Histogram(name, help, labels, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def gauge(name: str, help: str, labels: tuple[str, ...], read: Callable[[], dict]):
+    """Register a gauge read at scrape time; read() maps label values → number."""
+    _gauges[name] = (help, labels, read)
+
+
+def render() -> str:
+    lines: list[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for name, (help, labels, read) in _gauges.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        try:
+            values = read()
+        except Exception:
+            continue
+        for key, value in values.items():
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{name}{_label_text(dict(zip(labels, key)))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ─────────────────────────────
+# METRICS
+# ─────────────────────────────
+HTTP_REQUESTS = counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+HTTP_LATENCY = histogram("http_request_duration_seconds", "HTTP request latency by route.", ("method", "route"))
+REQUEST_PHASE = histogram(
+    "http_request_phase_seconds", "Time spent per request in db / llm / bcrypt.", ("route", "phase")
+)
+DB_QUERIES = counter("db_queries_total", "SQL statements executed.", ("operation",))
+DB_QUERY_LATENCY = histogram("db_query_duration_seconds", "SQL statement latency.", ("operation",), QUERY_BUCKETS)
+DB_ERRORS = counter("db_errors_total", "SQL statements that raised.", ("operation",))
+LLM_CALLS = counter("llm_calls_total", "LLM completions by kind and outcome.", ("kind", "outcome"))
+LLM_LATENCY = histogram("llm_call_duration_seconds", "LLM completion latency.", ("kind",))
+LLM_FIRST_TOKEN = histogram("llm_time_to_first_token_seconds", "Streamed completions: time to first content.", ("kind",))
+LLM_TOKENS = counter("llm_tokens_total", "LLM tokens by kind and direction.", ("kind", "direction"))
+LLM_RETRIES = counter("llm_retries_total", "LLM attempts retried after a transient failure.", ("kind",))
+LLM_HEDGES = counter("llm_hedged_requests_total", "Hedged duplicate LLM requests sent / won.", ("kind", "outcome"))
+LLM_GIVE_UPS = counter("llm_give_ups_total", "LLM generations abandoned (deadline / retries).", ("kind", "reason"))
+LLM_BREAKER_OPENED = counter("llm_breaker_opened_total", "Times the LLM circuit breaker opened.")
+LLM_QUEUE_TIME = histogram("llm_queue_seconds", "Wait for an LLM request slot (global / per-user limits).", ("kind",))
+LLM_SINGLEFLIGHT = counter(
+    "llm_singleflight_total", "Generations started (leader) or joined by a concurrent caller (shared).", ("outcome",)
+)
+PROMPT_TOKENS = histogram(
+    "llm_prompt_tokens", "Locally counted prompt tokens per sent prompt (static prefix / variable block).",
+    ("template", "part"), (50, 100, 200, 400, 700, 1000, 1500, 2000, 3000, 5000),
+)
+PROMPT_TRUNCATIONS = counter("llm_prompt_truncations_total", "EFT fields cut to their token budget.", ("field",))
+
+
+# ─────────────────────────────
+# PER-REQUEST TIMING
+# ─────────────────────────────
+class RequestTiming:
+    __slots__ = ("phases",)
+
+    def __init__(self):
+        self.phases: dict[str, list] = {}  # phase → [count, seconds]
+
+    def add(self, phase: str, seconds: float):
+        entry = self.phases.setdefault(phase, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def server_timing(self, total: float) -> str:
+        parts = [
+            f'{phase};dur={seconds * 1000:.1f};desc="{count}x"'
+            for phase, (count, seconds) in self.phases.items()
+        ]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[RequestTiming | None] = ContextVar("request_timing", default=None)
+
+
+def add_timing(phase: str, seconds: float):
+    timing = _current.get()
+    if timing is not None:
+        timing.add(phase, seconds)
+
+
+@contextmanager
+def timed(phase: str):
+    """Attribute the enclosed block's wall time to phase for the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(phase, time.perf_counter() - started)
+
+
+class LLMCall:
+    def __init__(self, kind: str):
+        self.kind = kind
+
+    def usage(self, response):
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, kind=self.kind, direction="prompt")
+            LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, kind=self.kind, direction="completion")
+
+
+@contextmanager
+def llm_call(kind: str):
+    """Latency, outcome and token counts of one completion (sync or awaited inside)."""
+    call = LLMCall(kind)
+    started = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        LLM_CALLS.inc(kind=kind, outcome=type(e).__name__)
+        raise
+    else:
+        LLM_CALLS.inc(kind=kind, outcome="ok")
+    finally:
+        elapsed = time.perf_counter() - started
+        LLM_LATENCY.observe(elapsed, kind=kind)
+        add_timing("llm", elapsed)
+
+
+# ─────────────────────────────
+# SQLALCHEMY HOOKS (every engine, sync and async)
+# ─────────────────────────────
+def _operation(statement: str) -> str:
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return word if word in ("SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA", "WITH", "SAVEPOINT", "RELEASE") else "OTHER"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    operation = _operation(statement)
+    DB_QUERIES.inc(operation=operation)
+    DB_QUERY_LATENCY.observe(elapsed, operation=operation)
+    add_timing("db", elapsed)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    stack = context.connection.info.get("query_started") if context.connection is not None else None
+    if stack:
+        stack.pop()
+    DB_ERRORS.inc(operation=_operation(context.statement or ""))
+
+
+# ─────────────────────────────
+# ASGI MIDDLEWARE
+# ─────────────────────────────
+class MetricsMiddleware:
+    """
+    Per-route latency histogram and status counts. Routes are labelled by
+    their template (/nudges/next/{user_id}), never the raw path.
+    """
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING_ENABLED):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = _current.set(timing)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    header = timing.server_timing(time.perf_counter() - started)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", header.encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_LATENCY.observe(time.perf_counter() - started, method=method, route=route)
+            HTTP_REQUESTS.inc(method=method, route=route, status=status)
+            for phase, (_, seconds) in timing.phases.items():
+                REQUEST_PHASE.observe(seconds, route=route, phase=phase)
@@ -0,0 +1,191 @@
+from __future__ import annotations
+import logging
+import random
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from datetime import datetime
+from sqlalchemy import select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from app.database import models
+
+# ─────────────────────────────
+# PER-NUDGE EFFECTIVENESS INDEX
+# ─────────────────────────────
+# Each nudge row carries its own outcome counters, kept current as events
+# arrive:
+#
+#   shown_count          +1 per nudge_shown in event_log (log_system_events)
+#   refocus_count        +1 when the first focus_resumed after a nudge_shown
+#   refocus_latency_sum  comes within REFOCUS_WINDOW_SECONDS (log_events)
+#
+# The refocus is credited to the nudge served last at the time of the
+# refocus: the latest nudge_shown in event_log at or before it, one lookup on
+# ix_event_user_type_time per credited refocus. rebuild applies the same rule
+# to the full history. Adaptive selection then reads the deck's counters with
+# one indexed query and samples in memory (pick_thompson).
+#
+# Rebuild from history: python -m app.services.nudge_effects [user_id ...]
+
+Nudge = models.Nudge
+
+
+def served_at(db: Session, user_id: int, at: datetime) -> int | None:
+    """Id of the nudge served last at time `at` (None: none served, or no id logged)."""
+    E = models.EventLog
+    details = db.scalar(
+        select(E.details)
+        .where(E.user_id == user_id, E.event_type == "nudge_shown", E.timestamp <= at)
+        .order_by(E.timestamp.desc(), E.id.desc())
+        .limit(1)
+    )
+    nudge_id = (details or {}).get("nudge_id")
+    return nudge_id if isinstance(nudge_id, int) else None
+
+
+def record_refocus(db: Session, user_id: int, refocuses: list[tuple[datetime, float]]):
+    """Credit (time, latency) refocus outcomes to the nudge served at that time (no commit)."""
+    count, latency_sum = Counter(), Counter()
+    for at, latency in refocuses:
+        nudge_id = served_at(db, user_id, at)
+        if nudge_id is not None:
+            count[nudge_id] += 1
+            latency_sum[nudge_id] += latency
+    for nudge_id in count:
+        db.execute(
+            update(Nudge)
+            .where(Nudge.id == nudge_id, Nudge.user_id == user_id)
+            .values(
+                refocus_count=Nudge.refocus_count + count[nudge_id],
+                refocus_latency_sum=Nudge.refocus_latency_sum + latency_sum[nudge_id],
+            )
+        )
+
+
+# ─────────────────────────────
+# SELECTION
+# ─────────────────────────────
+def sample_rate(shown: int, refocused: int) -> float:
+    """One draw from the Beta(1 + refocused, 1 + misses) posterior of the refocus rate."""
+    return random.betavariate(1 + refocused, 1 + max(shown - refocused, 0))
+
+
+def pick_thompson(db: Session, user_id: int, exclude: int | None = None) -> Row | None:
+    """
+    (id, text) of the nudge with the best sampled refocus rate, skipping
+    `exclude` (the one on screen) when there is a choice. Unproven nudges
+    draw from Beta(1, 1), so new stock keeps getting tried.
+    """
+    arms = db.execute(
+        select(Nudge.id, Nudge.shown_count, Nudge.refocus_count).where(Nudge.user_id == user_id)
+    ).all()
+    if len(arms) > 1:
+        arms = [a for a in arms if a.id != exclude]
+    if not arms:
+        return None
+    best = max(arms, key=lambda a: sample_rate(a.shown_count, a.refocus_count))
+    return db.execute(select(Nudge.id, Nudge.text).where(Nudge.id == best.id)).first()
+
+
+def effects(db: Session, user_id: int) -> list[dict]:
+    """The user's deck with its counters, best observed refocus rate first."""
+    rows = db.execute(
+        select(Nudge.id, Nudge.text, Nudge.shown_count, Nudge.refocus_count, Nudge.refocus_latency_sum)
+        .where(Nudge.user_id == user_id)
+    ).all()
+    out = [
+        {
+            "nudge_id": r.id,
+            "text": r.text,
+            "shown": r.shown_count,
+            "refocused": r.refocus_count,
+            "refocus_rate": (1 + r.refocus_count) / (2 + r.shown_count),  # posterior mean
+            "avg_refocus_latency": r.refocus_latency_sum / r.refocus_count if r.refocus_count else None,
+        }
+        for r in rows
+    ]
+    return sorted(out, key=lambda e: e["refocus_rate"], reverse=True)
+
+
+# ─────────────────────────────
+# REBUILD
+# ─────────────────────────────
+def _credited(nudges: list, focuses: list, window: float) -> list[tuple[int, float]]:
+    """
+    (index into focuses, latency) of each nudge whose first following
+    focus_resumed is within the window and precedes the next nudge — the
+    same refocuses log_events credits, found with binary searches over the
+    sorted timestamp columns instead of a replay.
+    """
+    out = []
+    for i, shown in enumerate(nudges):
+        j = bisect_left(focuses, shown)
+        if j == len(focuses):
+            break
+        if i + 1 < len(nudges) and focuses[j] >= nudges[i + 1]:
+            continue
+        latency = (focuses[j] - shown).total_seconds()
+        if latency <= window:
+            out.append((j, latency))
+    return out
+
+
+def rebuild(db: Session, user_id: int, chunk_size: int = 5000) -> int:
+    """
+    Recompute the counters of a user's nudges from event_log and
+    user_activity (hot and archived partitions). Commits; returns the number
+    of events read.
+    """
+    from app.services.event_service import REFOCUS_WINDOW_SECONDS
+    from app.services.retention import iter_rows
+
+    # Serve timeline: (time, nudge_id) columns; None for serves logged without an id
+    served_times, served_id = [], []
+    for row in iter_rows("event_log", user_id=user_id, types=("nudge_shown",), chunk_size=chunk_size):
+        nudge_id = (row.details or {}).get("nudge_id")
+        if row.timestamp is not None:
+            served_times.append(row.timestamp.replace(tzinfo=None))
+            served_id.append(nudge_id if isinstance(nudge_id, int) else None)
+
+    columns = defaultdict(list)
+    for row in iter_rows(
+        "user_activity", user_id=user_id, types=("nudge_shown", "focus_resumed"), chunk_size=chunk_size
+    ):
+        columns[row.activity_type].append(row.created_at.replace(tzinfo=None))
+
+    shown = Counter(i for i in served_id if i is not None)
+    refocused, latency_sum = Counter(), Counter()
+    focuses = columns["focus_resumed"]
+    for j, latency in _credited(columns["nudge_shown"], focuses, REFOCUS_WINDOW_SECONDS):
+        k = bisect_right(served_times, focuses[j]) - 1  # nudge served at the time of the refocus (served_at)
+        if k >= 0 and served_id[k] is not None:
+            refocused[served_id[k]] += 1
+            latency_sum[served_id[k]] += latency
+
+    deck = db.scalars(select(Nudge.id).where(Nudge.user_id == user_id)).all()
+    if deck:
+        db.execute(update(Nudge), [
+            {
+                "id": nudge_id,
+                "shown_count": shown[nudge_id],
+                "refocus_count": refocused[nudge_id],
+                "refocus_latency_sum": latency_sum[nudge_id],
+            }
+            for nudge_id in deck
+        ])
+    db.commit()
+    return len(served_times) + sum(len(c) for c in columns.values())
+
+
+if __name__ == "__main__":
+    # python -m app.services.nudge_effects [user_id ...]  → rebuild from history
+    import sys
+    from app.database.db_setup import SessionLocal
+    from app.logging_config import configure_logging
+    configure_logging(fmt="text")
+
+    with SessionLocal() as db:
+        user_ids = [int(a) for a in sys.argv[1:]] or [uid for (uid,) in db.query(models.User.id)]
+        total = sum(rebuild(db, uid) for uid in user_ids)
+    logging.getLogger(__name__).info("✅ Rebuilt nudge effectiveness for %d users (%d events)", len(user_ids), total)
@@ -0,0 +1,311 @@
+from __future__ import annotations
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_, and_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import (
+    NUDGE_JOB_LEASE_SECONDS,
+    NUDGE_JOB_MAX_ATTEMPTS,
+    NUDGE_JOB_RETRY_BASE_SECONDS,
+    NUDGE_LOW_WATERMARK,
+    NUDGE_WORKER_POLL_SECONDS,
+    NUDGE_WORKERS,
+)
+from app.database import crud, models
+from app.database.db_setup import SessionLocal
+from app.services import llm_limits
+from app.services.ai_service import generate_nudge_deck
+from app.services.llm_guard import CircuitOpen
+
+# ─────────────────────────────
+# NUDGE GENERATION JOB QUEUE
+# ─────────────────────────────
+# Request handlers never call the LLM: they enqueue a job and serve from the
+# user's existing stock. Workers claim jobs with a time-limited lease, so a
+# crashed worker's job is picked up again once the lease expires. The partial
+# unique index on nudge_jobs.dedup_key keeps at most one active job per key.
+
+Job = models.NudgeJob
+logger = logging.getLogger(__name__)
+
+
+def _refill_key(user_id: int) -> str:
+    return f"refill:{user_id}"
+
+
+def enqueue(db: Session, user_id: int, kind: str, dedup_key: str, payload: dict | None = None) -> bool:
+    """
+    Add a job unless an active one with the same dedup_key exists.
+    Commits; returns True when a new job was queued.
+    """
+    exists = (
+        db.query(Job.id)
+        .filter(Job.dedup_key == dedup_key, Job.status.in_(("pending", "running")))
+        .first()
+    )
+    if exists:
+        return False
+
+    db.add(Job(
+        user_id=user_id,
+        kind=kind,
+        dedup_key=dedup_key,
+        payload=payload,
+        max_attempts=NUDGE_JOB_MAX_ATTEMPTS,
+    ))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Lost the race to another enqueuer — same outcome
+        db.rollback()
+        return False
+    return True
+
+
+def enqueue_eft_submit(db: Session, user_id: int, eft_id: int, fresh: bool = False) -> bool:
+    """
+    Generate a deck from a just-submitted EFT, whatever the stock level.
+    fresh=True bypasses the LLM response cache.
+    """
+    return enqueue(db, user_id, "eft_submit", f"eft:{user_id}:{eft_id}", {"eft_id": eft_id, "fresh": fresh})
+
+
+def unshown_count(db: Session, user_id: int) -> int:
+    return (
+        db.query(func.count(models.Nudge.id))
+        .filter(models.Nudge.user_id == user_id, models.Nudge.shown_at.is_(None))
+        .scalar()
+    )
+
+
+def ensure_inventory(db: Session, user_id: int) -> bool:
+    """
+    Queue a refill when the user's unshown stock is below the low watermark.
+    Returns True when a job was queued.
+    """
+    if unshown_count(db, user_id) >= NUDGE_LOW_WATERMARK:
+        return False
+    return enqueue(db, user_id, "refill", _refill_key(user_id))
+
+
+# ─────────────────────────────
+# CLAIM / COMPLETE / RETRY
+# ─────────────────────────────
+def _claimable(now: datetime):
+    return or_(
+        and_(Job.status == "pending", Job.run_after <= now),
+        and_(Job.status == "running", Job.lease_until < now),  # expired lease
+    )
+
+
+def claim_next(db: Session, worker_id: str) -> int | None:
+    """
+    Lease the oldest claimable job to worker_id. The conditional UPDATE makes
+    the claim atomic: if another worker got there first, try the next one.
+    """
+    now = datetime.utcnow()
+    candidates = (
+        db.query(Job.id)
+        .filter(_claimable(now))
+        .order_by(Job.id)
+        .limit(5)
+        .all()
+    )
+    for (job_id,) in candidates:
+        result = db.execute(
+            update(Job)
+            .where(Job.id == job_id, _claimable(now))
+            .values(
+                status="running",
+                lease_owner=worker_id,
+                lease_until=now + timedelta(seconds=NUDGE_JOB_LEASE_SECONDS),
+                attempts=Job.attempts + 1,
+                updated_at=now,
+            )
+        )
+        db.commit()
+        if result.rowcount == 1:
+            return job_id
+    return None
+
+
+def _release(db: Session, job: Job, worker_id: str, **values) -> bool:
+    """
+    Update the job and drop its lease, only while worker_id still holds it:
+    once a lease expires another worker may have re-claimed the job, and a
+    late finish must not overwrite that run. Commits; False when the lease was lost.
+    """
+    moved = db.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.lease_owner == worker_id)
+        .values(lease_owner=None, lease_until=None, updated_at=datetime.utcnow(), **values)
+    ).rowcount
+    db.commit()
+    if not moved:
+        logger.warning(
+            "⚠️ Nudge job %s: lease of %s expired and was taken over, result not recorded", job.id, worker_id,
+            extra={"user_id": job.user_id, "job_id": job.id},
+        )
+    return bool(moved)
+
+
+def _finish(db: Session, job: Job, worker_id: str, status: str, error: str | None = None) -> bool:
+    return _release(db, job, worker_id, status=status, last_error=error)
+
+
+def _retry_or_fail(db: Session, job: Job, worker_id: str, error: str):
+    if job.attempts >= job.max_attempts:
+        if _finish(db, job, worker_id, "failed", error):
+            logger.error(
+                "❌ Nudge job %s failed after %d attempts: %s", job.id, job.attempts, error,
+                extra={"user_id": job.user_id, "job_id": job.id},
+            )
+        return
+    backoff = NUDGE_JOB_RETRY_BASE_SECONDS * (2 ** (job.attempts - 1))
+    run_after = datetime.utcnow() + timedelta(seconds=backoff)
+    if _release(db, job, worker_id, status="pending", run_after=run_after, last_error=error):
+        logger.warning(
+            "⚠️ Nudge job %s attempt %d failed, retrying in %.0fs: %s", job.id, job.attempts, backoff, error,
+            extra={"user_id": job.user_id, "job_id": job.id},
+        )
+
+
+def _defer(db: Session, job: Job, worker_id: str, seconds: float):
+    """Put the job back without spending an attempt (the LLM is known to be down)."""
+    run_after = datetime.utcnow() + timedelta(seconds=seconds)
+    if _release(db, job, worker_id, status="pending", attempts=max(job.attempts - 1, 0), run_after=run_after):
+        logger.info(
+            "⏸️ Nudge job %s deferred %.0fs: LLM circuit open", job.id, seconds,
+            extra={"user_id": job.user_id, "job_id": job.id},
+        )
+
+
+# ─────────────────────────────
+# JOB EXECUTION
+# ─────────────────────────────
+def run_job(db: Session, job: Job) -> int:
+    """Generate and store a deck for the job's user. Returns nudges saved."""
+    if job.kind == "refill" and unshown_count(db, job.user_id) >= NUDGE_LOW_WATERMARK:
+        return 0  # stock was topped up by another job meanwhile
+
+    eft = None
+    if job.payload and job.payload.get("eft_id"):
+        eft = db.get(models.EFTResponse, job.payload["eft_id"])
+    eft = eft or crud.latest_eft(db, job.user_id)
+    if eft is None:
+        return 0  # nothing to personalize from yet
+
+    user = db.get(models.User, job.user_id)
+    if user is None:
+        return 0
+
+    # Refills exist to add variety, so they always skip the response cache
+    fresh = job.kind == "refill" or bool((job.payload or {}).get("fresh"))
+    eft_data = crud.eft_to_dict(eft)
+    # Workers picking up jobs for the same user and answers share one completion;
+    # each still saves through its own session (duplicates are skipped there)
+    prompt, raw, deck = llm_limits.thread_generations.do(
+        (job.user_id, crud.eft_digest(eft_data), fresh),
+        lambda: generate_nudge_deck(
+            eft_data,
+            user_name=user.full_name_fa or user.username,
+            english_goal=user.english_goal,
+            fresh=fresh,
+            user_id=job.user_id,
+        ),
+    )
+    if not deck:
+        raise ValueError(f"unparseable deck: {raw[:80]!r}")
+    return len(crud.save_nudge_deck(db, job.user_id, prompt, raw, deck))
+
+
+def process_job(job_id: int, worker_id: str):
+    """Run a job leased to worker_id and record the outcome (if the lease still holds)."""
+    db = SessionLocal()
+    try:
+        job = db.get(Job, job_id)
+        if job is None:
+            return
+        try:
+            saved = run_job(db, job)
+        except CircuitOpen as e:
+            db.rollback()
+            _defer(db, job, worker_id, e.retry_after)
+            return
+        except Exception as e:
+            db.rollback()
+            _retry_or_fail(db, job, worker_id, str(e))
+            return
+        if _finish(db, job, worker_id, "done") and saved:
+            logger.info(
+                "✅ Nudge job %s (%s) stored %d nudges for user %s", job.id, job.kind, saved, job.user_id,
+                extra={"user_id": job.user_id, "job_id": job.id},
+            )
+    finally:
+        db.close()
+
+
+def work_once(worker_id: str) -> bool:
+    """Claim and run a single job. Returns False when the queue was empty."""
+    db = SessionLocal()
+    try:
+        job_id = claim_next(db, worker_id)
+    finally:
+        db.close()
+    if job_id is None:
+        return False
+    process_job(job_id, worker_id)
+    return True
+
+
+# ─────────────────────────────
+# WORKER POOL
+# ─────────────────────────────
+class NudgeWorkerPool:
+    def __init__(self, size: int = NUDGE_WORKERS, poll_interval: float = NUDGE_WORKER_POLL_SECONDS):
+        self.size = size
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self):
+        for i in range(self.size):
+            worker_id = f"{self._prefix}:{i}"
+            t = threading.Thread(target=self._run, args=(worker_id,), name=f"nudge-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        if self.size:
+            logger.info("🧵 Started %d nudge workers", self.size)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads.clear()
+
+    def _run(self, worker_id: str):
+        while not self._stop.is_set():
+            try:
+                if work_once(worker_id):
+                    continue
+            except Exception as e:
+                logger.exception("⚠️ Nudge worker %s error: %s", worker_id, e)
+            self._stop.wait(self.poll_interval)
+
+
+if __name__ == "__main__":
+    # Standalone workers: python -m app.services.nudge_jobs
+    from app.logging_config import configure_logging
+    configure_logging()
+    pool = NudgeWorkerPool(size=max(NUDGE_WORKERS, 1))
+    pool.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pool.stop()
@@ -0,0 +1,103 @@
+from __future__ import annotations
+import json
+import re
+
+# ─────────────────────────────
+# NUDGE DECK PARSING
+# ─────────────────────────────
+# The model is asked for {"user": ..., "nudges": [{"type", "message"}, ...]},
+# but replies can arrive wrapped in code fences, cut off by max_tokens, or
+# (while streaming) only partially received. The scanner below pulls out every
+# nudge object that is complete and ignores a trailing partial one.
+
+NUDGE_TYPES = ("positive", "negative")
+
+_decoder = json.JSONDecoder()
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+_NUDGES_KEY_RE = re.compile(r'"nudges"\s*:\s*\[')
+
+
+def strip_fences(raw: str) -> str:
+    return _FENCE_RE.sub("", (raw or "").strip())
+
+
+def scan_complete_nudges(text: str) -> list[dict]:
+    """
+    Return the nudge objects that are fully present in `text`, in order.
+    Works on truncated or still-streaming JSON.
+    """
+    match = _NUDGES_KEY_RE.search(text)
+    if match:
+        pos = match.end()
+    else:
+        # Bare array reply
+        pos = text.find("[")
+        if pos < 0:
+            return []
+        pos += 1
+
+    items = []
+    length = len(text)
+    while pos < length:
+        ch = text[pos]
+        if ch in " \t\r\n,":
+            pos += 1
+            continue
+        if ch != "{":
+            break
+        try:
+            obj, pos = _decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            break  # truncated object — stop at the last complete one
+        items.append(obj)
+    return items
+
+
+def validate_nudges(items: list) -> list[dict]:
+    """
+    Keep well-formed nudges only: known type, non-empty message, no duplicates.
+    """
+    seen = set()
+    nudges = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        message = item.get("message")
+        if not isinstance(message, str) or not message.strip():
+            continue
+        message = message.strip()
+        nudge_type = str(item.get("type", "")).strip().lower()
+        if nudge_type not in NUDGE_TYPES:
+            nudge_type = "positive"
+        if message in seen:
+            continue
+        seen.add(message)
+        nudges.append({"type": nudge_type, "message": message})
+    return nudges
+
+
+def parse_nudge_deck(raw: str) -> list[dict]:
+    """
+    Parse a model reply into a validated list of {"type", "message"} dicts.
+    Falls back to scanning (repair) when the reply is not valid JSON, and to a
+    single positive nudge when the model answered in plain text.
+    """
+    text = strip_fences(raw)
+    if not text:
+        return []
+
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = None
+
+    if isinstance(data, dict):
+        items = data.get("nudges") or []
+    elif isinstance(data, list):
+        items = data
+    elif text[0] in "{[":
+        items = scan_complete_nudges(text)
+    else:
+        items = [{"type": "positive", "message": text}]
+
+    return validate_nudges(items)
@@ -0,0 +1,155 @@
+from __future__ import annotations
+from datetime import datetime
+from sqlalchemy import select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import NUDGE_SELECTION_MODE
+from app.database import models
+from app.services import nudge_effects
+from app.services.event_service import SystemEvent, log_system_events
+
+# ─────────────────────────────
+# PER-USER NUDGE ROTATION
+# ─────────────────────────────
+# Each user has one nudge_rotation row holding the id of the last nudge
+# served. The next nudge is a keyset lookup on ix_nudge_user_id ("first id
+# above the cursor", else wrap to the smallest), and the cursor moves with a
+# compare-and-swap UPDATE, so concurrent requests never serve off a stale
+# cursor. Serving costs the same handful of indexed lookups whatever the size
+# of the deck or of event_log.
+#
+# With NUDGE_SELECTION_MODE=thompson the next nudge is drawn from the deck's
+# effectiveness counters instead (services.nudge_effects): one indexed read
+# of the deck, no event history. The cursor still records the nudge served.
+#
+# A serve is counted once, by its nudge_shown entry in event_log (shown_count,
+# nudges_served rollup). serve_next writes it; the client's own report of the
+# nudge it displayed (POST /events/nudge_shown) only counts when it is not the
+# nudge the cursor already points at (see report_shown).
+
+Nudge = models.Nudge
+Rotation = models.NudgeRotation
+
+# Concurrent requests for the same user retry the swap this many times
+MAX_ADVANCE_ATTEMPTS = 5
+
+
+def _seed_cursor(db: Session, user_id: int) -> int:
+    """Continue from the last nudge_shown event of users served before rotation rows existed."""
+    details = db.scalar(
+        select(models.EventLog.details)
+        .where(models.EventLog.user_id == user_id, models.EventLog.event_type == "nudge_shown")
+        .order_by(models.EventLog.timestamp.desc(), models.EventLog.id.desc())
+        .limit(1)
+    )
+    nudge_id = (details or {}).get("nudge_id")
+    return nudge_id if isinstance(nudge_id, int) else 0
+
+
+def _cursor(db: Session, user_id: int) -> int | None:
+    return db.scalar(select(Rotation.cursor_nudge_id).where(Rotation.user_id == user_id))
+
+
+def _create(db: Session, user_id: int, nudge_id: int) -> bool:
+    """First serve for this user. False when another request created the row first."""
+    try:
+        with db.begin_nested():
+            db.add(Rotation(user_id=user_id, cursor_nudge_id=nudge_id, served_count=1))
+    except IntegrityError:
+        return False
+    return True
+
+
+def _next_after(db: Session, user_id: int, cursor: int) -> Row | None:
+    columns = select(Nudge.id, Nudge.text).where(Nudge.user_id == user_id).order_by(Nudge.id).limit(1)
+    row = db.execute(columns.where(Nudge.id > cursor)).first()
+    if row is None and cursor:
+        row = db.execute(columns).first()  # wrap around
+    return row
+
+
+def _select(db: Session, user_id: int, cursor: int) -> Row | None:
+    if NUDGE_SELECTION_MODE == "thompson":
+        return nudge_effects.pick_thompson(db, user_id, exclude=cursor)
+    return _next_after(db, user_id, cursor)
+
+
+def advance(db: Session, user_id: int) -> Row | None:
+    """
+    Move the user's cursor to their next nudge and return its (id, text).
+    None when the user has no nudges. Does not commit.
+    """
+    row = None
+    for _ in range(MAX_ADVANCE_ATTEMPTS):
+        cursor = _cursor(db, user_id)
+        row = _select(db, user_id, _seed_cursor(db, user_id) if cursor is None else cursor)
+        if row is None:
+            return None
+        if cursor is None:
+            if _create(db, user_id, row.id):
+                return row
+            continue
+        moved = db.execute(
+            update(Rotation)
+            .where(Rotation.user_id == user_id, Rotation.cursor_nudge_id == cursor)
+            .values(cursor_nudge_id=row.id, served_count=Rotation.served_count + 1)
+        ).rowcount
+        if moved:
+            return row
+    # Still contended: serving the same nudge twice is harmless
+    return row
+
+
+def serve_next(db: Session, user_id: int) -> Row | None:
+    """advance() plus the nudge_shown log entry, in one commit."""
+    row = advance(db, user_id)
+    if row is None:
+        return None
+    now = datetime.utcnow()
+    log_system_events(
+        db,
+        [SystemEvent(user_id, "nudge_shown", {"nudge_id": row.id, "timestamp": now.isoformat()}, now)],
+        commit=False,
+    )
+    db.commit()
+    return row
+
+
+def report_shown(db: Session, user_id: int, nudge_id: int) -> bool | None:
+    """
+    A client reports showing one of the user's nudges. False when it is the
+    cursor's nudge (already counted by serve_next, or a repeated report);
+    otherwise moves the cursor to it and returns True: the caller logs the
+    nudge_shown. None when the nudge is not the user's. Commits.
+    """
+    owned = db.scalar(select(Nudge.id).where(Nudge.id == nudge_id, Nudge.user_id == user_id))
+    if owned is None:
+        return None
+    for _ in range(MAX_ADVANCE_ATTEMPTS):
+        cursor = _cursor(db, user_id)
+        if cursor == nudge_id:
+            return False
+        if cursor is None:
+            moved = _create(db, user_id, nudge_id)
+        else:
+            moved = db.execute(
+                update(Rotation)
+                .where(Rotation.user_id == user_id, Rotation.cursor_nudge_id == cursor)
+                .values(cursor_nudge_id=nudge_id, served_count=Rotation.served_count + 1)
+            ).rowcount
+        if moved:
+            db.commit()
+            return True
+    # Still contended: count it rather than lose a display
+    return True
+
+
+def bump_deck_version(db: Session, user_id: int):
+    """Record that the user's deck changed (no commit; no-op before first serve)."""
+    db.execute(
+        update(Rotation)
+        .where(Rotation.user_id == user_id)
+        .values(deck_version=Rotation.deck_version + 1)
+    )
@@ -0,0 +1,133 @@
+from __future__ import annotations
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+from app.config import BCRYPT_ROUNDS, PASSWORD_POOL_MAX_PENDING, PASSWORD_POOL_WORKERS
+
+# ─────────────────────────────
+# PASSWORD HASHING POOL
+# ─────────────────────────────
+# bcrypt is deliberately slow (~250 ms of CPU at cost 12). Run on request
+# threads, a login storm takes every threadpool worker and CPU core the
+# event ingestion path also needs. /auth hashes and verifies in a small
+# ProcessPoolExecutor of PASSWORD_POOL_WORKERS processes instead, so at most
+# that many cores ever go to bcrypt; the request only awaits the result. At
+# most PASSWORD_POOL_MAX_PENDING jobs may be queued or running, beyond that
+# PasswordPoolBusy is raised and the route answers 503 + Retry-After.
+#
+# Workers are spawned (not forked: the server process already runs threads)
+# and import only this module, so each is cheap to start. As with any spawn
+# pool, a script that runs the app in-process needs the __main__ guard.
+#
+# The context pins min/max rounds to BCRYPT_ROUNDS, so a stored hash of any
+# other cost "needs update" and verify() hands back its replacement.
+
+logger = logging.getLogger(__name__)
+
+# passlib 1.7.4 reads bcrypt.__about__, which bcrypt >= 4.1 no longer has, and
+# logs the (harmless, trapped) AttributeError with a traceback on first use
+logging.getLogger("passlib.handlers.bcrypt").setLevel(logging.ERROR)
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordPoolBusy(Exception):
+    """Too many hash jobs pending; the caller should retry shortly."""
+
+
+# ─────────────────────────────
+# IN-PROCESS (worker side, CLI scripts)
+# ─────────────────────────────
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(password: str, hashed: str) -> tuple[bool, str | None]:
+    """(matches, replacement hash when the stored one has another cost)."""
+    if not hashed:
+        return False, None
+    try:
+        return pwd_context.verify_and_update(password, hashed)
+    except ValueError:  # not a hash this context knows
+        return False, None
+
+
+# ─────────────────────────────
+# POOL (request side)
+# ─────────────────────────────
+_lock = threading.Lock()
+_pool: ProcessPoolExecutor | None = None
+_pending = 0
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PASSWORD_POOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info("🔐 Password pool started (%d workers, cost %d)", PASSWORD_POOL_WORKERS, BCRYPT_ROUNDS)
+        return _pool
+
+
+def pending() -> int:
+    return _pending
+
+
+async def _run(fn, *args):
+    global _pending
+    with _lock:
+        if _pending >= PASSWORD_POOL_MAX_PENDING:
+            raise PasswordPoolBusy(f"{_pending} password jobs pending")
+        _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), fn, *args)
+    finally:
+        with _lock:
+            _pending -= 1
+
+
+async def ahash_password(password: str) -> str:
+    return await _run(hash_password, password)
+
+
+async def averify_password(password: str, hashed: str) -> tuple[bool, str | None]:
+    return await _run(verify_password, password, hashed)
+
+
+async def averify_unknown(password: str) -> tuple[bool, None]:
+    """
+    A failed verify for a username that does not exist, costing the same
+    bcrypt work as a real one (hashing at BCRYPT_ROUNDS), so response time
+    does not reveal which usernames are registered.
+    """
+    await _run(hash_password, password)
+    return False, None
+
+
+def start():
+    """Spawn the workers ahead of the first login (they import passlib once)."""
+    pool = _get_pool()
+    for _ in range(PASSWORD_POOL_WORKERS):
+        pool.submit(pending)
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,340 @@
+from __future__ import annotations
+import hashlib
+import math
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+from app.config import OPENAI_MODEL, PROMPT_FIELD_TOKEN_BUDGET, PROMPT_USER_TOKEN_BUDGET
+
+try:  # exact token counts when tiktoken is installed
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# ─────────────────────────────
+# PROMPT COMPILER (static prefix + budgeted per-user block)
+# ─────────────────────────────
+# Templates are compiled once at import: the system message is fixed text
+# (hashed, token-counted, byte-identical on every call so provider-side
+# prompt caching can reuse it) and always comes first; only the short user
+# block after it varies. Each EFT answer is cut to PROMPT_FIELD_TOKEN_BUDGET
+# tokens at a sentence boundary, and when the answers together still exceed
+# PROMPT_USER_TOKEN_BUDGET the longest ones are cut further, so short answers
+# always survive whole.
+#
+# Tokens are counted with tiktoken when it is installed; otherwise with a
+# character-class estimate (≈4 Latin or ≈1.5 Persian characters per token).
+#
+# Bump a template's version whenever its system text or user layout changes:
+# the version is part of the LLM cache key and is stored on every ai_prompts row.
+
+ELLIPSIS = "…"
+# Name and language goal are short by nature; anything longer is noise
+SHORT_FIELD_BUDGET = 40
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?؟…])\s+")
+
+
+# ─────────────────────────────
+# TOKEN COUNTING
+# ─────────────────────────────
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(OPENAI_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None  # encoding files not available offline
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    ascii_chars = sum(1 for ch in text if ch < "\x80")
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) / 1.5)
+
+
+def fit(text: str, budget: int) -> tuple[str, bool]:
+    """
+    Whitespace-normalised text within budget tokens: whole leading sentences
+    when at least one fits, else leading words, marked with an ellipsis.
+    Returns (text, truncated).
+    """
+    text = " ".join(text.split())
+    if count_tokens(text) <= budget:
+        return text, False
+
+    room = budget - count_tokens(ELLIPSIS)
+    kept = ""
+    for sentence in _SENTENCE_BREAK.split(text):
+        candidate = f"{kept} {sentence}" if kept else sentence
+        if count_tokens(candidate) > room:
+            break
+        kept = candidate
+
+    if not kept:
+        words = text.split(" ")
+        low, high = 0, len(words)  # longest word prefix that fits
+        while low < high:
+            mid = (low + high + 1) // 2
+            if count_tokens(" ".join(words[:mid])) <= room:
+                low = mid
+            else:
+                high = mid - 1
+        kept = " ".join(words[:low])
+    return kept + ELLIPSIS, True
+
+
+def allocate(sizes: dict[str, int], total: int, cap: int) -> dict[str, int]:
+    """
+    Per-field token budgets: each at most cap, summing to at most total.
+    Fields are served smallest first, so short answers keep their full text
+    and whatever they leave is shared evenly by the longer ones.
+    """
+    budgets: dict[str, int] = {}
+    remaining = max(total, 0)
+    pending = sorted(sizes, key=sizes.get)
+    while pending:
+        name = pending.pop(0)
+        share = remaining // (len(pending) + 1)
+        budgets[name] = min(sizes[name], cap, share)
+        remaining -= budgets[name]
+    return budgets
+
+
+# ─────────────────────────────
+# TEMPLATES
+# ─────────────────────────────
+@dataclass(frozen=True)
+class RenderedPrompt:
+    template: PromptTemplate
+    user: str
+    user_tokens: int
+    truncated: tuple[str, ...]
+
+    @property
+    def prompt_tokens(self) -> int:
+        return self.template.system_tokens + self.user_tokens
+
+    def messages(self) -> list[dict]:
+        return [
+            {"role": "system", "content": self.template.system},
+            {"role": "user", "content": self.user},
+        ]
+
+    def metadata(self) -> dict:
+        """Stored with the ai_prompts row."""
+        return {
+            "template_version": self.template.version,
+            "prompt_tokens": self.prompt_tokens,
+            "user_tokens": self.user_tokens,
+            "truncated_fields": list(self.truncated),
+        }
+
+
+class PromptTemplate:
+    """
+    Fixed system message plus a per-user block of "label value" lines.
+    header: (key, label) pairs filled from render() keyword arguments;
+    fields: (key, label) pairs filled from the EFT answers.
+    """
+
+    def __init__(
+        self,
+        version: str,
+        system: str,
+        header: tuple[tuple[str, str], ...],
+        answers_title: str,
+        fields: tuple[tuple[str, str], ...],
+        field_budget: int = PROMPT_FIELD_TOKEN_BUDGET,
+        user_budget: int = PROMPT_USER_TOKEN_BUDGET,
+    ):
+        self.version = version
+        self.system = system.strip()
+        self.system_hash = hashlib.sha256(self.system.encode("utf-8")).hexdigest()
+        self.system_tokens = count_tokens(self.system)
+        self.header = header
+        self.answers_title = answers_title
+        self.fields = fields
+        self.field_budget = field_budget
+        self.user_budget = user_budget
+
+    def render(self, answers: dict, **header_values) -> RenderedPrompt:
+        truncated = []
+        lines = []
+        for key, label in self.header:
+            value, cut = fit(str(header_values.get(key) or ""), SHORT_FIELD_BUDGET)
+            lines.append(f"{label} {value}".rstrip())
+            if cut:
+                truncated.append(key)
+        lines += ["", self.answers_title]
+
+        values = {key: " ".join(str(answers.get(key) or "").split()) for key, _ in self.fields}
+        scaffold = count_tokens("\n".join(lines + [f"- {label} " for _, label in self.fields]))
+        budgets = allocate(
+            {key: count_tokens(value) for key, value in values.items()},
+            self.user_budget - scaffold,
+            self.field_budget,
+        )
+        for key, label in self.fields:
+            value, cut = fit(values[key], budgets[key])
+            lines.append(f"- {label} {value}".rstrip())
+            if cut:
+                truncated.append(key)
+
+        user = "\n".join(lines)
+        return RenderedPrompt(self, user, count_tokens(user), tuple(truncated))
+
+
+EFT_NUDGE_SYSTEM_PROMPT = """
+You are an expert in motivational psychology and applied Episodic Future Thinking (EFT).
+Your task is to generate short, emotionally intelligent motivational "nudges" in Persian (Farsi)
+that are deeply personalized for the user based on their responses about goals, obstacles, and feelings.
+
+---
+
+### 🎯 PURPOSE
+The nudges will be used inside an educational app helping Persian-speaking university students
+stay focused while preparing for the IELTS exam or other learning goals.
+They should evoke emotion, not give advice; sound human, not robotic; and always feel natural.
+
+---
+
+### 🧠 CONCEPTUAL FRAMEWORK (for you, the model)
+Base your tone and content on the principles of *Episodic Future Thinking (EFT)*, which means:
+- Make the user mentally “feel” and “see” a **future moment** of success or regret.
+- Use **sensory and emotional imagery** (e.g., hearing, seeing, or feeling something).
+- Focus on **authentic inner emotion** (pride, calm, relief, regret) rather than commands or clichés.
+- Use **approach motivation** (moving toward a rewarding feeling) or **avoidance motivation**
+  (avoiding a painful future emotion) — both are valid EFT techniques.
+- Always sound **friendly and supportive**, not like a coach or instructor.
+
+Avoid:
+- Generic or cliché lines like "تو می‌تونی!" or "هرگز تسلیم نشو."
+- Imperatives or teacher-like tones (“باید تمرین کنی”).
+- Overly poetic or exaggerated imagery.
+
+---
+
+### 📋 INPUT FORMAT (user data provided as JSON)
+The user data will look like this:
+{
+  "name": "سارا",
+  "q1_why_goal_matters": "رسیدن به نمره ۷ در آیلتس برایم مهم است چون می‌خواهم برای ادامه تحصیل در خارج از کشور پذیرش بگیرم و احساس استقلال و پیشرفت داشته باشم.",
+  "q2_when_reach_goal": "شش ماه دیگر.",
+  "q3_possible_obstacles": "ممکن است خستگی، فشار کاری یا ناامیدی از پیشرفت کند باعث شود انگیزه‌ام را از دست بدهم.",
+  "q4_future_visualization": "خودم را در دانشگاهی در خارج از کشور می‌بینم که با اعتماد به نفس با استاد و هم‌کلاسی‌ها صحبت می‌کنم و از هر لحظه یادگیری لذت می‌برم. خانواده‌ام را می‌بینم که پس از دریافت پذیرش به من افتخار می‌کنند.",
+  "q5_if_give_up": "اگر رها کنم، حس شکست و پشیمانی خواهم داشت و فرصت رشد و پیشرفت را از خودم می‌گیرم.",
+  "q6_notes": "دوست دارم روزانه حتی کم ولی مستمر تمرین کنم تا مسیر یادگیری برایم طبیعی و لذت‌بخش باشد."
+}
+
+---
+
+### 🧩 OUTPUT FORMAT
+Respond in **valid JSON** as follows:
+{
+  "user": "<name>",
+  "nudges": [
+    {"type": "positive", "message": "<short, vivid, future-oriented Persian nudge>"},
+    {"type": "negative", "message": "<short, gentle, regret-avoidant Persian nudge>"},
+    ...
+  ]
+}
+
+Generate 8–10 nudges total:
+- 4–5 positive (imagining the rewarding outcome)
+- 4–5 negative (reflecting softly on what might be lost)
+
+---
+
+### 🗣 TONE AND STYLE GUIDELINES
+1. **Language:** Persian (Farsi), fluent, modern, natural — avoid literary or archaic forms.
+2. **Length:** One or two short sentences; can fit in a phone notification.
+3. **Voice:** Always address the user by name.
+4. **Emotion:** Subtle and authentic — make the user “feel” their goal, not “think” about it.
+5. **Imagery:** Refer to their specific details (e.g., IELTS, family pride, studying abroad, confidence).
+6. **Polarity:** 
+   - Positive nudges → highlight calm pride, growth, or independence.
+   - Negative nudges → highlight mild regret or missed emotional fulfillment (not guilt).
+
+---
+
+### 💡 EXAMPLES OF GOOD OUTPUT
+Example (for Sara):
+{
+  "user": "سارا",
+  "nudges": [
+    {
+      "type": "positive",
+      "message": "سارا، فکر کن روزی که با اعتماد به نفس توی کلاس دانشگاه صحبت می‌کنی و خانواده‌ت با لبخند بهت نگاه می‌کنن — همون روز داره با هر تمرین کوچیک نزدیک‌تر می‌شه."
+    },
+    {
+      "type": "negative",
+      "message": "سارا، اگه امروز رها کنی، اون لحظه‌ی غروری که خانواده‌ت دنبالش بودن یه کم دورتر می‌ره — حیفه، فقط چند قدم مونده."
+    },
+    {
+      "type": "positive",
+      "message": "سارا، هر بار که تمرین می‌کنی، داری اون حس آزادی و استقلالی که دنبالش بودی رو می‌سازی، آروم و واقعی."
+    },
+    {
+      "type": "negative",
+      "message": "سارا، خستگی چند دقیقه‌ست، ولی حس پشیمونی می‌مونه — همون چند خط خوندن می‌تونه ورق رو برگردونه."
+    }
+  ]
+}
+
+---
+
+### 🧬 LOGIC INSIDE THE MODEL (implicit reasoning)
+When writing each nudge:
+1. Extract emotional keywords from user input (e.g., «استقلال», «افتخار خانواده», «اعتماد به نفس»).
+2. Choose one concept per nudge.
+3. Form an **emotional micro-scene** around that concept (seeing, feeling, hearing, or imagining).
+4. Use second person + name for emotional engagement.
+5. Keep tone warm, conversational, and realistic.
+
+---
+
+### 🧪 OUTPUT QUALITY CHECK
+Before finishing, ensure:
+- Each message sounds like something a caring inner voice could say.
+- No message gives an instruction.
+- Each one connects directly to the user’s own imagery or motivations.
+
+---
+
+Now, given the user JSON, generate 8–10 personalized EFT-based Persian nudges following these principles.
+
+"""
+
+
+EFT_NUDGE = PromptTemplate(
+    version="eft-nudge-v2",
+    system=EFT_NUDGE_SYSTEM_PROMPT,
+    header=(
+        ("user_name", "نام کاربر:"),
+        ("english_goal", "هدف زبانی:"),
+    ),
+    answers_title="پاسخ‌ها:",
+    fields=(
+        ("q1_why_goal_matters", "چرا هدف مهم است؟"),
+        ("q2_when_reach_goal", "چه زمانی احساس موفقیت می‌کند؟"),
+        ("q3_possible_obstacles", "موانع احتمالی:"),
+        ("q4_future_visualization", "تصویر آینده در ذهن:"),
+        ("q5_if_give_up", "اگر ناامید شود چه می شود؟"),
+        ("q6_notes", "یادداشت اضافه:"),
+    ),
+)
+
+DEFAULT_ENGLISH_GOAL = "کسب نمره بالا در IELTS"
+
+
+def render_eft_prompt(eft_data: dict, user_name: str, english_goal: str | None) -> RenderedPrompt:
+    return EFT_NUDGE.render(eft_data, user_name=user_name, english_goal=english_goal or DEFAULT_ENGLISH_GOAL)
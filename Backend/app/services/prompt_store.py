@@ -0,0 +1,149 @@
+from __future__ import annotations
+import hashlib
+import logging
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
+
+from app.config import OPENAI_MODEL
+from app.database import models
+from app.services.prompt_compiler import EFT_NUDGE
+
+# ─────────────────────────────
+# PROMPT STORAGE (template once, variable part per call)
+# ─────────────────────────────
+
+# Rows from before prompt templates whose prompt was fully self-contained
+LEGACY_INLINE_VERSION = "legacy-inline"
+
+# Template in use before the prompt compiler; its system text is unchanged
+PRE_COMPILER_VERSION = "eft-nudge-v1"
+
+# First line of the per-user block (both before and after the compiler)
+USER_BLOCK_PREFIX = "نام کاربر:"
+
+# Hashes already known to exist in prompt_templates (per process)
+_known_templates: set[str] = set()
+
+
+def template_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def register_template(db: Session, text: str, version: str, role: str = "system") -> str:
+    """Insert the template if it is new. Returns its content hash."""
+    digest = template_hash(text)
+    if digest in _known_templates:
+        return digest
+
+    if db.get(models.PromptTemplate, digest) is None:
+        try:
+            with db.begin_nested():
+                db.add(models.PromptTemplate(hash=digest, version=version, role=role, text=text))
+        except IntegrityError:
+            pass  # inserted concurrently by another worker
+    _known_templates.add(digest)
+    return digest
+
+
+def record_prompt(
+    db: Session,
+    user_id: int,
+    variable_text: str,
+    response_text: str | None,
+    template_text: str = EFT_NUDGE.system,
+    version: str = EFT_NUDGE.version,
+    model_name: str = OPENAI_MODEL,
+    purpose: str = "nudge_generation",
+    metadata: dict | None = None,
+) -> models.AIPrompt:
+    """Add (and flush) an AIPrompt that references its shared template."""
+    prompt = models.AIPrompt(
+        user_id=user_id,
+        model_name=model_name,
+        template_hash=register_template(db, template_text, version),
+        template_version=version,
+        prompt_text=variable_text,
+        purpose=purpose,
+        response_preview=response_text,
+        metadata_json=metadata,
+    )
+    db.add(prompt)
+    db.flush()
+    return prompt
+
+
+def rebuild_prompt(db: Session, prompt: models.AIPrompt) -> list[dict]:
+    """
+    Return the exact chat messages that were sent for this prompt.
+    Legacy self-contained prompts come back as a single user message.
+    """
+    messages = []
+    if prompt.template_hash:
+        template = db.get(models.PromptTemplate, prompt.template_hash)
+        messages.append({"role": template.role, "content": template.text})
+    messages.append({"role": "user", "content": prompt.prompt_text.strip()})
+    return messages
+
+
+# ─────────────────────────────
+# LEGACY ROW MIGRATION
+# ─────────────────────────────
+def migrate_legacy_prompts(db: Session, batch_size: int = 500) -> int:
+    """
+    Bring rows written before templates existed into the new layout, in
+    batches; idempotent. Returns the number of rows migrated.
+
+    - prompt_text starting with the current EFT system template: the template
+      text is cut off the front and the row references it by hash.
+    - prompt_text starting with the per-user block (USER_BLOCK_PREFIX): only
+      the user part was stored, and it was always sent after that same system
+      template, so the text stays as is and the row just gains the reference.
+    - anything else (older self-contained prompts): kept whole as the prompt,
+      marked template_version=LEGACY_INLINE_VERSION.
+
+    Text columns are rewritten so legacy rows end up stored compressed.
+    """
+    digest = register_template(db, EFT_NUDGE.system, EFT_NUDGE.version)
+    migrated = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.query(models.AIPrompt)
+            .filter(
+                models.AIPrompt.template_hash.is_(None),
+                models.AIPrompt.template_version.is_(None),
+                models.AIPrompt.id > last_id,
+            )
+            .order_by(models.AIPrompt.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        for prompt in rows:
+            text = (prompt.prompt_text or "").strip()
+            if text.startswith(EFT_NUDGE.system):
+                prompt.prompt_text = text[len(EFT_NUDGE.system):].strip()
+                prompt.template_hash, prompt.template_version = digest, PRE_COMPILER_VERSION
+            elif text.startswith(USER_BLOCK_PREFIX):
+                prompt.template_hash, prompt.template_version = digest, PRE_COMPILER_VERSION
+            else:
+                prompt.template_version = LEGACY_INLINE_VERSION
+            flag_modified(prompt, "prompt_text")
+            flag_modified(prompt, "response_preview")
+        last_id = rows[-1].id
+        migrated += len(rows)
+        db.commit()
+    db.commit()
+    return migrated
+
+
+if __name__ == "__main__":
+    # python -m app.services.prompt_store
+    from app.database.db_setup import SessionLocal
+    from app.logging_config import configure_logging
+    configure_logging(fmt="text")
+
+    with SessionLocal() as session:
+        logging.getLogger(__name__).info("✅ Migrated %d legacy prompts", migrate_legacy_prompts(session))
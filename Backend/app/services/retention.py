@@ -0,0 +1,292 @@
+from __future__ import annotations
+import heapq
+import logging
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterator, Sequence
+
+from sqlalchemy import Column, Index, MetaData, Table, create_engine, delete, inspect, select, text, tuple_
+from sqlalchemy.engine import Engine
+
+from app.config import (
+    RETENTION_ARCHIVE_DIR,
+    RETENTION_ARCHIVE_MODE,
+    RETENTION_BATCH_SIZE,
+    RETENTION_HOT_DAYS,
+)
+from app.database import models
+from app.database.db_setup import IS_SQLITE, SessionLocal, engine
+
+# ─────────────────────────────
+# HOT / ARCHIVE RETENTION FOR EVENT TABLES
+# ─────────────────────────────
+# event_log and user_activity keep only the last RETENTION_HOT_DAYS in the
+# live ("hot") tables. Older rows move, RETENTION_BATCH_SIZE at a time, into
+# monthly partitions: one SQLite file per month (archive/YYYY_MM.db, the
+# default) or monthly tables in the main database (<table>_YYYY_MM).
+#
+# Rollup safety: user_stats, activity_rollups and attention_state are never
+# touched, and every user with archived activity gets an attention_state row
+# first, so live metrics never need the archived history. Rebuilds that do
+# (rollups backfill) read through iter_rows(), which merges hot and archived
+# partitions.
+#
+# Each batch copies rows into the partition with INSERT OR IGNORE before
+# deleting them from the hot table, so an interrupted run only leaves
+# duplicates that the next run ignores.
+#
+#   python -m app.services.retention [--hot-days 90] [--max-batches N] [--no-vacuum]
+
+
+@dataclass(frozen=True)
+class RetainedTable:
+    model: type
+    time_column: str
+    type_column: str
+
+
+RETAINED = {
+    "event_log": RetainedTable(models.EventLog, "timestamp", "event_type"),
+    "user_activity": RetainedTable(models.UserActivity, "created_at", "activity_type"),
+}
+
+_MONTH_FORMAT = "%Y_%m"
+_MONTH_PATTERN = re.compile(r"^(\d{4}_\d{2})$")
+
+
+@dataclass
+class Partition:
+    table_name: str     # source table
+    month: str | None   # "YYYY_MM"; None = hot table
+    engine: Engine
+    table: Table
+
+
+# ─────────────────────────────
+# PARTITIONS
+# ─────────────────────────────
+_archive_engines: dict[str, Engine] = {}
+_lock = threading.Lock()
+
+
+def _archive_engine(month: str) -> Engine:
+    if RETENTION_ARCHIVE_MODE == "table":
+        return engine
+    with _lock:
+        if month not in _archive_engines:
+            RETENTION_ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+            _archive_engines[month] = create_engine(f"sqlite:///{RETENTION_ARCHIVE_DIR / f'{month}.db'}")
+        return _archive_engines[month]
+
+
+def _archive_table(table_name: str, month: str) -> Table:
+    """Column-for-column copy of the hot table: primary key kept, no foreign keys."""
+    source = RETAINED[table_name].model.__table__
+    name = table_name if RETENTION_ARCHIVE_MODE == "file" else f"{table_name}_{month}"
+    spec = RETAINED[table_name]
+    columns = [Column(c.name, c.type, primary_key=c.primary_key) for c in source.columns]
+    table = Table(name, MetaData(), *columns)
+    Index(f"ix_{name}_user_time", table.c.user_id, table.c[spec.time_column])
+    return table
+
+
+def partition(table_name: str, month: str, create: bool = False) -> Partition:
+    part = Partition(table_name, month, _archive_engine(month), _archive_table(table_name, month))
+    if create:
+        part.table.create(part.engine, checkfirst=True)
+    return part
+
+
+def hot_partition(table_name: str, bind: Engine | None = None) -> Partition:
+    return Partition(table_name, None, bind or engine, RETAINED[table_name].model.__table__)
+
+
+def archived_months(table_name: str) -> list[str]:
+    if RETENTION_ARCHIVE_MODE == "table":
+        prefix = f"{table_name}_"
+        names = inspect(engine).get_table_names()
+        months = [n[len(prefix):] for n in names if n.startswith(prefix)]
+    else:
+        if not RETENTION_ARCHIVE_DIR.exists():
+            return []
+        months = [
+            p.stem for p in RETENTION_ARCHIVE_DIR.glob("*.db")
+            if table_name in inspect(_archive_engine(p.stem)).get_table_names()
+        ]
+    return sorted(m for m in months if _MONTH_PATTERN.match(m))
+
+
+def _month_range(since: datetime | None, until: datetime | None, months: list[str]) -> list[str]:
+    low = since.strftime(_MONTH_FORMAT) if since else None
+    high = until.strftime(_MONTH_FORMAT) if until else None
+    return [m for m in months if (low is None or m >= low) and (high is None or m <= high)]
+
+
+def archived_in(table_name: str, since: datetime | None, until: datetime | None) -> list[str]:
+    """Archived months of the table that may hold rows in [since, until)."""
+    return _month_range(since, until, archived_months(table_name))
+
+
+# ─────────────────────────────
+# READING ACROSS HOT + ARCHIVE
+# ─────────────────────────────
+def _iter_partition(
+    part: Partition, user_id: int | None, since: datetime | None, until: datetime | None,
+    types: Sequence[str] | None, chunk_size: int,
+) -> Iterator:
+    spec = RETAINED[part.table_name]
+    t = part.table
+    time_col = t.c[spec.time_column]
+    after = None
+    while True:
+        query = select(t)
+        if user_id is not None:
+            query = query.where(t.c.user_id == user_id)
+        if since is not None:
+            query = query.where(time_col >= since)
+        if until is not None:
+            query = query.where(time_col < until)
+        if types:
+            query = query.where(t.c[spec.type_column].in_(types))
+        if after is not None:
+            query = query.where(tuple_(time_col, t.c.id) > tuple_(*after))  # keyset
+        with part.engine.connect() as conn:
+            rows = conn.execute(query.order_by(time_col, t.c.id).limit(chunk_size)).all()
+        if not rows:
+            return
+        yield from rows
+        last = rows[-1]
+        after = (last._mapping[spec.time_column], last.id)
+
+
+def iter_rows(
+    table_name: str,
+    user_id: int | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    types: Sequence[str] | None = None,
+    include_archive: bool = True,
+    chunk_size: int = 2000,
+    bind: Engine | None = None,
+) -> Iterator:
+    """
+    Rows of event_log / user_activity in (time, id) order, read from the hot
+    table (through `bind`, default the primary engine) and — when
+    include_archive — every monthly partition overlapping [since, until).
+    Each partition is paged with its own short reads.
+    """
+    spec = RETAINED[table_name]
+    parts = [hot_partition(table_name, bind)]
+    if include_archive:
+        parts += [partition(table_name, m) for m in archived_in(table_name, since, until)]
+    streams = [_iter_partition(p, user_id, since, until, types, chunk_size) for p in parts]
+    if len(streams) == 1:
+        return streams[0]
+
+    def key(row):
+        return (row._mapping[spec.time_column].replace(tzinfo=None), row.id)
+    return heapq.merge(*streams, key=key)
+
+
+# ─────────────────────────────
+# ARCHIVING
+# ─────────────────────────────
+def _insert_ignore(table: Table, bind: Engine):
+    if bind.dialect.name == "sqlite":
+        return table.insert().prefix_with("OR IGNORE")
+    from sqlalchemy.dialects.postgresql import insert
+    return insert(table).on_conflict_do_nothing()
+
+
+def _protect_attention_state(user_ids: set[int]):
+    """Make sure live metrics never need to rebuild from rows about to be archived."""
+    from app.services import attention
+
+    with SessionLocal() as db:
+        for user_id in user_ids:
+            if db.get(models.AttentionState, user_id) is None:
+                attention.rebuild_state(db, user_id)
+        db.commit()
+
+
+def archive_batch(table_name: str, cutoff: datetime, batch_size: int = RETENTION_BATCH_SIZE) -> int:
+    """Move up to batch_size rows older than cutoff. Returns rows moved."""
+    spec = RETAINED[table_name]
+    hot = spec.model.__table__
+    time_col = hot.c[spec.time_column]
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(hot).where(time_col < cutoff).order_by(hot.c.id).limit(batch_size)
+        ).mappings().all()
+    if not rows:
+        return 0
+
+    if table_name == "user_activity":
+        _protect_attention_state({r["user_id"] for r in rows})
+
+    by_month: dict[str, list[dict]] = defaultdict(list)
+    for r in rows:
+        by_month[r[spec.time_column].strftime(_MONTH_FORMAT)].append(dict(r))
+
+    for month, month_rows in by_month.items():
+        part = partition(table_name, month, create=True)
+        with part.engine.begin() as conn:
+            conn.execute(_insert_ignore(part.table, part.engine), month_rows)
+
+    with engine.begin() as conn:
+        conn.execute(delete(hot).where(hot.c.id.in_([r["id"] for r in rows])))
+    return len(rows)
+
+
+def compact():
+    """Give freed pages back to the filesystem and refresh planner stats (SQLite)."""
+    if not IS_SQLITE:
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        conn.execute(text("VACUUM"))
+        conn.execute(text("PRAGMA optimize"))
+
+
+def run_retention(
+    hot_days: int = RETENTION_HOT_DAYS,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    max_batches: int | None = None,
+    vacuum: bool = True,
+) -> dict[str, int]:
+    """Archive everything older than hot_days, in bounded batches. Returns rows moved per table."""
+    cutoff = datetime.utcnow() - timedelta(days=hot_days)
+    moved: dict[str, int] = {}
+    for table_name in RETAINED:
+        moved[table_name] = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            count = archive_batch(table_name, cutoff, batch_size)
+            if not count:
+                break
+            moved[table_name] += count
+            batches += 1
+    if vacuum and any(moved.values()):
+        compact()
+    return moved
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.logging_config import configure_logging
+    configure_logging(fmt="text")
+
+    parser = argparse.ArgumentParser(description="Move old event rows into monthly archives.")
+    parser.add_argument("--hot-days", type=int, default=RETENTION_HOT_DAYS)
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, help="per table; default: until done")
+    parser.add_argument("--no-vacuum", action="store_true")
+    args = parser.parse_args()
+
+    result = run_retention(args.hot_days, args.batch_size, args.max_batches, vacuum=not args.no_vacuum)
+    for name, count in result.items():
+        logging.getLogger(__name__).info("🗄️  Archived %d %s rows older than %d days", count, name, args.hot_days)
@@ -0,0 +1,194 @@
+from __future__ import annotations
+import logging
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app.database import models
+
+# ─────────────────────────────
+# HOURLY / DAILY ACTIVITY ROLLUPS
+# ─────────────────────────────
+# log_events / log_system_events fold every event into a RollupBatch keyed by
+# (granularity, bucket_start) and apply it with one upsert that adds to the
+# existing counters in SQL (INSERT … ON CONFLICT DO UPDATE SET c = c + excluded.c),
+# so concurrent writers never lose increments. Time-series queries then read
+# one row per bucket instead of scanning user_activity / event_log.
+#
+# Rebuild from history: python -m app.services.rollups [user_id ...]
+
+R = models.ActivityRollup
+
+GRANULARITIES = ("hour", "day")
+
+# Upper bounds (seconds) of the refocus latency histogram; the last column
+# counts everything above the largest bound
+LATENCY_BUCKETS_SECONDS = (5, 15, 30, 60, 120, 300)
+LATENCY_COLUMNS = tuple(f"latency_le_{b}" for b in LATENCY_BUCKETS_SECONDS) + ("latency_gt_300",)
+
+COUNTER_COLUMNS = (
+    "events", "idle_count", "focus_resumed", "nudges_shown", "nudges_served",
+    "sessions", "rating_sum", "sustained_count", "sustained_seconds",
+    "refocus_within_60s", "refocus_latency_count", "refocus_latency_sum",
+) + LATENCY_COLUMNS
+
+_ZERO = dict.fromkeys(COUNTER_COLUMNS, 0)
+
+# First half of the PostgreSQL advisory lock key (second half: user id)
+ROLLUP_LOCK_KEY = 7101
+
+
+def bucket_start(at: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def latency_column(seconds: float) -> str:
+    for bound, column in zip(LATENCY_BUCKETS_SECONDS, LATENCY_COLUMNS):
+        if seconds <= bound:
+            return column
+    return LATENCY_COLUMNS[-1]
+
+
+class RollupBatch:
+    """Counter increments for one user, accumulated in memory."""
+
+    def __init__(self):
+        self.buckets: dict[tuple[str, datetime], dict[str, float]] = defaultdict(dict)
+
+    def add(self, at: datetime, **increments: float):
+        for granularity in GRANULARITIES:
+            bucket = self.buckets[(granularity, bucket_start(at, granularity))]
+            for column, value in increments.items():
+                bucket[column] = bucket.get(column, 0) + value
+
+    def __bool__(self):
+        return bool(self.buckets)
+
+
+def _upsert_statement(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise NotImplementedError(f"activity rollups need ON CONFLICT support ({dialect})")
+
+    stmt = insert(R)
+    return stmt.on_conflict_do_update(
+        index_elements=[R.user_id, R.granularity, R.bucket_start],
+        set_={
+            **{c: getattr(R, c) + getattr(stmt.excluded, c) for c in COUNTER_COLUMNS},
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+
+
+def lock_user_rollups(db: Session, user_id: int):
+    """
+    Serialize rollup writers of one user with backfill, until commit. On
+    PostgreSQL a transaction-scoped advisory lock; SQLite's database write
+    lock (taken by the first write) already does it.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(select(func.pg_advisory_xact_lock(ROLLUP_LOCK_KEY, user_id)))
+
+
+def apply_rollups(db: Session, user_id: int, batch: RollupBatch):
+    """Add the batch to the stored buckets (no commit)."""
+    if not batch:
+        return
+    lock_user_rollups(db, user_id)
+    now = datetime.utcnow()
+    rows = [
+        {**_ZERO, **counters, "user_id": user_id, "granularity": g, "bucket_start": start, "updated_at": now}
+        for (g, start), counters in batch.buckets.items()
+    ]
+    db.execute(_upsert_statement(db), rows)
+
+
+# ─────────────────────────────
+# QUERIES
+# ─────────────────────────────
+def time_series(
+    db: Session, user_id: int, granularity: str, start: datetime | None = None, end: datetime | None = None
+) -> list[models.ActivityRollup]:
+    """Buckets with start <= bucket_start < end, oldest first (primary-key range scan)."""
+    query = select(R).where(R.user_id == user_id, R.granularity == granularity)
+    if start is not None:
+        query = query.where(R.bucket_start >= bucket_start(start, granularity))
+    if end is not None:
+        query = query.where(R.bucket_start < end)
+    return list(db.scalars(query.order_by(R.bucket_start)))
+
+
+def to_dict(row: models.ActivityRollup) -> dict:
+    return {
+        "bucket_start": row.bucket_start.isoformat(),
+        **{c: getattr(row, c) for c in COUNTER_COLUMNS if c not in LATENCY_COLUMNS},
+        "avg_sustained_seconds": row.sustained_seconds / row.sustained_count if row.sustained_count else None,
+        "avg_refocus_latency": row.refocus_latency_sum / row.refocus_latency_count if row.refocus_latency_count else None,
+        "avg_feedback_score": row.rating_sum / row.sessions if row.sessions else None,
+        "refocus_latency_histogram": {c.removeprefix("latency_"): getattr(row, c) for c in LATENCY_COLUMNS},
+    }
+
+
+# ─────────────────────────────
+# BACKFILL
+# ─────────────────────────────
+def backfill(db: Session, user_id: int, chunk_size: int = 5000) -> int:
+    """
+    Recompute a user's rollups from user_activity and event_log (hot and
+    archived partitions), replaying every raw (non-derived) event through the
+    same derivation log_events uses. Commits; returns the number of events
+    replayed.
+
+    The user's rollup writers are locked out first (lock_user_rollups; on
+    SQLite, all writers) and the new buckets are built in memory, then
+    swapped in within the same transaction: events committed before the lock
+    are in the history read, later ones wait and add on top of the result.
+    """
+    from itertools import islice
+    from app.services.attention import UserAttention
+    from app.services.event_service import DERIVED_ACTIVITY_TYPES, IncomingEvent, derive_activity
+    from app.services.retention import iter_rows
+
+    lock_user_rollups(db, user_id)
+    db.execute(delete(R).where(R.user_id == user_id))
+
+    staged = RollupBatch()
+    state, replayed = UserAttention(), 0
+    activity = (
+        r for r in iter_rows("user_activity", user_id=user_id, chunk_size=chunk_size)
+        if r.activity_type not in DERIVED_ACTIVITY_TYPES
+    )
+    while chunk := list(islice(activity, chunk_size)):
+        events = [IncomingEvent(r.activity_type, r.extra_data or {}, r.created_at.replace(tzinfo=None)) for r in chunk]
+        _, state = derive_activity(user_id, events, state, rollup=staged)
+        replayed += len(chunk)
+
+    for row in iter_rows("event_log", user_id=user_id, types=("nudge_shown",), chunk_size=chunk_size):
+        if row.timestamp is not None:
+            staged.add(row.timestamp.replace(tzinfo=None), nudges_served=1)
+            replayed += 1
+
+    apply_rollups(db, user_id, staged)
+    db.commit()
+    return replayed
+
+
+if __name__ == "__main__":
+    # python -m app.services.rollups [user_id ...]  → rebuild from history
+    import sys
+    from app.database.db_setup import SessionLocal, engine
+    from app.logging_config import configure_logging
+    configure_logging(fmt="text")
+
+    R.__table__.create(bind=engine, checkfirst=True)
+    with SessionLocal() as db:
+        user_ids = [int(a) for a in sys.argv[1:]] or [uid for (uid,) in db.query(models.User.id)]
+        total = sum(backfill(db, uid) for uid in user_ids)
+    logging.getLogger(__name__).info("✅ Rebuilt activity rollups for %d users (%d events)", len(user_ids), total)
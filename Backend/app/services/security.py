@@ -1,14 +1,27 @@
 from __future__ import annotations
+import asyncio
+import hashlib
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
-import bcrypt
 from jose import jwt, JWTError
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
 
-from app.config import SECRET_KEY, JWT_ALGORITHM, ACCESS_TOKEN_EXPIRE_DELTA
+from app.config import (
+    SECRET_KEY,
+    JWT_ALGORITHM,
+    ACCESS_TOKEN_EXPIRE_DELTA,
+    AUTH_CACHE_TTL_SECONDS,
+)
 from app.database.models import User
-from app.database.db_setup import SessionLocal
+from app.database.db_setup import get_async_db
+from app.services import metrics, passwords
+from app.services.cache import cache
 
 # OAuth2 token scheme for FastAPI
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
@@ -17,14 +30,27 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 # ─────────────────────────────
 # PASSWORD HANDLING
 # ─────────────────────────────
-from passlib.context import CryptContext
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
+# Routes use the async variants, which run bcrypt in the password pool;
+# the sync ones hash in-process (CLI scripts, tests).
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return passwords.hash_password(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return True
+    return passwords.verify_password(plain_password, hashed_password)[0]
+
+async def ahash_password(password: str) -> str:
+    with metrics.timed("bcrypt"):
+        return await passwords.ahash_password(password)
+
+async def averify_password(plain_password: str, hashed_password: str | None) -> tuple[bool, str | None]:
+    """
+    (matches, new hash to store when the bcrypt cost changed). Pass None for
+    an unknown user: it still costs one bcrypt, so timing gives nothing away.
+    """
+    with metrics.timed("bcrypt"):
+        if hashed_password is None:
+            return await passwords.averify_unknown(plain_password)
+        return await passwords.averify_password(plain_password, hashed_password)
 
 
 # ─────────────────────────────
@@ -59,20 +85,116 @@ def decode_token(token: str) -> dict:
 # ─────────────────────────────
 # CURRENT USER DEPENDENCY
 # ─────────────────────────────
-def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+@dataclass(frozen=True)
+class UserIdentity:
     """
-    Extracts and returns the currently logged-in user from a JWT.
+    What authenticated routes need to know about the caller. Detached from any
+    session, so it can be cached across requests.
     """
+    id: int
+    username: str
+    full_name_fa: Optional[str]
+    english_goal: Optional[str]
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserIdentity":
+        return cls(user.id, user.username, user.full_name_fa, user.english_goal, user.created_at)
+
+
+# Verified token → UserIdentity in the shared cache, so every worker sees the
+# same entries and the same invalidations. Entries of user N live in
+# namespace "user:N"; any committed change to the user row (in any worker)
+# invalidates it. Keys are token hashes, never the tokens themselves.
+def _identity_namespace(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def invalidate_user(user_id: int):
+    cache.invalidate(_identity_namespace(user_id))
+
+
+async def ainvalidate_users(user_ids: set[int]):
+    for user_id in user_ids:
+        await cache.ainvalidate(_identity_namespace(user_id))
+
+
+# Invalidations scheduled from the event loop (referenced until done)
+_pending_invalidations: set[asyncio.Task] = set()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _on_user_changed(mapper, connection, target: User):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_users", set()).add(target.id)
+    else:
+        invalidate_user(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session: Session):
+    # After commit, not at flush: a worker reloading in between would cache the old row
+    user_ids = session.info.pop("changed_users", None)
+    if not user_ids:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is None:
+        # Sync session on a worker thread or in a script: blocking is fine
+        for user_id in user_ids:
+            invalidate_user(user_id)
+        return
+    # AsyncSession commits run this on the event loop thread: the backend call
+    # (sqlite / redis I/O) goes to a worker thread instead
+    task = loop.create_task(ainvalidate_users(user_ids))
+    _pending_invalidations.add(task)
+    task.add_done_callback(_pending_invalidations.discard)
+
+
+async def _resolve_identity(token: str, db: AsyncSession) -> UserIdentity:
     payload = decode_token(token)
     username: str = payload.get("sub")
     if username is None:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
-    db = SessionLocal()
+    user_id = payload.get("uid")
+    if user_id is not None:
+        user = await db.get(User, user_id)  # primary-key lookup
+        if user and user.username != username:
+            user = None
+    else:
+        # Tokens issued before the uid claim existed
+        user = await db.scalar(select(User).where(User.username == username))
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return UserIdentity.from_user(user)
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
+) -> UserIdentity:
+    """
+    Extracts and returns the currently logged-in user from a JWT.
+    Uses the request's own session; verified tokens are cached until they
+    expire, the cache TTL passes, or the user row changes.
+    """
     try:
-        user = db.query(User).filter(User.username == username).first()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
-    finally:
-        db.close()
+        # Only picks the cache entry: a token is cached after it was verified,
+        # so a forged one can never match
+        claims = jwt.get_unverified_claims(token)
+    except JWTError:
+        claims = {}
+    user_id, expires = claims.get("uid"), claims.get("exp")
+    if not isinstance(user_id, int) or not isinstance(expires, (int, float)):
+        return await _resolve_identity(token, db)
+
+    return await cache.aget_or_set(
+        _identity_namespace(user_id),
+        hashlib.sha256(token.encode()).hexdigest(),
+        lambda: _resolve_identity(token, db),
+        ttl=min(expires - time.time(), AUTH_CACHE_TTL_SECONDS),
+    )
@@ -0,0 +1,92 @@
+"""
+Sustained event ingestion throughput, write-behind buffer on vs off.
+
+    cd Backend
+    python scripts/bench_events.py                  # both modes
+    python scripts/bench_events.py --events 5000 --threads 16
+
+Each mode runs in a fresh process against a throwaway SQLite file, posting
+/events/log from N client threads through the ASGI app. Reported events/sec
+for the buffered mode includes the final drain, so it counts only events
+that actually reached the database.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def run_one(events: int, threads: int) -> dict:
+    sys.path.insert(0, str(BACKEND_DIR))
+    from fastapi.testclient import TestClient
+    from app.app import app
+    from app.database.db_setup import SessionLocal
+    from app.database import models
+
+    with TestClient(app) as client:
+        client.post("/auth/signup", json={"username": "bench", "password": "bench"})
+        token = client.post("/auth/login", data={"username": "bench", "password": "bench"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        types = ["idle_detected", "focus_resumed", "nudge_shown"]
+
+        def post(i: int):
+            r = client.post("/events/log", json={"event_type": types[i % 3], "details": {"i": i}}, headers=headers)
+            return r.status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            codes = list(pool.map(post, range(events)))
+    # leaving the TestClient context runs the lifespan shutdown → buffer drained
+    elapsed = time.perf_counter() - start
+
+    with SessionLocal() as db:
+        stored = db.query(models.UserActivity).filter(
+            models.UserActivity.activity_type.in_(types)
+        ).count()
+    return {
+        "accepted": codes.count(201),
+        "rejected": codes.count(503),
+        "stored": stored,
+        "seconds": round(elapsed, 3),
+        "events_per_sec": round(stored / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--mode", choices=["on", "off"], help="run a single mode in this process")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_one(args.events, args.threads)))
+        return
+
+    for mode in ("off", "on"):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                **os.environ,
+                "DATABASE_URL": f"sqlite:///{tmp}/bench.db",
+                "EVENT_BUFFER_ENABLED": "True" if mode == "on" else "False",
+                "LLM_BACKEND": "fake",
+                "NUDGE_WORKERS": "0",
+            }
+            out = subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--events", str(args.events), "--threads", str(args.threads)],
+                env=env, cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+            ).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            print(f"buffer {mode:>3}: {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Login throughput, and what a login storm does to event ingestion.
+
+    cd Backend
+    python scripts/bench_login.py                       # pool of 1, 2, 4 workers
+    python scripts/bench_login.py --logins 200 --threads 32 --rounds 10
+
+Each pool size runs in a fresh process against a throwaway SQLite file. N
+client threads log in concurrently through the ASGI app while one more
+thread keeps posting /events/log; reported are logins/sec, login latency
+percentiles, 503s (pool full), and the event latency during the storm next
+to the same client's latency with no logins running.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def _pct(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return round(values[min(int(len(values) * q), len(values) - 1)] * 1000, 1)
+
+
+def run_one(logins: int, threads: int) -> dict:
+    sys.path.insert(0, str(BACKEND_DIR))
+    from fastapi.testclient import TestClient
+    from app.app import app
+
+    with TestClient(app) as client:
+        client.post("/auth/signup", json={"username": "bench", "password": "bench"})
+        token = client.post("/auth/login", data={"username": "bench", "password": "bench"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        def post_events(stop: threading.Event) -> list[float]:
+            latencies = []
+            while not stop.is_set():
+                started = time.perf_counter()
+                client.post("/events/log", json={"event_type": "focus_resumed", "details": {}}, headers=headers)
+                latencies.append(time.perf_counter() - started)
+            return latencies
+
+        def events_for(seconds: float) -> list[float]:
+            stop = threading.Event()
+            timer = threading.Timer(seconds, stop.set)
+            timer.start()
+            return post_events(stop)
+
+        idle = events_for(1.0)
+
+        def login(_: int) -> tuple[int, float]:
+            started = time.perf_counter()
+            r = client.post("/auth/login", data={"username": "bench", "password": "bench"})
+            return r.status_code, time.perf_counter() - started
+
+        stop = threading.Event()
+        with ThreadPoolExecutor(1) as side:
+            during = side.submit(post_events, stop)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(threads) as pool:
+                results = list(pool.map(login, range(logins)))
+            elapsed = time.perf_counter() - start
+            stop.set()
+            storm = during.result()
+
+    ok = [seconds for code, seconds in results if code == 200]
+    return {
+        "ok": len(ok),
+        "busy": sum(code == 503 for code, _ in results),
+        "logins_per_sec": round(len(ok) / elapsed, 1),
+        "login_p50_ms": _pct(ok, 0.5),
+        "login_p95_ms": _pct(ok, 0.95),
+        "event_p50_ms_idle": _pct(idle, 0.5),
+        "event_p50_ms_storm": _pct(storm, 0.5),
+        "event_p95_ms_storm": _pct(storm, 0.95),
+        "events_during_storm": len(storm),
+        "event_mean_ms_storm": round(statistics.fmean(storm) * 1000, 1) if storm else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=12, help="BCRYPT_ROUNDS")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="pool sizes to compare")
+    parser.add_argument("--single", action="store_true", help="run one configuration in this process")
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_one(args.logins, args.threads)))
+        return
+
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                **os.environ,
+                "DATABASE_URL": f"sqlite:///{tmp}/bench.db",
+                "BCRYPT_ROUNDS": str(args.rounds),
+                "PASSWORD_POOL_WORKERS": str(workers),
+                "LLM_BACKEND": "fake",
+                "NUDGE_WORKERS": "0",
+                "LOG_ACCESS": "false",
+            }
+            out = subprocess.run(
+                [sys.executable, __file__, "--single", "--logins", str(args.logins), "--threads", str(args.threads)],
+                env=env, cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+            ).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            print(f"pool {workers}: {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Read/write concurrency on SQLite, legacy defaults vs the production profile.
+
+    cd Backend
+    python scripts/bench_sqlite.py                     # both profiles
+    python scripts/bench_sqlite.py --seconds 10 --readers 8
+
+Each profile runs in a fresh process on a throwaway database seeded with
+activity rows. One writer thread logs events (one commit each, like
+/events/log) while N reader threads run the per-user queries the GET routes
+issue. Reports throughput, p50/p95 read latency and "database is locked"
+errors.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def run_one(seconds: float, readers: int, seed_rows: int) -> dict:
+    sys.path.insert(0, str(BACKEND_DIR))
+    from sqlalchemy import func, insert
+    from sqlalchemy.exc import OperationalError
+    from app.database.db_setup import Base, SessionLocal, engine
+    from app.database import models
+    from app.services.event_service import IncomingEvent, log_events
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        db.add(models.User(id=1, username="bench", password_hash="x"))
+        db.commit()
+        db.execute(insert(models.UserActivity), [
+            {"user_id": 1, "activity_type": ("idle_detected", "focus_resumed", "nudge_shown")[i % 3], "extra_data": {}}
+            for i in range(seed_rows)
+        ])
+        db.commit()
+
+    stop = threading.Event()
+    counts = {"writes": 0, "reads": 0, "locked": 0}
+    latencies: list[float] = []
+    lock = threading.Lock()
+
+    def writer():
+        types = ("idle_detected", "focus_resumed", "nudge_shown")
+        i = 0
+        while not stop.is_set():
+            db = SessionLocal()
+            try:
+                log_events(db, 1, [IncomingEvent(types[i % 3], {"i": i})])
+                counts["writes"] += 1
+            except OperationalError:
+                db.rollback()
+                counts["locked"] += 1
+            finally:
+                db.close()
+            i += 1
+
+    def reader():
+        while not stop.is_set():
+            db = SessionLocal()
+            t = time.perf_counter()
+            try:
+                db.query(func.count(models.UserActivity.id)).filter_by(user_id=1).scalar()
+                db.query(models.UserActivity).filter_by(user_id=1).order_by(
+                    models.UserActivity.created_at.desc()
+                ).limit(20).all()
+                with lock:
+                    latencies.append(time.perf_counter() - t)
+                    counts["reads"] += 1
+            except OperationalError:
+                with lock:
+                    counts["locked"] += 1
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    return {
+        "writes_per_sec": round(counts["writes"] / seconds, 1),
+        "reads_per_sec": round(counts["reads"] / seconds, 1),
+        "read_p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "read_p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 2) if latencies else None,
+        "locked_errors": counts["locked"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seed-rows", type=int, default=20000)
+    parser.add_argument("--profile", choices=["legacy", "production"], help="run one profile in this process")
+    args = parser.parse_args()
+
+    if args.profile:
+        print(json.dumps(run_one(args.seconds, args.readers, args.seed_rows)))
+        return
+
+    for profile in ("legacy", "production"):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                **os.environ,
+                "DATABASE_URL": f"sqlite:///{tmp}/bench.db",
+                "SQLITE_STORAGE_PROFILE": profile,
+                "LLM_BACKEND": "fake",
+            }
+            out = subprocess.run(
+                [sys.executable, __file__, "--profile", profile, "--seconds", str(args.seconds),
+                 "--readers", str(args.readers), "--seed-rows", str(args.seed_rows)],
+                env=env, cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+            ).stdout
+            print(f"{profile:>10}: {json.loads(out.strip().splitlines()[-1])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Import-time budget for the API: fails when worker cold start regresses.
+
+    cd Backend
+    python scripts/check_import_time.py                 # budget 500 ms, 5 runs
+    python scripts/check_import_time.py --budget-ms 400 --top 20
+
+Each run imports the framework (FastAPI, SQLAlchemy's asyncio layer) and then
+app.app in a fresh interpreter with -X importtime, against a throwaway SQLite
+file. The budget applies to what app.app adds on top of the framework (about
+330 ms when the budget was set, next to ~830 ms for the framework itself), so
+the check follows the app's own regressions and not the speed of the machine.
+It also fails if a module on the lazy list (the OpenAI SDK, httpx) was
+imported at boot: those belong to the first LLM call, not to startup. Exit
+status 1 on failure; tests/test_import_time.py runs it with the test suite.
+"""
+from __future__ import annotations
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+LAZY_MODULES = ("openai", "httpx")
+
+# Imported first and timed apart: the floor no app code can go below
+FRAMEWORK_MODULES = ("fastapi", "fastapi.security", "sqlalchemy.ext.asyncio")
+
+PROBE = (
+    "import sys, time\n"
+    "started = time.perf_counter()\n"
+    "import {framework}\n"
+    "print('framework', time.perf_counter() - started)\n"
+    "started = time.perf_counter()\n"
+    "import app.app\n"
+    "print('elapsed', time.perf_counter() - started)\n"
+    "print('loaded', ' '.join(m for m in {lazy!r} if m in sys.modules))\n"
+)
+
+
+def run_once(env: dict) -> tuple[float, float, list[str], dict[str, int]]:
+    """
+    (framework seconds, app.app seconds on top, lazy modules that were
+    imported, app.app's direct imports → cumulative µs).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         PROBE.format(framework=", ".join(FRAMEWORK_MODULES), lazy=LAZY_MODULES)],
+        env=env, cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+    framework, elapsed, loaded = 0.0, 0.0, []
+    for line in result.stdout.splitlines():
+        if line.startswith("framework "):
+            framework = float(line.split()[1])
+        elif line.startswith("elapsed "):
+            elapsed = float(line.split()[1])
+        elif line.startswith("loaded"):
+            loaded = line.split()[1:]
+
+    cumulative, children = {}, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cum, name = line.split("|")
+        if not cum.strip().isdigit():
+            continue
+        # importtime lists children (indented two more spaces) before their parent
+        depth = len(name) - len(name.lstrip())
+        if depth == 3:
+            children[name.strip()] = int(cum)
+        elif depth == 1:
+            if name.strip() == "app.app":
+                cumulative = children
+            children = {}
+    return framework, elapsed, loaded, cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=500, help="app.app on top of the framework")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports of app.app to list")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{tmp}/boot.db",
+            "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "unused"),
+        }
+        runs = [run_once(env) for _ in range(args.runs)]
+
+    framework_ms = statistics.median(run[0] for run in runs) * 1000
+    median_ms = statistics.median(run[1] for run in runs) * 1000
+    loaded = sorted({name for _, _, names, _ in runs for name in names})
+    slowest = sorted(runs[-1][3].items(), key=lambda item: item[1], reverse=True)
+
+    print(f"framework: median {framework_ms:.0f} ms")
+    print(f"import app.app on top: median {median_ms:.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    for name, micros in slowest[: args.top]:
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+    failed = False
+    if median_ms > args.budget_ms:
+        print(f"FAIL: cold import is {median_ms - args.budget_ms:.0f} ms over budget")
+        failed = True
+    if loaded:
+        print(f"FAIL: imported at boot but should be lazy: {', '.join(loaded)}")
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Test setup: every run gets its own throwaway SQLite database and the offline
+LLM backend, set before any app module reads app.config.
+
+    cd Backend
+    python -m pytest -q
+"""
+from __future__ import annotations
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+_tmp = tempfile.mkdtemp(prefix="nudge-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_tmp}/test.db",
+    CACHE_BACKEND="memory",
+    CACHE_PATH=f"{_tmp}/cache.db",
+    RETENTION_ARCHIVE_DIR=f"{_tmp}/archive",
+    OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "unused"),
+    LLM_BACKEND="fake",
+    NUDGE_WORKERS="0",
+    LOG_ACCESS="false",
+    BCRYPT_ROUNDS="4",
+)
+
+
+@pytest.fixture(scope="session")
+def engine():
+    from app.database.db_setup import engine
+    from app.database.migrations import migrate
+    migrate(engine)
+    return engine
+
+
+@pytest.fixture
+def db(engine):
+    """A session on a freshly emptied database."""
+    from app.database.base_class import Base
+    from app.database.db_setup import SessionLocal
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    with SessionLocal() as session:
+        yield session
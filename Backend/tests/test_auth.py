@@ -0,0 +1,98 @@
+"""Passwords and /auth/login: verify, rehash on login, unknown-user cost, pool back-pressure."""
+from __future__ import annotations
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from passlib.context import CryptContext
+
+from app.app import app
+from app.config import BCRYPT_ROUNDS
+from app.database import models
+from app.services import passwords
+
+
+@pytest.fixture
+def inline_pool(monkeypatch):
+    """Run password jobs in-process, recording which function each one ran."""
+    calls = []
+
+    async def run(fn, *args):
+        calls.append(fn)
+        return fn(*args)
+
+    monkeypatch.setattr(passwords, "_run", run)
+    return calls
+
+
+@pytest.fixture
+def client(db):
+    return TestClient(app)  # no lifespan: no password pool, no workers
+
+
+def _add_user(db, password_hash):
+    db.add(models.User(username="learner", password_hash=password_hash))
+    db.commit()
+
+
+def _login(client, username="learner", password="secret"):
+    return client.post("/auth/login", data={"username": username, "password": password})
+
+
+# ─────────────────────────────
+# HASHING
+# ─────────────────────────────
+def test_verify_password():
+    hashed = passwords.hash_password("secret")
+    assert passwords.verify_password("secret", hashed) == (True, None)
+    assert passwords.verify_password("wrong", hashed) == (False, None)
+    assert passwords.verify_password("secret", "not-a-hash") == (False, None)
+    assert passwords.verify_password("secret", "") == (False, None)
+
+
+def test_verify_in_worker_pool():
+    async def roundtrip():
+        hashed = await passwords.ahash_password("secret")
+        return hashed, await passwords.averify_password("secret", hashed)
+
+    try:
+        hashed, result = asyncio.run(roundtrip())
+    finally:
+        passwords.shutdown()
+    assert hashed.startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+    assert result == (True, None)
+
+
+# ─────────────────────────────
+# LOGIN
+# ─────────────────────────────
+def test_login_rehashes_other_cost(db, client, inline_pool):
+    old = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=BCRYPT_ROUNDS + 1).hash("secret")
+    _add_user(db, old)
+
+    assert _login(client).status_code == 200
+    db.expire_all()
+    stored = db.query(models.User).one().password_hash
+    assert stored != old and stored.startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+    assert passwords.verify_password("secret", stored) == (True, None)
+
+
+def test_unknown_user_costs_one_hash_at_the_same_rounds(db, client, inline_pool):
+    _add_user(db, passwords.hash_password("secret"))
+
+    assert _login(client, password="wrong").status_code == 401
+    assert _login(client, username="nobody").status_code == 401
+    # one bcrypt job each, both at BCRYPT_ROUNDS (the stored hash's cost)
+    assert inline_pool == [passwords.verify_password, passwords.hash_password]
+
+
+def test_login_answers_503_when_pool_is_busy(db, client, monkeypatch):
+    _add_user(db, passwords.hash_password("secret"))
+
+    async def busy(fn, *args):
+        raise passwords.PasswordPoolBusy("full")
+
+    monkeypatch.setattr(passwords, "_run", busy)
+    response = _login(client)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
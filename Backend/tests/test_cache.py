@@ -0,0 +1,152 @@
+"""Shared cache: TTLs, namespace invalidation across instances, stampede protection, RESP backend."""
+from __future__ import annotations
+import asyncio
+import time
+
+import pytest
+
+from app.services.cache import Cache, MemoryBackend, RedisBackend, SQLiteBackend
+from app.services.fake_redis import FakeRedisServer
+
+
+@pytest.fixture
+def redis_server():
+    server = FakeRedisServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    if request.param == "sqlite":
+        return SQLiteBackend(tmp_path / "cache.db")
+    return RedisBackend(request.getfixturevalue("redis_server").url)
+
+
+# ─────────────────────────────
+# BACKENDS
+# ─────────────────────────────
+def test_ttl_expiry(backend):
+    cache = Cache(backend)
+    cache.set("ns", "short", {"v": 1}, ttl=0.05)
+    cache.set("ns", "forever", [1, 2])
+    assert cache.get("ns", "short") == {"v": 1}
+    time.sleep(0.1)
+    assert cache.get("ns", "short") is None
+    assert cache.get("ns", "forever") == [1, 2]
+
+
+def test_add_only_when_absent_or_expired(backend):
+    assert backend.add("k", b"1", 0.05)
+    assert not backend.add("k", b"2", 0.05)
+    time.sleep(0.1)
+    assert backend.add("k", b"3", None)
+    assert backend.get("k") == b"3"
+    backend.delete("k")
+    assert backend.get("k") is None
+
+
+def test_resp_round_trip(redis_server):
+    backend = RedisBackend(redis_server.url)
+    value = "سلام".encode() + b"\r\n\x00binary"
+    backend.set("key", value, None)
+    assert backend.get("key") == value
+    assert backend.get("missing") is None
+    assert [backend.incr("n") for _ in range(3)] == [1, 2, 3]
+    assert backend.counter("n") == 3 and backend.counter("other") == 0
+
+
+def test_unreachable_redis_is_a_miss(redis_server):
+    url = redis_server.url
+    redis_server.stop()
+    cache = Cache(RedisBackend(url, timeout=0.2))
+    cache.set("ns", "k", 1)
+    assert cache.get("ns", "k") is None
+    assert cache.stats()["errors"] >= 2
+
+
+# ─────────────────────────────
+# NAMESPACES
+# ─────────────────────────────
+def test_invalidation_reaches_other_instance_sharing_the_file(tmp_path):
+    path = tmp_path / "shared.db"
+    writer = Cache(SQLiteBackend(path), version_ttl=0)
+    reader = Cache(SQLiteBackend(path), version_ttl=0)
+    writer.set("user", "1", "alice")
+    writer.set("other", "1", "kept")
+    assert reader.get("user", "1") == "alice"
+
+    writer.invalidate("user")
+    assert reader.get("user", "1") is None
+    assert reader.get("other", "1") == "kept"
+
+
+def test_other_instance_sees_invalidation_within_version_ttl(tmp_path):
+    path = tmp_path / "shared.db"
+    writer = Cache(SQLiteBackend(path), version_ttl=0)
+    reader = Cache(SQLiteBackend(path), version_ttl=0.1)
+    writer.set("user", "1", "alice")
+    assert reader.get("user", "1") == "alice"  # version now remembered
+
+    writer.invalidate("user")
+    assert reader.get("user", "1") == "alice"  # within the TTL
+    time.sleep(0.15)
+    assert reader.get("user", "1") is None
+
+
+# ─────────────────────────────
+# STAMPEDE PROTECTION
+# ─────────────────────────────
+def test_aget_or_set_runs_one_loader(backend):
+    cache = Cache(backend)
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"deck": calls}
+
+    async def stampede():
+        return await asyncio.gather(*(cache.aget_or_set("deck", "user:1", load, ttl=60) for _ in range(10)))
+
+    assert asyncio.run(stampede()) == [{"deck": 1}] * 10
+    assert calls == 1
+
+
+def test_aget_or_set_runs_one_loader_across_instances(tmp_path):
+    path = tmp_path / "shared.db"
+    caches = [Cache(SQLiteBackend(path)) for _ in range(3)]
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "deck"
+
+    async def stampede():
+        return await asyncio.gather(*(c.aget_or_set("deck", "user:1", load, ttl=60) for c in caches))
+
+    assert asyncio.run(stampede()) == ["deck"] * 3
+    assert calls == 1
+    assert sum(c.stats()["lock_waits"] for c in caches) == 2
+
+
+def test_failed_loader_releases_the_lock(backend):
+    cache = Cache(backend, lock_seconds=5)
+
+    async def fail():
+        raise RuntimeError("provider down")
+
+    async def ok():
+        return "loaded"
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await cache.aget_or_set("ns", "k", fail)
+        return await asyncio.wait_for(cache.aget_or_set("ns", "k", ok), 1)
+
+    assert asyncio.run(run()) == "loaded"
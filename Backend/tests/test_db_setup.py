@@ -0,0 +1,36 @@
+"""Read-only SQLite engine: serves reads, rejects writes at the connection."""
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.exc import OperationalError
+
+from app.config import DATABASE_URL
+from app.database import models
+from app.database.db_setup import _read_only_url, _sqlite_engine
+
+
+@pytest.fixture
+def read_engine(engine):
+    eng = _sqlite_engine(_read_only_url(DATABASE_URL), read_only=True)
+    yield eng
+    eng.dispose()
+
+
+def test_read_only_url():
+    assert _read_only_url("sqlite:///./app.db") == "sqlite:///file:./app.db?mode=ro&uri=true"
+    assert _read_only_url("sqlite:////tmp/a.db") == "sqlite:///file:/tmp/a.db?mode=ro&uri=true"
+
+
+def test_read_only_engine_sees_committed_rows(db, read_engine):
+    db.add(models.User(username="learner", password_hash="x"))
+    db.commit()
+    with read_engine.connect() as conn:
+        assert conn.scalar(select(models.User.username)) == "learner"
+
+
+def test_read_only_engine_rejects_writes(db, read_engine):
+    with read_engine.connect() as conn:
+        with pytest.raises(OperationalError, match="readonly"):
+            conn.execute(insert(models.User).values(username="intruder", password_hash="x"))
+    assert db.scalar(select(models.User.id)) is None
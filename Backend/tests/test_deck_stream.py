@@ -0,0 +1,149 @@
+"""Streamed nudge deck: incremental parsing, slot scope, deadline, single-flight."""
+from __future__ import annotations
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import ai_service, llm_guard, llm_limits
+from app.services.fake_llm import FakeChunk, _ChunkChoice, _Delta
+from app.services.nudge_parser import strip_fences
+
+DECK = [
+    {"type": "positive", "message": "یک قدم دیگر"},
+    {"type": "negative", "message": "اگر رها کنی پشیمان می‌شوی"},
+    {"type": "positive", "message": "هدفت را تصور کن"},
+]
+
+
+class ChunkedClient:
+    """AsyncOpenAI stand-in: streams `reply` in `size`-character chunks, counting calls and chunks sent."""
+
+    def __init__(self, reply: str, size: int = 7, stall_after: int | None = None):
+        self.reply, self.size, self.stall_after = reply, size, stall_after
+        self.calls = 0
+        self.sent = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @property
+    def total(self) -> int:
+        return -(-len(self.reply) // self.size)
+
+    async def create(self, **request):
+        self.calls += 1
+        return self._stream()
+
+    async def _stream(self):
+        for i in range(0, len(self.reply), self.size):
+            if self.stall_after is not None and self.sent == self.stall_after:
+                await asyncio.sleep(3600)  # provider hangs mid-reply
+            self.sent += 1
+            yield FakeChunk([_ChunkChoice(_Delta(self.reply[i:i + self.size]))])
+            await asyncio.sleep(0)
+
+
+@pytest.fixture(autouse=True)
+def isolated_guard(monkeypatch):
+    monkeypatch.setattr(llm_guard, "breaker", llm_guard.CircuitBreaker())
+    monkeypatch.setattr(llm_limits, "limiter", llm_limits.ConcurrencyLimiter())
+
+
+def _install(monkeypatch, client):
+    monkeypatch.setitem(ai_service._clients, "async_client", client)
+    return client
+
+
+def _stream(answer: str, timeout: float | None = None):
+    return ai_service.NudgeDeckStream(
+        {"q1_why_goal_matters": answer}, user_name="learner", english_goal="IELTS 7",
+        timeout=timeout, fresh=True, user_id=1,
+    )
+
+
+def _fenced(deck):
+    return "```json\n" + json.dumps({"nudges": deck}, ensure_ascii=False) + "\n```"
+
+
+# ─────────────────────────────
+# INCREMENTAL PARSING
+# ─────────────────────────────
+def test_nudges_arrive_before_the_reply_ends(monkeypatch):
+    client = _install(monkeypatch, ChunkedClient(_fenced(DECK)))
+    stream = _stream("incremental")
+
+    async def consume():
+        return [(nudge, client.sent) async for nudge in stream]
+
+    received = asyncio.run(consume())
+    assert [n for n, _ in received] == DECK
+    assert received[0][1] < client.total  # first nudge before the last chunk
+    assert stream.nudges == DECK
+    assert json.loads(strip_fences(stream.raw))["nudges"] == DECK
+
+
+def test_truncated_object_is_not_yielded(monkeypatch):
+    reply = _fenced(DECK)
+    cut = reply.index(DECK[2]["message"])
+    _install(monkeypatch, ChunkedClient(reply[:cut]))
+
+    async def consume():
+        return [nudge async for nudge in _stream("truncated")]
+
+    assert asyncio.run(consume()) == DECK[:2]
+
+
+def test_plain_text_reply_is_parsed_at_the_end(monkeypatch):
+    _install(monkeypatch, ChunkedClient("امروز فقط ده دقیقه تمرین کن."))
+
+    async def consume():
+        return [nudge async for nudge in _stream("plain")]
+
+    assert [n["message"] for n in asyncio.run(consume())] == ["امروز فقط ده دقیقه تمرین کن."]
+
+
+# ─────────────────────────────
+# SLOT SCOPE, DEADLINE, SINGLE-FLIGHT
+# ─────────────────────────────
+def test_slot_is_not_held_while_the_consumer_is_suspended(monkeypatch):
+    _install(monkeypatch, ChunkedClient(_fenced(DECK)))
+
+    async def consume():
+        in_flight = []
+        async for _ in _stream("slow consumer"):
+            await asyncio.sleep(0.05)  # e.g. a database write per nudge
+            in_flight.append(llm_limits.limiter.in_flight())
+        return in_flight
+
+    assert asyncio.run(consume())[-1] == 0
+
+
+def test_stalled_reply_hits_the_overall_deadline(monkeypatch):
+    client = _install(monkeypatch, ChunkedClient(_fenced(DECK), stall_after=2))
+
+    async def consume():
+        got = []
+        with pytest.raises(TimeoutError):
+            async for nudge in _stream("stall", timeout=0.2):
+                got.append(nudge)
+        return got
+
+    started = time.monotonic()
+    assert asyncio.run(consume()) == []
+    assert time.monotonic() - started < 2
+    assert client.sent == 2
+    assert llm_limits.limiter.in_flight() == 0
+
+
+def test_identical_streams_share_one_request(monkeypatch):
+    client = _install(monkeypatch, ChunkedClient(_fenced(DECK)))
+
+    async def both():
+        async def consume():
+            return [nudge async for nudge in _stream("same answers")]
+        return await asyncio.gather(consume(), consume())
+
+    first, second = asyncio.run(both())
+    assert first == second == DECK
+    assert client.calls == 1
@@ -0,0 +1,104 @@
+"""Batched event logging: one call with many events == one call per event."""
+from __future__ import annotations
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app.database import models
+from app.services import rollups
+from app.services.event_service import IncomingEvent, log_events
+
+
+@pytest.fixture
+def users(db):
+    batched = models.User(username="batched", password_hash="x")
+    single = models.User(username="single", password_hash="x")
+    db.add_all([batched, single])
+    db.commit()
+    return batched, single
+
+
+def _events(t0):
+    return [
+        IncomingEvent("session_start", {}, t0),
+        IncomingEvent("focus_resumed", {}, t0 + timedelta(seconds=5)),
+        IncomingEvent("idle_detected", {}, t0 + timedelta(minutes=12)),
+        IncomingEvent("nudge_shown", {}, t0 + timedelta(minutes=13)),
+        IncomingEvent("focus_resumed", {}, t0 + timedelta(minutes=13, seconds=40)),
+        IncomingEvent("focus_resumed", {}, t0 + timedelta(minutes=13, seconds=50)),
+        IncomingEvent("nudge_shown", {}, t0 + timedelta(minutes=30)),
+        IncomingEvent("focus_resumed", {}, t0 + timedelta(minutes=35)),  # outside the refocus window
+        IncomingEvent("idle_detected", {}, t0 + timedelta(minutes=50)),
+        IncomingEvent("session_feedback", {"rating": 4}, t0 + timedelta(minutes=51)),
+        IncomingEvent("session_feedback", {"rating": 2}, t0 + timedelta(minutes=52)),
+        IncomingEvent("session_end", {}, t0 + timedelta(minutes=53)),
+    ]
+
+
+def _snapshot(db, user_id):
+    db.expire_all()
+    activity = [
+        (a.activity_type, a.duration_seconds, a.extra_data, a.created_at)
+        for a in db.scalars(
+            select(models.UserActivity)
+            .where(models.UserActivity.user_id == user_id)
+            .order_by(models.UserActivity.created_at, models.UserActivity.activity_type)
+        )
+    ]
+    stats = db.scalar(select(models.UserStats).where(models.UserStats.user_id == user_id))
+    state = db.get(models.AttentionState, user_id)
+    buckets = {
+        (g, row.bucket_start): {c: getattr(row, c) for c in rollups.COUNTER_COLUMNS}
+        for g in rollups.GRANULARITIES
+        for row in rollups.time_series(db, user_id, g)
+    }
+    return {
+        "activity": activity,
+        "stats": (
+            stats.idle_count, stats.total_sustained_attention, stats.total_refocus_within_60s,
+            stats.total_nudges_shown, stats.total_sessions, stats.avg_feedback_score,
+        ),
+        "state": (state.last_focus_at, state.last_nudge_at),
+        "rollups": buckets,
+    }
+
+
+# ─────────────────────────────
+# BATCH == ONE AT A TIME
+# ─────────────────────────────
+def test_batch_matches_one_event_per_call(db, users):
+    batched, single = users
+    events = _events(datetime.utcnow().replace(microsecond=0) - timedelta(hours=2))
+
+    log_events(db, batched.id, events)
+    for e in events:
+        log_events(db, single.id, [e])
+
+    expected = _snapshot(db, single.id)
+    assert _snapshot(db, batched.id) == expected
+    assert [a[0] for a in expected["activity"]].count("sustained_attention") == 2
+    assert [a[0] for a in expected["activity"]].count("immediate_refocus") == 2
+    assert expected["stats"][-2:] == (2, 3.0)
+
+
+def test_out_of_order_batch_is_applied_in_time_order(db, users):
+    batched, single = users
+    events = _events(datetime.utcnow().replace(microsecond=0) - timedelta(hours=2))
+
+    log_events(db, batched.id, events[::-1])
+    for e in events:
+        log_events(db, single.id, [e])
+
+    assert _snapshot(db, batched.id) == _snapshot(db, single.id)
+
+
+def test_batches_split_anywhere_agree(db, users):
+    batched, single = users
+    events = _events(datetime.utcnow().replace(microsecond=0) - timedelta(hours=2))
+
+    log_events(db, batched.id, events[:4])
+    log_events(db, batched.id, events[4:])
+    log_events(db, single.id, events)
+
+    assert _snapshot(db, batched.id) == _snapshot(db, single.id)
@@ -0,0 +1,60 @@
+"""Research export: archived partitions of event tables are included unless asked otherwise."""
+from __future__ import annotations
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database import models
+from app.services import export, retention
+
+
+@pytest.fixture
+def user(db):
+    user = models.User(username="learner", password_hash="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def archived(db, user):
+    """Two user_activity rows moved to the archive, one left hot."""
+    now = datetime.utcnow()
+    old = [now - timedelta(days=200), now - timedelta(days=199)]
+    db.add_all(
+        models.UserActivity(user_id=user.id, activity_type="idle_detected", extra_data={"n": i}, created_at=at)
+        for i, at in enumerate([*old, now - timedelta(hours=1)])
+    )
+    db.commit()
+    assert retention.archive_batch("user_activity", now - timedelta(days=90)) == 2
+    yield old
+    for month in retention.archived_months("user_activity"):
+        part = retention.partition("user_activity", month)
+        with part.engine.begin() as conn:
+            conn.execute(part.table.delete())
+
+
+def _records(flt, chunk_size=2):
+    return [r for chunk in export.iter_records("user_activity", flt, chunk_size) for r in chunk]
+
+
+def test_export_reads_archived_partitions(user, archived):
+    records = _records(export.ExportFilter(user_id=user.id))
+    assert [r["extra_data.n"] for r in records] == [0, 1, 2]
+    assert "extra_data.n" in export.header("user_activity", export.ExportFilter(user_id=user.id))
+    assert export.skipped_archive("user_activity", export.ExportFilter(user_id=user.id)) == []
+
+
+def test_hot_only_export_names_skipped_months(user, archived):
+    flt = export.ExportFilter(user_id=user.id, include_archive=False)
+    assert [r["extra_data.n"] for r in _records(flt)] == [2]
+    assert export.skipped_archive("user_activity", flt) == sorted({at.strftime("%Y_%m") for at in archived})
+
+    recent = export.ExportFilter(user_id=user.id, since=datetime.utcnow() - timedelta(days=1), include_archive=False)
+    assert export.skipped_archive("user_activity", recent) == []
+
+
+def test_export_filters_apply_to_archive(user, archived):
+    flt = export.ExportFilter(user_id=user.id, until=archived[1], event_type="idle_detected")
+    assert [r["extra_data.n"] for r in _records(flt)] == [0]
+    assert _records(export.ExportFilter(user_id=user.id, event_type="focus_resumed")) == []
@@ -0,0 +1,15 @@
+"""Cold-start budget: scripts/check_import_time.py as part of the suite."""
+from __future__ import annotations
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def test_app_import_within_budget():
+    result = subprocess.run(
+        [sys.executable, str(BACKEND_DIR / "scripts" / "check_import_time.py"), "--runs", "3"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,169 @@
+"""LLM call guard: circuit breaker, overall deadline, retries, hedged attempts."""
+from __future__ import annotations
+import asyncio
+import time
+
+import pytest
+
+from app.services import llm_guard
+from app.services.llm_guard import CircuitBreaker, CircuitOpen, DeadlineExceeded, LLMUnavailable
+
+
+@pytest.fixture(autouse=True)
+def isolated_guard(monkeypatch):
+    monkeypatch.setattr(llm_guard, "breaker", CircuitBreaker(failures=3, reset_seconds=0.1))
+    monkeypatch.setattr(llm_guard, "_backoff", lambda retry: 0.01)
+
+
+class Flaky:
+    """attempt(timeout) stand-in: raises the queued errors in turn, then returns "ok"."""
+
+    def __init__(self, *errors: BaseException):
+        self.errors = list(errors)
+        self.timeouts: list[float] = []
+
+    def __call__(self, timeout: float) -> str:
+        self.timeouts.append(timeout)
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+    async def acall(self, timeout: float) -> str:
+        return self(timeout)
+
+
+# ─────────────────────────────
+# CIRCUIT BREAKER
+# ─────────────────────────────
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failures=2, reset_seconds=60)
+    breaker.failure()
+    breaker.success()  # resets the count
+    breaker.failure()
+    assert breaker.state == "closed"
+    breaker.failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failures=1, reset_seconds=0.05)
+    breaker.failure()
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    breaker.before_call()  # the probe
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+    breaker.failure()  # probe failed: open again for a full period
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+    breaker.before_call()
+
+
+def test_released_probe_frees_the_half_open_slot():
+    breaker = CircuitBreaker(failures=1, reset_seconds=0.05)
+    breaker.failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.release()  # e.g. the caller went away
+    breaker.before_call()
+
+
+def test_open_breaker_fails_fast_without_calling():
+    attempt = Flaky(TimeoutError(), TimeoutError(), TimeoutError())
+    with pytest.raises(LLMUnavailable):
+        llm_guard.call(attempt, "test", deadline=5, retries=2)
+    with pytest.raises(CircuitOpen):
+        llm_guard.call(attempt, "test", deadline=5, retries=2)
+    assert len(attempt.timeouts) == 3
+
+
+# ─────────────────────────────
+# RETRIES AND DEADLINE
+# ─────────────────────────────
+def test_transient_error_is_retried():
+    attempt = Flaky(TimeoutError(), TimeoutError())
+    assert llm_guard.call(attempt, "test", deadline=5, retries=2) == "ok"
+    assert len(attempt.timeouts) == 3
+    assert attempt.timeouts == sorted(attempt.timeouts, reverse=True)  # one shrinking budget
+    assert llm_guard.breaker.state == "closed"
+
+
+def test_non_transient_error_is_not_retried():
+    attempt = Flaky(ValueError("bad request"))
+    with pytest.raises(ValueError):
+        llm_guard.call(attempt, "test", deadline=5, retries=2)
+    assert len(attempt.timeouts) == 1
+
+
+def test_retries_exhausted_raise_unavailable():
+    attempt = Flaky(TimeoutError(), TimeoutError())
+    with pytest.raises(LLMUnavailable) as info:
+        llm_guard.call(attempt, "test", deadline=5, retries=1)
+    assert not isinstance(info.value, DeadlineExceeded)
+    assert isinstance(info.value.__cause__, TimeoutError)
+
+
+def test_async_deadline_cuts_a_hung_attempt():
+    async def hang(timeout):
+        await asyncio.sleep(3600)
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(llm_guard.acall(hang, "test", deadline=0.1, retries=3, hedge_after=0))
+    assert time.monotonic() - started < 1
+
+
+def test_async_transient_error_is_retried():
+    attempt = Flaky(TimeoutError())
+    assert asyncio.run(llm_guard.acall(attempt.acall, "test", deadline=5, retries=1, hedge_after=0)) == "ok"
+    assert len(attempt.timeouts) == 2
+
+
+# ─────────────────────────────
+# HEDGING
+# ─────────────────────────────
+def test_hedge_wins_over_a_slow_first_attempt():
+    calls = []
+
+    async def attempt(timeout):
+        calls.append(timeout)
+        await asyncio.sleep(3600 if len(calls) == 1 else 0.01)
+        return f"attempt {len(calls)}"
+
+    started = time.monotonic()
+    result = asyncio.run(llm_guard.acall(attempt, "test", deadline=5, retries=0, hedge_after=0.05))
+    assert result == "attempt 2"
+    assert time.monotonic() - started < 1
+    assert calls[1] < calls[0]  # the hedge gets what is left of the budget
+
+
+def test_fast_first_attempt_sends_no_hedge():
+    calls = []
+
+    async def attempt(timeout):
+        calls.append(timeout)
+        return "first"
+
+    assert asyncio.run(llm_guard.acall(attempt, "test", deadline=5, retries=0, hedge_after=0.05)) == "first"
+    assert len(calls) == 1
+
+
+def test_failed_hedge_waits_for_the_original():
+    calls = []
+
+    async def attempt(timeout):
+        calls.append(timeout)
+        if len(calls) == 2:
+            raise TimeoutError()
+        await asyncio.sleep(0.1)
+        return "original"
+
+    assert asyncio.run(llm_guard.acall(attempt, "test", deadline=5, retries=0, hedge_after=0.02)) == "original"
+    assert len(calls) == 2
@@ -0,0 +1,117 @@
+"""Single-flight: concurrent identical LLM requests share one execution."""
+from __future__ import annotations
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services.llm_limits import SingleFlight, ThreadSingleFlight
+
+
+# ─────────────────────────────
+# EVENT LOOP
+# ─────────────────────────────
+def test_concurrent_callers_share_one_execution():
+    flights = SingleFlight()
+    calls = []
+
+    async def generate(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return f"deck for {key}"
+
+    async def burst():
+        same = [flights.do("a", lambda: generate("a")) for _ in range(5)]
+        return await asyncio.gather(*same, flights.do("b", lambda: generate("b")))
+
+    assert asyncio.run(burst()) == ["deck for a"] * 5 + ["deck for b"]
+    assert sorted(calls) == ["a", "b"]
+
+
+def test_exception_is_shared_and_next_call_runs_again():
+    flights = SingleFlight()
+    calls = 0
+
+    async def fail():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider down")
+
+    async def run():
+        results = await asyncio.gather(*(flights.do("k", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        with pytest.raises(RuntimeError):
+            await flights.do("k", fail)
+
+    asyncio.run(run())
+    assert calls == 2
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    flights = SingleFlight()
+
+    async def generate():
+        await asyncio.sleep(0.05)
+        return "deck"
+
+    async def run():
+        leaver = asyncio.ensure_future(flights.do("k", generate))
+        stayer = asyncio.ensure_future(flights.do("k", generate))
+        await asyncio.sleep(0.01)
+        leaver.cancel()  # client disconnected
+        with pytest.raises(asyncio.CancelledError):
+            await leaver
+        return await stayer
+
+    assert asyncio.run(run()) == "deck"
+
+
+# ─────────────────────────────
+# THREADS
+# ─────────────────────────────
+def test_threads_share_one_execution():
+    flights = ThreadSingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = 0
+
+    def generate():
+        nonlocal calls
+        calls += 1
+        started.set()
+        release.wait(5)
+        return "deck"
+
+    with ThreadPoolExecutor(4) as pool:
+        leader = pool.submit(flights.do, "k", generate)
+        assert started.wait(5)
+        followers = [pool.submit(flights.do, "k", generate) for _ in range(3)]
+        time.sleep(0.05)  # let the followers reach the wait
+        release.set()
+        assert [f.result(5) for f in [leader, *followers]] == ["deck"] * 4
+    assert calls == 1
+    assert flights.do("k", lambda: "fresh") == "fresh"  # key forgotten once done
+
+
+def test_threads_share_the_exception():
+    flights = ThreadSingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("provider down")
+
+    with ThreadPoolExecutor(3) as pool:
+        leader = pool.submit(flights.do, "k", fail)
+        assert started.wait(5)
+        followers = [pool.submit(flights.do, "k", fail) for _ in range(2)]
+        time.sleep(0.05)  # let the followers reach the wait
+        release.set()
+        for future in [leader, *followers]:
+            with pytest.raises(RuntimeError):
+                future.result(5)
@@ -0,0 +1,122 @@
+"""Nudge effectiveness counters: one count per serve, refocus credit by event time, rebuild parity."""
+from __future__ import annotations
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app.database import models
+from app.services import nudge_effects, nudge_rotation
+from app.services.event_service import IncomingEvent, SystemEvent, log_events, log_system_events
+
+Nudge = models.Nudge
+
+
+@pytest.fixture
+def user(db):
+    user = models.User(username="learner", password_hash="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def deck(db, user):
+    nudges = [Nudge(user_id=user.id, type="positive", text=f"nudge {i}") for i in range(3)]
+    db.add_all(nudges)
+    db.commit()
+    return [n.id for n in nudges]
+
+
+def _counters(db, user_id):
+    db.expire_all()
+    return {
+        n.id: (n.shown_count, n.refocus_count, n.refocus_latency_sum)
+        for n in db.scalars(select(Nudge).where(Nudge.user_id == user_id))
+    }
+
+
+def _served_rollup(db, user_id):
+    return db.scalar(
+        select(func.sum(models.ActivityRollup.nudges_served))
+        .where(models.ActivityRollup.user_id == user_id, models.ActivityRollup.granularity == "day")
+    ) or 0
+
+
+def _client_report(db, user_id, nudge_id):
+    """What POST /events/nudge_shown does with the write-behind buffer off."""
+    if nudge_rotation.report_shown(db, user_id, nudge_id):
+        now = datetime.utcnow()
+        log_system_events(db, [SystemEvent(user_id, "nudge_shown", {"nudge_id": nudge_id}, now)])
+
+
+# ─────────────────────────────
+# ONE COUNT PER SERVE
+# ─────────────────────────────
+def test_client_report_of_served_nudge_is_not_counted_again(db, user, deck):
+    served = nudge_rotation.serve_next(db, user.id)
+    _client_report(db, user.id, served.id)
+    _client_report(db, user.id, served.id)  # client retry
+
+    assert _counters(db, user.id)[served.id][0] == 1
+    assert _served_rollup(db, user.id) == 1
+    assert db.scalar(select(func.count()).select_from(models.EventLog)) == 1
+
+
+def test_client_report_of_other_nudge_counts_and_moves_cursor(db, user, deck):
+    served = nudge_rotation.serve_next(db, user.id)
+    other = next(i for i in deck if i != served.id)
+    _client_report(db, user.id, other)
+
+    counters = _counters(db, user.id)
+    assert counters[served.id][0] == counters[other][0] == 1
+    assert _served_rollup(db, user.id) == 2
+    assert nudge_rotation._cursor(db, user.id) == other
+
+
+def test_client_report_of_foreign_nudge_is_rejected(db, user, deck):
+    stranger = models.User(username="stranger", password_hash="x")
+    db.add(stranger)
+    db.commit()
+    assert nudge_rotation.report_shown(db, stranger.id, deck[0]) is None
+
+
+# ─────────────────────────────
+# REFOCUS CREDIT
+# ─────────────────────────────
+def test_late_refocus_is_credited_to_nudge_served_at_event_time(db, user, deck):
+    first, second = deck[0], deck[1]
+    t0 = datetime.utcnow() - timedelta(minutes=10)
+    log_system_events(db, [
+        SystemEvent(user.id, "nudge_shown", {"nudge_id": first}, t0),
+        SystemEvent(user.id, "nudge_shown", {"nudge_id": second}, t0 + timedelta(minutes=5)),
+    ])
+    # The client's activity arrives after the second serve (buffered / offline)
+    log_events(db, user.id, [
+        IncomingEvent("nudge_shown", {}, t0),
+        IncomingEvent("focus_resumed", {}, t0 + timedelta(seconds=20)),
+    ])
+
+    live = _counters(db, user.id)
+    assert live[first] == (1, 1, 20.0)
+    assert live[second] == (1, 0, 0.0)
+
+    nudge_effects.rebuild(db, user.id)
+    assert _counters(db, user.id) == live
+
+
+def test_rebuild_matches_live_counters_after_serves_and_reports(db, user, deck):
+    for _ in range(4):
+        served = nudge_rotation.serve_next(db, user.id)
+        _client_report(db, user.id, served.id)
+        now = datetime.utcnow()
+        log_events(db, user.id, [
+            IncomingEvent("nudge_shown", {}, now),
+            IncomingEvent("focus_resumed", {}, now + timedelta(microseconds=1)),
+        ])
+    _client_report(db, user.id, deck[0])
+
+    live = _counters(db, user.id)
+    assert sum(shown for shown, _, _ in live.values()) == _served_rollup(db, user.id)
+    nudge_effects.rebuild(db, user.id)
+    assert _counters(db, user.id) == live
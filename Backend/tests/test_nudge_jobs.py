@@ -0,0 +1,179 @@
+"""Nudge job queue: dedupe, leases, retries, circuit-open deferral, watermark."""
+from __future__ import annotations
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app.config import NUDGE_JOB_RETRY_BASE_SECONDS, NUDGE_LOW_WATERMARK
+from app.database import models
+from app.services import nudge_jobs
+from app.services.llm_guard import CircuitOpen
+
+Job = models.NudgeJob
+
+
+@pytest.fixture
+def user(db):
+    user = models.User(username="learner", password_hash="x", english_goal="IELTS 7")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def _add_eft(db, user):
+    eft = models.EFTResponse(user_id=user.id, q1_why_goal_matters="study abroad", q3_possible_obstacles="phone")
+    db.add(eft)
+    db.commit()
+    return eft
+
+
+def _add_nudges(db, user, n):
+    db.add_all(models.Nudge(user_id=user.id, type="positive", text=f"nudge {i}") for i in range(n))
+    db.commit()
+
+
+def _job(db, job_id):
+    db.expire_all()
+    return db.get(Job, job_id)
+
+
+def _failing(exc):
+    def run_job(db, job):
+        raise exc
+    return run_job
+
+
+# ─────────────────────────────
+# ENQUEUE
+# ─────────────────────────────
+def test_enqueue_dedupes_active_jobs(db, user):
+    assert nudge_jobs.enqueue(db, user.id, "refill", "refill:1")
+    assert not nudge_jobs.enqueue(db, user.id, "refill", "refill:1")
+    assert db.query(Job).count() == 1
+
+
+def test_partial_unique_index_rejects_second_active_job(db, user):
+    nudge_jobs.enqueue(db, user.id, "refill", "refill:1")
+    db.add(Job(user_id=user.id, kind="refill", dedup_key="refill:1", status="pending"))
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
+
+
+def test_finished_job_does_not_block_a_new_one(db, user):
+    nudge_jobs.enqueue(db, user.id, "refill", "refill:1")
+    db.query(Job).update({"status": "done"})
+    db.commit()
+    assert nudge_jobs.enqueue(db, user.id, "refill", "refill:1")
+
+
+# ─────────────────────────────
+# LEASES
+# ─────────────────────────────
+def test_claim_leases_job_to_one_worker(db, user):
+    nudge_jobs.enqueue(db, user.id, "refill", "refill:1")
+    job_id = nudge_jobs.claim_next(db, "w1")
+    job = _job(db, job_id)
+    assert (job.status, job.lease_owner, job.attempts) == ("running", "w1", 1)
+    assert job.lease_until > datetime.utcnow()
+    assert nudge_jobs.claim_next(db, "w2") is None
+
+
+def test_expired_lease_can_be_reclaimed(db, user):
+    nudge_jobs.enqueue(db, user.id, "refill", "refill:1")
+    job_id = nudge_jobs.claim_next(db, "w1")
+    db.query(Job).update({"lease_until": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    assert nudge_jobs.claim_next(db, "w2") == job_id
+    assert _job(db, job_id).attempts == 2
+
+
+def test_late_finish_does_not_overwrite_reclaimed_job(db, user, monkeypatch):
+    nudge_jobs.enqueue(db, user.id, "refill", "refill:1")
+    job_id = nudge_jobs.claim_next(db, "w1")
+    db.query(Job).update({"lease_until": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    nudge_jobs.claim_next(db, "w2")
+
+    monkeypatch.setattr(nudge_jobs, "run_job", lambda db, job: 0)
+    nudge_jobs.process_job(job_id, "w1")  # w1 wakes up after losing the lease
+    job = _job(db, job_id)
+    assert (job.status, job.lease_owner) == ("running", "w2")
+
+
+# ─────────────────────────────
+# RETRY / BACKOFF / CIRCUIT
+# ─────────────────────────────
+def test_failure_retries_with_backoff_then_fails(db, user, monkeypatch):
+    monkeypatch.setattr(nudge_jobs, "run_job", _failing(ValueError("bad deck")))
+    nudge_jobs.enqueue(db, user.id, "refill", "refill:1")
+
+    job_id = nudge_jobs.claim_next(db, "w1")
+    before = datetime.utcnow()
+    nudge_jobs.process_job(job_id, "w1")
+    job = _job(db, job_id)
+    assert (job.status, job.lease_owner, job.last_error) == ("pending", None, "bad deck")
+    delay = (job.run_after - before).total_seconds()
+    assert NUDGE_JOB_RETRY_BASE_SECONDS - 1 <= delay <= NUDGE_JOB_RETRY_BASE_SECONDS + 1
+
+    # Second attempt backs off twice as long
+    db.query(Job).update({"run_after": datetime.utcnow()})
+    db.commit()
+    nudge_jobs.claim_next(db, "w1")
+    before = datetime.utcnow()
+    nudge_jobs.process_job(job_id, "w1")
+    delay = (_job(db, job_id).run_after - before).total_seconds()
+    assert 2 * NUDGE_JOB_RETRY_BASE_SECONDS - 1 <= delay <= 2 * NUDGE_JOB_RETRY_BASE_SECONDS + 1
+
+    db.query(Job).update({"run_after": datetime.utcnow(), "max_attempts": 3})
+    db.commit()
+    nudge_jobs.claim_next(db, "w1")
+    nudge_jobs.process_job(job_id, "w1")
+    job = _job(db, job_id)
+    assert (job.status, job.attempts) == ("failed", 3)
+
+
+def test_circuit_open_defers_without_spending_an_attempt(db, user, monkeypatch):
+    monkeypatch.setattr(nudge_jobs, "run_job", _failing(CircuitOpen(retry_after=30)))
+    nudge_jobs.enqueue(db, user.id, "refill", "refill:1")
+    job_id = nudge_jobs.claim_next(db, "w1")
+    before = datetime.utcnow()
+    nudge_jobs.process_job(job_id, "w1")
+    job = _job(db, job_id)
+    assert (job.status, job.attempts, job.lease_owner) == ("pending", 0, None)
+    assert 29 <= (job.run_after - before).total_seconds() <= 31
+
+
+# ─────────────────────────────
+# WATERMARK / FAKE LLM
+# ─────────────────────────────
+def test_no_refill_queued_at_or_above_watermark(db, user):
+    _add_nudges(db, user, NUDGE_LOW_WATERMARK)
+    assert not nudge_jobs.ensure_inventory(db, user.id)
+    assert db.query(Job).count() == 0
+
+
+def test_refill_queued_below_watermark(db, user):
+    _add_nudges(db, user, NUDGE_LOW_WATERMARK - 1)
+    assert nudge_jobs.ensure_inventory(db, user.id)
+    assert not nudge_jobs.ensure_inventory(db, user.id)  # already queued
+
+
+def test_refill_job_skips_generation_when_stock_refilled(db, user, monkeypatch):
+    _add_eft(db, user)
+    nudge_jobs.enqueue(db, user.id, "refill", "refill:1")
+    _add_nudges(db, user, NUDGE_LOW_WATERMARK)
+    monkeypatch.setattr(nudge_jobs, "generate_nudge_deck", _failing(AssertionError("LLM called")))
+    job = _job(db, nudge_jobs.claim_next(db, "w1"))
+    assert nudge_jobs.run_job(db, job) == 0
+
+
+def test_worker_generates_deck_with_fake_llm(db, user):
+    eft = _add_eft(db, user)
+    assert nudge_jobs.enqueue_eft_submit(db, user.id, eft.id)
+    assert nudge_jobs.work_once("w1")
+    assert not nudge_jobs.work_once("w1")  # queue drained
+    job = db.query(Job).one()
+    assert (job.status, job.lease_owner) == ("done", None)
+    assert db.query(models.Nudge).filter_by(user_id=user.id).count() > 0
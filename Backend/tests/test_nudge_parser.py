@@ -0,0 +1,65 @@
+"""Nudge deck parsing: fenced, bare, truncated and streaming replies."""
+from __future__ import annotations
+import json
+
+from app.services.nudge_parser import parse_nudge_deck, scan_complete_nudges, strip_fences, validate_nudges
+
+DECK = [
+    {"type": "positive", "message": "هدفت را تصور کن"},
+    {"type": "negative", "message": "اگر رها کنی پشیمان می‌شوی"},
+]
+REPLY = json.dumps({"user": "سارا", "nudges": DECK}, ensure_ascii=False)
+
+
+def test_fenced_reply():
+    assert strip_fences(f"```json\n{REPLY}\n```") == REPLY
+    assert parse_nudge_deck(f"```JSON\n{REPLY}\n```") == DECK
+    assert parse_nudge_deck(f"```\n{REPLY}```") == DECK
+
+
+def test_bare_array_reply():
+    assert parse_nudge_deck(json.dumps(DECK, ensure_ascii=False)) == DECK
+
+
+def test_truncated_reply_keeps_complete_objects():
+    cut = REPLY[:REPLY.index(DECK[1]["message"]) + 3]
+    assert parse_nudge_deck(cut) == DECK[:1]
+    assert parse_nudge_deck("```json\n" + cut) == DECK[:1]
+
+
+def test_scan_is_prefix_stable_while_streaming():
+    seen = []
+    for end in range(1, len(REPLY) + 1):
+        found = validate_nudges(scan_complete_nudges(REPLY[:end]))
+        assert found[:len(seen)] == seen
+        seen = found
+    assert seen == DECK
+
+
+def test_scan_ignores_text_before_the_nudges_key():
+    text = '{"user": "{not a nudge}", "nudges": [' + json.dumps(DECK[0], ensure_ascii=False) + ', {"type": "pos'
+    assert scan_complete_nudges(text) == [DECK[0]]
+
+
+def test_validation_drops_bad_items_and_duplicates():
+    items = [
+        DECK[0],
+        {"type": "NEGATIVE", "message": "  فردا دیر است  "},
+        {"type": "odd", "message": "نوع ناشناخته"},
+        {"type": "positive", "message": "   "},
+        {"type": "positive"},
+        "not a dict",
+        dict(DECK[0]),
+    ]
+    assert validate_nudges(items) == [
+        DECK[0],
+        {"type": "negative", "message": "فردا دیر است"},
+        {"type": "positive", "message": "نوع ناشناخته"},
+    ]
+
+
+def test_plain_text_and_empty_replies():
+    assert parse_nudge_deck("امروز فقط ده دقیقه.") == [{"type": "positive", "message": "امروز فقط ده دقیقه."}]
+    assert parse_nudge_deck("") == []
+    assert parse_nudge_deck("```json\n```") == []
+    assert parse_nudge_deck('{"nudges": null}') == []
@@ -0,0 +1,107 @@
+"""Per-user nudge rotation: round-robin order, wrap-around, compare-and-swap cursor."""
+from __future__ import annotations
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from app.database import models
+from app.services import nudge_rotation
+from app.services.event_service import SystemEvent, log_system_events
+
+Nudge = models.Nudge
+
+
+@pytest.fixture
+def user(db):
+    user = models.User(username="learner", password_hash="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def deck(db, user):
+    nudges = [Nudge(user_id=user.id, type="positive", text=f"nudge {i}") for i in range(3)]
+    db.add_all(nudges)
+    db.commit()
+    return [n.id for n in nudges]
+
+
+def _served_count(db, user_id):
+    db.expire_all()
+    return db.scalar(select(models.NudgeRotation.served_count).where(models.NudgeRotation.user_id == user_id))
+
+
+# ─────────────────────────────
+# ORDER AND WRAP-AROUND
+# ─────────────────────────────
+def test_serves_in_id_order_and_wraps_around(db, user, deck):
+    served = [nudge_rotation.serve_next(db, user.id).id for _ in range(7)]
+    assert served == deck + deck + deck[:1]
+    assert _served_count(db, user.id) == 7
+
+
+def test_new_nudge_joins_the_rotation_before_wrapping(db, user, deck):
+    nudge_rotation.serve_next(db, user.id)
+    nudge_rotation.serve_next(db, user.id)
+    added = Nudge(user_id=user.id, type="negative", text="late addition")
+    db.add(added)
+    db.commit()
+    served = [nudge_rotation.serve_next(db, user.id).id for _ in range(3)]
+    assert served == [deck[2], added.id, deck[0]]
+
+
+def test_user_without_nudges_gets_none(db, user):
+    assert nudge_rotation.serve_next(db, user.id) is None
+    assert nudge_rotation._cursor(db, user.id) is None
+
+
+def test_first_serve_continues_after_last_logged_nudge(db, user, deck):
+    log_system_events(db, [SystemEvent(user.id, "nudge_shown", {"nudge_id": deck[1]}, datetime.utcnow())])
+    assert nudge_rotation.serve_next(db, user.id).id == deck[2]
+
+
+# ─────────────────────────────
+# COMPARE-AND-SWAP
+# ─────────────────────────────
+def test_stale_cursor_loses_the_swap_and_retries(db, user, deck, monkeypatch):
+    nudge_rotation.serve_next(db, user.id)  # cursor -> deck[0]
+    real_cursor = nudge_rotation._cursor
+    reads = []
+
+    def cursor(db, user_id):
+        reads.append(real_cursor(db, user_id))
+        if len(reads) == 1:
+            # Another request moved the cursor between our read and our swap
+            db.execute(
+                models.NudgeRotation.__table__.update()
+                .where(models.NudgeRotation.user_id == user_id)
+                .values(cursor_nudge_id=deck[1])
+            )
+        return reads[-1]
+
+    monkeypatch.setattr(nudge_rotation, "_cursor", cursor)
+    row = nudge_rotation.advance(db, user.id)
+    db.commit()
+
+    assert reads == [deck[0], deck[1]]
+    assert row.id == deck[2]  # continued from the winner's cursor, not the stale one
+    assert real_cursor(db, user.id) == deck[2]
+    assert _served_count(db, user.id) == 2
+
+
+def test_concurrent_first_serve_falls_back_to_the_swap(db, user, deck, monkeypatch):
+    real_create = nudge_rotation._create
+
+    def create(db, user_id, nudge_id):
+        real_create(db, user_id, nudge_id)  # the other request's row
+        return real_create(db, user_id, nudge_id)
+
+    monkeypatch.setattr(nudge_rotation, "_create", create)
+    row = nudge_rotation.advance(db, user.id)
+    db.commit()
+
+    assert row.id == deck[1]
+    assert nudge_rotation._cursor(db, user.id) == deck[1]
+    assert _served_count(db, user.id) == 2
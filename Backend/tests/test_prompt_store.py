@@ -0,0 +1,68 @@
+"""Prompt storage: legacy ai_prompts rows survive migration with their exact messages."""
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import text
+
+from app.database import models
+from app.services import prompt_store
+from app.services.prompt_compiler import EFT_NUDGE
+
+USER_BLOCK = prompt_store.USER_BLOCK_PREFIX + " سارا\nهدف: IELTS 7\n" + "چرا مهم است: " + " ".join(["ادامه تحصیل"] * 40)
+REPLY = '{"nudges": [{"type": "positive", "message": "' + "ادامه بده " * 60 + '"}]}'
+
+SYSTEM = {"role": "system", "content": EFT_NUDGE.system}
+LEGACY_CASES = {
+    # stored prompt_text → messages that were sent
+    EFT_NUDGE.system + "\n\n" + USER_BLOCK: [SYSTEM, {"role": "user", "content": USER_BLOCK}],
+    USER_BLOCK: [SYSTEM, {"role": "user", "content": USER_BLOCK}],
+    "Write one motivating sentence for Sara.": [{"role": "user", "content": "Write one motivating sentence for Sara."}],
+}
+
+
+@pytest.fixture(autouse=True)
+def fresh_template_registry(monkeypatch):
+    monkeypatch.setattr(prompt_store, "_known_templates", set())  # tables are emptied per test
+
+
+@pytest.fixture
+def user(db):
+    user = models.User(username="learner", password_hash="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def _insert_legacy(db, user_id, prompt_text, response):
+    """A row as older builds wrote it: plain text, no template reference."""
+    return db.execute(
+        text("INSERT INTO ai_prompts (user_id, model_name, prompt_text, purpose, response_preview, created_at) "
+             "VALUES (:u, 'gpt-4o-mini', :p, 'nudge_generation', :r, CURRENT_TIMESTAMP) RETURNING id"),
+        {"u": user_id, "p": prompt_text, "r": response},
+    ).scalar_one()
+
+
+def test_legacy_rows_rebuild_to_original_messages(db, user):
+    ids = {_insert_legacy(db, user.id, stored, REPLY): stored for stored in LEGACY_CASES}
+    db.commit()
+
+    assert prompt_store.migrate_legacy_prompts(db, batch_size=2) == len(LEGACY_CASES)
+    assert prompt_store.migrate_legacy_prompts(db) == 0  # idempotent
+
+    db.expire_all()
+    for prompt_id, stored in ids.items():
+        prompt = db.get(models.AIPrompt, prompt_id)
+        assert prompt_store.rebuild_prompt(db, prompt) == LEGACY_CASES[stored]
+        assert prompt.response_preview == REPLY
+
+
+def test_migrated_rows_are_stored_compressed(db, user):
+    prompt_id = _insert_legacy(db, user.id, USER_BLOCK, REPLY)
+    db.commit()
+    prompt_store.migrate_legacy_prompts(db)
+
+    stored_prompt, stored_reply = db.execute(
+        text("SELECT prompt_text, response_preview FROM ai_prompts WHERE id = :id"), {"id": prompt_id}
+    ).one()
+    assert isinstance(stored_prompt, bytes) and stored_prompt[:1] == b"\x01"
+    assert len(stored_reply) < len(REPLY.encode("utf-8"))
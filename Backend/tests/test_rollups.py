@@ -0,0 +1,71 @@
+"""Activity rollups: backfill from history reproduces the incremental counters."""
+from __future__ import annotations
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database import models
+from app.services import rollups
+from app.services.event_service import IncomingEvent, SystemEvent, log_events, log_system_events
+
+
+@pytest.fixture
+def user(db):
+    user = models.User(username="learner", password_hash="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def _snapshot(db, user_id):
+    db.expire_all()
+    return {
+        (g, row.bucket_start): {c: getattr(row, c) for c in rollups.COUNTER_COLUMNS}
+        for g in rollups.GRANULARITIES
+        for row in rollups.time_series(db, user_id, g)
+    }
+
+
+def _history(db, user, t0):
+    """Two calls to log_events spanning an hour boundary, plus served nudges."""
+    log_events(db, user.id, [
+        IncomingEvent("session_start", {}, t0),
+        IncomingEvent("focus_resumed", {}, t0 + timedelta(minutes=1)),
+        IncomingEvent("idle_detected", {}, t0 + timedelta(minutes=20)),
+        IncomingEvent("nudge_shown", {}, t0 + timedelta(minutes=21)),
+    ])
+    log_events(db, user.id, [
+        IncomingEvent("focus_resumed", {}, t0 + timedelta(minutes=21, seconds=30)),
+        IncomingEvent("idle_detected", {}, t0 + timedelta(minutes=70)),
+        IncomingEvent("session_feedback", {"rating": 4}, t0 + timedelta(minutes=75)),
+        IncomingEvent("session_end", {}, t0 + timedelta(minutes=76)),
+    ])
+    log_system_events(db, [
+        SystemEvent(user.id, "nudge_shown", {}, t0 + timedelta(minutes=21)),
+        SystemEvent(user.id, "nudge_shown", {}, t0 + timedelta(minutes=65)),
+    ])
+
+
+def test_backfill_matches_incremental(db, user):
+    t0 = datetime.utcnow().replace(minute=30, second=0, microsecond=0) - timedelta(hours=6)
+    _history(db, user, t0)
+    incremental = _snapshot(db, user.id)
+    assert sum(b["events"] for (g, _), b in incremental.items() if g == "day") == 8
+
+    assert rollups.backfill(db, user.id) == 10
+    assert _snapshot(db, user.id) == incremental
+
+
+def test_backfill_replaces_drifted_buckets(db, user):
+    t0 = datetime.utcnow().replace(minute=30, second=0, microsecond=0) - timedelta(hours=6)
+    _history(db, user, t0)
+    incremental = _snapshot(db, user.id)
+
+    stray = rollups.RollupBatch()
+    stray.add(t0, events=100)
+    stray.add(t0 - timedelta(days=3), idle_count=1)
+    rollups.apply_rollups(db, user.id, stray)
+    db.commit()
+
+    rollups.backfill(db, user.id, chunk_size=3)
+    assert _snapshot(db, user.id) == incremental
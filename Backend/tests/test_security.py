@@ -0,0 +1,77 @@
+"""Identity cache invalidation on user changes: never blocks the event loop."""
+from __future__ import annotations
+import asyncio
+import threading
+
+import pytest
+
+from app.database import models
+from app.database.db_setup import AsyncSessionLocal, SessionLocal, async_engine
+from app.services import security
+from app.services.cache import Cache, MemoryBackend
+
+
+class BlockingBackend(MemoryBackend):
+    """A backend that does I/O (like sqlite / redis): records the thread of each counter bump."""
+
+    blocking = True
+
+    def __init__(self):
+        super().__init__()
+        self.incr_threads: list[int] = []
+
+    def incr(self, key: str) -> int:
+        self.incr_threads.append(threading.get_ident())
+        return super().incr(key)
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = BlockingBackend()
+    monkeypatch.setattr(security, "cache", Cache(backend, version_ttl=0))
+    return backend
+
+
+@pytest.fixture
+def user(db):
+    user = models.User(username="learner", password_hash="x", full_name_fa="سارا")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def _version(user_id):
+    return security.cache.version(security._identity_namespace(user_id))
+
+
+def test_async_commit_invalidates_off_the_event_loop(backend, user):
+    async def rename():
+        try:
+            async with AsyncSessionLocal() as session:
+                row = await session.get(models.User, user.id)
+                row.full_name_fa = "سارا رضایی"
+                await session.commit()
+                await asyncio.gather(*security._pending_invalidations)
+        finally:
+            await async_engine.dispose()  # its connection threads would outlive asyncio.run
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(rename())
+    assert len(backend.incr_threads) == 1 and backend.incr_threads[0] != loop_thread
+    assert _version(user.id) == 1
+
+
+def test_sync_commit_invalidates_inline(backend, user):
+    with SessionLocal() as session:
+        session.get(models.User, user.id).english_goal = "IELTS 7.5"
+        session.commit()
+    assert backend.incr_threads == [threading.get_ident()]
+    assert _version(user.id) == 1
+
+
+def test_rolled_back_change_is_not_invalidated(backend, user):
+    with SessionLocal() as session:
+        session.get(models.User, user.id).english_goal = "IELTS 8"
+        session.flush()
+        session.rollback()
+    assert backend.incr_threads == []